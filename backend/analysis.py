@@ -0,0 +1,336 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from queue import Queue
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, load_backend
+from inference import is_shoplifting_confidence, normalize_frames
+
+logger = logging.getLogger(__name__)
+
+FRAME_SIZE = (64, 64)
+ENCODE_CHUNK_FRAMES = 256
+
+
+def probe_video(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+    return (fps if fps and fps > 0 else 30.0), max(0, frame_count)
+
+
+def plan_segments(frame_count, segment_frames, stride):
+    # Segments are aligned to the window stride so every window start belongs to
+    # exactly one segment. The last segment is open-ended because container frame
+    # counts are only an estimate.
+    if frame_count <= 0:
+        return [(0, None)]
+    segment_frames = max(stride, segment_frames - segment_frames % stride)
+    segments = []
+    start = 0
+    while start < frame_count:
+        stop = start + segment_frames
+        segments.append((start, stop if stop < frame_count else None))
+        start = stop
+    return segments
+
+
+def _init_decoder():
+    # One decode per process; OpenCV's own thread pool would only oversubscribe the CPU
+    cv2.setNumThreads(1)
+
+
+def decode_segment(path, start, stop, overlap):
+    # Runs in a pool process. Returns the segment's frames downscaled to the model's
+    # input size as uint8 (4x less to pickle than float32), plus the overlap frames
+    # needed to complete windows that start near the end of the segment.
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        limit = None if stop is None else stop - start + overlap
+        frames = []
+        while limit is None or len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(frame, FRAME_SIZE))
+    finally:
+        cap.release()
+    if not frames:
+        return start, np.empty((0,) + FRAME_SIZE + (3,), dtype=np.uint8)
+    return start, np.stack(frames)
+
+
+def score_segment(frames, start, stop, encode_fn, head_fn, sequence_length, stride, batch_size):
+    # Every frame is encoded once; overlapping windows then only run the temporal head.
+    # Returns [(start_frame, confidence)] for the windows starting in [start, stop).
+    if len(frames) < sequence_length:
+        return []
+    # Copied per chunk: an identity encoder hands back the reused normalization buffer itself
+    normalized = np.empty((min(len(frames), ENCODE_CHUNK_FRAMES),) + frames.shape[1:], dtype=np.float32)
+    features = np.concatenate([encode_fn(normalize_frames([frames[i:i + ENCODE_CHUNK_FRAMES]], normalized)).copy()
+                               for i in range(0, len(frames), ENCODE_CHUNK_FRAMES)])
+    first = -start % stride
+    last = len(frames) - sequence_length
+    if stop is not None:
+        last = min(last, stop - start - 1)
+    offsets = list(range(first, last + 1, stride))
+    results = []
+    for i in range(0, len(offsets), batch_size):
+        chunk = offsets[i:i + batch_size]
+        windows = np.stack([features[offset:offset + sequence_length] for offset in chunk])
+        results.extend(zip((start + offset for offset in chunk), head_fn(windows)))
+    return results
+
+
+def find_incidents(timeline, is_shoplifting, window_seconds, merge_gap):
+    # Consecutive positive windows (allowing gaps up to merge_gap seconds) become one incident
+    incidents = []
+    current = None
+    for entry in timeline:
+        if not is_shoplifting(entry['confidence']):
+            continue
+        end_time = entry['time'] + window_seconds
+        if current is not None and entry['time'] - current['end_time'] <= merge_gap:
+            current['end_time'] = max(current['end_time'], end_time)
+            current['windows'] += 1
+            current['min_confidence'] = min(current['min_confidence'], entry['confidence'])
+        else:
+            current = {'start_time': entry['time'], 'end_time': end_time, 'windows': 1,
+                       'min_confidence': entry['confidence']}
+            incidents.append(current)
+    for incident in incidents:
+        incident['start_time'] = round(incident['start_time'], 3)
+        incident['end_time'] = round(incident['end_time'], 3)
+    return incidents
+
+
+def analyze_video(path, encode_fn, head_fn, sequence_length, is_shoplifting, stride=None, segment_seconds=30.0,
+                  workers=None, batch_size=32, merge_gap=None, progress=None):
+    # Decodes the file as fast as the CPU allows: segments are decoded in a process
+    # pool while this process batches the finished ones through the model. At most
+    # two segments per worker are in flight so decoded frames cannot pile up.
+    started = time.monotonic()
+    stride = max(1, min(int(stride or sequence_length // 2), sequence_length))
+    fps, frame_count = probe_video(path)
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    segments = plan_segments(frame_count, int(segment_seconds * fps), stride)
+    window_seconds = sequence_length / fps
+    merge_gap = window_seconds if merge_gap is None else merge_gap
+
+    scored = []
+    frames_decoded = 0
+    decode_done = 0
+    # spawn: the parent holds the model runtime's threads, which fork does not survive safely
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_decoder) as pool:
+        pending = {}
+        remaining = list(segments)
+        while remaining or pending:
+            while remaining and len(pending) < workers * 2:
+                start, stop = remaining.pop(0)
+                pending[pool.submit(decode_segment, path, start, stop, sequence_length - 1)] = stop
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stop = pending.pop(future)
+                start, frames = future.result()
+                frames_decoded += len(frames)
+                scored.extend(score_segment(frames, start, stop, encode_fn, head_fn, sequence_length, stride, batch_size))
+                decode_done += 1
+                if progress:
+                    progress(decode_done, len(segments))
+
+    scored.sort()
+    timeline = [{'frame': frame, 'time': round(frame / fps, 3), 'confidence': round(float(confidence), 4),
+                 'shoplifting': bool(is_shoplifting(confidence))} for frame, confidence in scored]
+    elapsed = time.monotonic() - started
+    video_frames = scored[-1][0] + sequence_length if scored else 0
+    return {
+        'video': os.path.basename(path),
+        'fps': round(fps, 3),
+        'duration': round(video_frames / fps, 3),
+        'sequence_length': sequence_length,
+        'stride': stride,
+        'timeline': timeline,
+        'incidents': find_incidents(timeline, is_shoplifting, window_seconds, merge_gap),
+        'stats': {
+            'segments': len(segments),
+            'workers': workers,
+            'frames_decoded': frames_decoded,
+            'windows': len(timeline),
+            'elapsed_seconds': round(elapsed, 3),
+            'speedup': round(video_frames / fps / elapsed, 2) if elapsed > 0 else None,
+        },
+    }
+
+
+class AnalysisJob:
+    def __init__(self, job_id, video_path, result_path):
+        self.job_id = job_id
+        self.video_path = video_path
+        self.result_path = result_path
+        self.state = 'queued'
+        self.segments_done = 0
+        self.segments_total = 0
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def to_event(self):
+        return {
+            'job_id': self.job_id,
+            'video': os.path.basename(self.video_path),
+            'state': self.state,
+            'segments_done': self.segments_done,
+            'segments_total': self.segments_total,
+            'error': self.error,
+        }
+
+    def result(self):
+        if self.state != 'completed':
+            return None
+        with open(self.result_path) as f:
+            return json.load(f)
+
+
+class AnalysisRunner:
+    # Runs the CLI below in a child process per job. The live server keeps its own
+    # model and threads untouched, and the analysis process is free to start a
+    # spawn-based decode pool without re-importing the server module.
+    def __init__(self, emit, output_dir, workers=None, segment_seconds=30.0, stride=None, backend='keras',
+                 model_path=None, concurrency=1):
+        self.emit = emit
+        self.output_dir = output_dir
+        self.workers = workers
+        self.segment_seconds = segment_seconds
+        self.stride = stride
+        self.backend = backend
+        self.model_path = model_path
+        self.concurrency = max(1, int(concurrency))
+        self.jobs = {}
+        self.queue = Queue()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"analysis-runner-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, video_path):
+        job_id = uuid.uuid4().hex[:12]
+        job = AnalysisJob(job_id, video_path, os.path.join(self.output_dir, f"analysis_{job_id}.json"))
+        self.jobs[job_id] = job
+        self.queue.put(job)
+        self.emit('analysis_progress', job.to_event())
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _command(self, job):
+        command = [sys.executable, os.path.abspath(__file__), job.video_path, '--output', job.result_path,
+                   '--segment-seconds', str(self.segment_seconds), '--backend', self.backend, '--progress']
+        if self.workers:
+            command += ['--workers', str(self.workers)]
+        if self.stride:
+            command += ['--stride', str(self.stride)]
+        if self.model_path:
+            command += ['--model', self.model_path]
+        return command
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            job.state = 'running'
+            self.emit('analysis_progress', job.to_event())
+            try:
+                process = subprocess.Popen(self._command(job), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                stderr = []
+                drain = threading.Thread(target=lambda: stderr.extend(process.stderr), daemon=True)
+                drain.start()
+                for line in process.stdout:
+                    try:
+                        update = json.loads(line)
+                    except ValueError:
+                        continue
+                    job.segments_done = update.get('segments_done', job.segments_done)
+                    job.segments_total = update.get('segments_total', job.segments_total)
+                    self.emit('analysis_progress', job.to_event())
+                returncode = process.wait()
+                drain.join()
+                if returncode != 0:
+                    raise RuntimeError(stderr[-1].strip() if stderr else f"exit code {returncode}")
+                job.state = 'completed'
+                summary = job.result()
+                self.emit('analysis_completed', dict(job.to_event(), incidents=summary['incidents'], stats=summary['stats']))
+                logger.info(f"Analysis {job.job_id} of {job.video_path} finished: {len(summary['incidents'])} incident(s)")
+            except Exception as e:
+                job.state = 'failed'
+                job.error = str(e)
+                logger.error(f"Analysis {job.job_id} of {job.video_path} failed: {e}")
+                self.emit('analysis_progress', job.to_event())
+            finally:
+                job.finished_at = time.time()
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a video file for shoplifting as fast as the CPU allows.")
+    parser.add_argument('video', help="Path to the video file")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='keras', help="Inference backend")
+    parser.add_argument('--model', default=None, help="Keras model file or tflite/onnx export prefix")
+    parser.add_argument('--workers', type=int, default=None, help="Decode processes (default: CPU count)")
+    parser.add_argument('--segment-seconds', type=float, default=30.0, help="Length of each decoded segment")
+    parser.add_argument('--stride', type=int, default=None, help="Frames between window starts (default: half a window)")
+    parser.add_argument('--batch-size', type=int, default=32, help="Windows per temporal-head batch")
+    parser.add_argument('--output', help="Write the JSON result here instead of stdout")
+    parser.add_argument('--progress', action='store_true', help="Print one JSON progress line per segment on stdout")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    model = load_backend(args.backend, args.model)
+
+    def report(done, total):
+        if args.progress:
+            print(json.dumps({'segments_done': done, 'segments_total': total}), flush=True)
+
+    result = analyze_video(args.video, model.encode, model.head, model.input_shape[1], is_shoplifting_confidence,
+                           stride=args.stride, segment_seconds=args.segment_seconds, workers=args.workers,
+                           batch_size=args.batch_size, progress=report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    logger.info(f"Analyzed {result['duration']}s of video in {result['stats']['elapsed_seconds']}s: "
+                f"{len(result['incidents'])} incident(s)")
+
+
+if __name__ == '__main__':
+    main()
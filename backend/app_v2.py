@@ -1,31 +1,36 @@
-from flask import Flask, render_template, request, send_from_directory, jsonify
+from flask import Flask, render_template, request, send_from_directory, jsonify, Response
 from flask_socketio import SocketIO
 from flask_cors import CORS
 import cv2
 import threading
-import base64
 import time
 import numpy as np
-from keras.models import load_model
-from queue import Queue
 import logging
 import os
-import sqlite3
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
+from ingestion import IngestionManager, DEFAULT_STREAM, camera_stream_id
+from inference import BatchInferenceScheduler, DetectionQueue, is_shoplifting_confidence
+from backends import load_backend, default_model_path, warm_up
+from inference_pool import InferenceProcessPool
+from viewers import ViewerRegistry
+from analysis import AnalysisRunner
+import metrics
+from clip_writer import ClipJob, ClipWriterPool
+from dvr import SegmentStore
+from database import Database
+from settings_service import SettingsService
+from notifications import NotificationOutbox, SmtpMailer, SmsSender, twilio_client_factory
+from startup import StartupTracker
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The server binds right away; the model is loaded and warmed up in the background (see load_model_in_background)
+startup = StartupTracker()
+
 # Initialize Flask without static_folder initially
 app = Flask(__name__)
 
@@ -52,75 +57,102 @@ load_dotenv(os.path.join(os.path.dirname(__file__), 'config', '.env'))
 ENVIRONMENT = os.getenv('FLASK_ENV', 'production')
 IS_DEVELOPMENT = ENVIRONMENT == 'development'
 
-# Load the pre-trained model
-try:
-    model = load_model(os.path.join(os.path.dirname(__file__), 'models', 'LRCN_model___Date_Time_2025_01_28__21_19_11___Loss_0.5761117339134216___Accuracy_0.739130437374115.h5'))
-    logger.info("Model loaded successfully.")
-except Exception as e:
-    logger.error(f"Failed to load model: {e}")
-    exit(1)
+# Pre-trained model backend: 'keras' (the .h5 file) or 'tflite' / 'onnx' (an export prefix written by convert_model.py).
+# Loaded in the background after the server starts; model and inference_scheduler stay None until then.
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+MODEL_PATH = os.getenv('MODEL_PATH') or default_model_path(INFERENCE_BACKEND)
+# Inference processes fed through shared memory (several per box are fine); 0 runs the model on a thread in this process
+INFERENCE_PROCESSES = int(os.getenv('INFERENCE_PROCESSES', 1))
+model = None
+inference_scheduler = None
 
 # Model and video settings
 SEQUENCE_LENGTH = 20
+# Fallback for sources that do not report their native FPS; each capture worker paces to its source's rate
 FRAME_RATE = 30
-
-# Validate model input shape
-expected_shape = (None, SEQUENCE_LENGTH, 64, 64, 3)
-if model.input_shape != expected_shape:
-    logger.error(f"Model input shape mismatch. Expected {expected_shape}, got {model.input_shape}")
-    exit(1)
-else:
-    logger.info("Model input shape is correct.")
+EXPECTED_INPUT_SHAPE = (None, SEQUENCE_LENGTH, 64, 64, 3)
 
 # Global variables
-detection_queue = Queue()
-detection_lock = threading.Lock()
-detection_frame_count = 0
 current_source = 'webcam'
 current_camera_id = None
 uploaded_video_path = None
-frame_buffer = []
-latest_frame = None
+WEBCAM_INDEX = int(os.getenv('WEBCAM_INDEX', 0))
+DETECTION_OVERLAY_FRAMES = 20
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 50))
+DETECTION_WINDOW_STRIDE = int(os.getenv('DETECTION_WINDOW_STRIDE', SEQUENCE_LENGTH // 2))
+PREROLL_MEMORY_BUDGET_MB = int(os.getenv('PREROLL_MEMORY_BUDGET_MB', 512))
+# 'jpeg' keeps the stream's encoded frames (roughly 10-20x smaller than raw BGR), 'raw' keeps uncompressed frames,
+# 'dvr' records them continuously to disk segments instead, so clips can be cut from any span still on disk
+PREROLL_MODE = os.getenv('PREROLL_MODE', 'jpeg').lower()
+# DVR recordings: segment length, and the total size and age kept (oldest segments are removed first)
+DVR_ROOT = os.getenv('DVR_ROOT') or os.path.join(os.path.dirname(__file__), 'recordings')
+DVR_SEGMENT_SECONDS = float(os.getenv('DVR_SEGMENT_SECONDS', 10))
+DVR_MAX_GB = float(os.getenv('DVR_MAX_GB', 20))
+DVR_MAX_AGE_HOURS = float(os.getenv('DVR_MAX_AGE_HOURS', 24))
+DVR_MAX_CLIP_SECONDS = float(os.getenv('DVR_MAX_CLIP_SECONDS', 3600))
+CLIP_POST_ROLL_SECONDS = float(os.getenv('CLIP_POST_ROLL_SECONDS', 3))
+CLIP_WRITER_WORKERS = int(os.getenv('CLIP_WRITER_WORKERS', 2))
+# Resize filter for the 64x64 model input: 'linear' (as trained) or 'area' (less aliasing from HD sources)
+PREPROCESS_INTERPOLATION = os.getenv('PREPROCESS_INTERPOLATION', 'linear').lower()
+# 'binary' sends raw JPEG bytes with a small header as 'frame_bin'; 'base64' keeps the JSON 'frame' event
+FRAME_TRANSPORT = os.getenv('FRAME_TRANSPORT', 'binary').lower()
+# 'thread' drains each device on a grab thread and processes only the newest frame; 'inline' reads in the processing loop
+CAPTURE_MODE = os.getenv('CAPTURE_MODE', 'thread').lower()
+# Threads JPEG-encoding preview frames for all streams (0 encodes on each capture thread)
+ENCODE_WORKERS = int(os.getenv('ENCODE_WORKERS', 2))
+# Offline analysis of uploaded files: decode processes per job (0 = CPU count) and seconds per decoded segment
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', 0))
+ANALYSIS_SEGMENT_SECONDS = float(os.getenv('ANALYSIS_SEGMENT_SECONDS', 30))
+# Bounded detection queue: chunks beyond capacity are handled by the overflow policy
+# ('drop_oldest', 'drop_newest' or 'coalesce'); chunks older than the max age are skipped
+DETECTION_QUEUE_CAPACITY = int(os.getenv('DETECTION_QUEUE_CAPACITY', 32))
+DETECTION_QUEUE_POLICY = os.getenv('DETECTION_QUEUE_POLICY', 'drop_oldest').lower()
+DETECTION_MAX_AGE_SECONDS = float(os.getenv('DETECTION_MAX_AGE_SECONDS', 2.0))
+# Motion gate: chunks where less than this fraction of the 64x64 pixels changed are not run through
+# the model (0, the default, disables it; e.g. 0.01 skips static scenes); after activity the gate stays open for the hold time
+MOTION_GATE_THRESHOLD = float(os.getenv('MOTION_GATE_THRESHOLD', 0))
+MOTION_GATE_HOLD_SECONDS = float(os.getenv('MOTION_GATE_HOLD_SECONDS', 2.0))
+last_alert_times = {}
+
+detection_queue = DetectionQueue(DETECTION_QUEUE_CAPACITY, DETECTION_QUEUE_POLICY, window_length=SEQUENCE_LENGTH)
+metrics.track_queue(detection_queue)
+
+startup.mark('config')
+
+# Database functions: a bounded pool of WAL connections, db.transaction() for units of work
+db = Database(DB_PATH, busy_timeout_ms=int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000)), observe=metrics.observe_db,
+              max_connections=int(os.getenv('DB_MAX_CONNECTIONS', 8)))
 
-# Database functions
 def db_execute(query, params=()):
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-            return cursor.lastrowid if 'INSERT' in query.upper() else None
+        return db.execute(query, params)
     except Exception as e:
         logger.error(f"Database execute error: {e}")
         raise
 
 def db_fetch(query, params=()):
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.fetchall()
+        return db.fetch(query, params)
     except Exception as e:
         logger.error(f"Database fetch error: {e}")
         raise
 
-# Load settings from database
-def get_settings():
-    settings = db_fetch("SELECT * FROM Settings WHERE setting_id=1")
-    if not settings:
-        db_execute("INSERT INTO Settings (setting_id, email_enabled, sms_enabled, clip_capture_enabled, clip_duration_seconds, cooldown_seconds, logging_enabled) VALUES (1, 0, 0, 0, 6.0, 60, 1)")
-        settings = db_fetch("SELECT * FROM Settings WHERE setting_id=1")
-    return settings[0]
-
-settings = get_settings()
-enable_clip_capture = bool(settings['clip_capture_enabled'])
-enable_email_notifications = bool(settings['email_enabled'])
-enable_sms_notifications = bool(settings['sms_enabled'])
-CLIP_DURATION = float(settings['clip_duration_seconds'])
-NOTIFICATION_COOLDOWN = int(settings['cooldown_seconds'])
-enable_logging = bool(settings['logging_enabled'])
-MAX_BUFFER_SIZE = int(CLIP_DURATION * FRAME_RATE)
+# Cameras created before multi-camera ingestion have no source_uri column
+def ensure_camera_schema():
+    columns = [row['name'] for row in db_fetch("PRAGMA table_info(Cameras)")]
+    if 'source_uri' not in columns:
+        db_execute("ALTER TABLE Cameras ADD COLUMN source_uri TEXT")
+        logger.info("Added source_uri column to Cameras table")
+
+def get_active_cameras():
+    return db_fetch("SELECT camera_id, name, location, source_uri FROM Cameras WHERE status='active'")
+
+ensure_camera_schema()
+# Settings are loaded once and served from memory; changes are persisted write-behind
+settings = SettingsService(db, lambda event, data: socketio.emit(event, data))
+settings.load()
+startup.mark('database')
 
 # Notification configuration
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -132,9 +164,23 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
 RECIPIENT_PHONE_NUMBER = os.getenv('RECIPIENT_PHONE_NUMBER', '').strip()
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-
-notification_lock = threading.Lock()
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'true').lower() in ('1', 'true', 'yes')
+EMAIL_CONCURRENCY = int(os.getenv('EMAIL_CONCURRENCY', 1))
+SMS_CONCURRENCY = int(os.getenv('SMS_CONCURRENCY', 2))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+
+# Notifications are written to the outbox as 'pending' and delivered off the detection path
+outbox = NotificationOutbox(
+    db,
+    senders={
+        'email': SmtpMailer(EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD, use_tls=EMAIL_USE_TLS).send_job,
+        'sms': SmsSender(TWILIO_PHONE_NUMBER, twilio_client_factory(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)).send_job
+    },
+    concurrency={'email': EMAIL_CONCURRENCY, 'sms': SMS_CONCURRENCY},
+    max_attempts=NOTIFICATION_MAX_ATTEMPTS,
+    observe=metrics.observe_notification
+)
+startup.mark('notifications')
 
 # Conditional configuration based on environment
 if IS_DEVELOPMENT:
@@ -152,6 +198,39 @@ else:
 # Initialize SocketIO with conditional CORS settings
 cors_allowed_origins = 'http://localhost:8080' if IS_DEVELOPMENT else '*'
 socketio = SocketIO(app, async_mode='threading', cors_allowed_origins=cors_allowed_origins)
+startup.emit = socketio.emit
+# Preview frames are only encoded and emitted for streams a connected client is watching, once per tier
+# in use; the registry moves each client between the tier rooms from its frame acknowledgements
+viewers = ViewerRegistry(enter_room=lambda sid, room: socketio.server.enter_room(sid, room),
+                         leave_room=lambda sid, room: socketio.server.leave_room(sid, room))
+metrics.track_viewers(viewers)
+
+segment_store = None
+if PREROLL_MODE == 'dvr':
+    segment_store = SegmentStore(DVR_ROOT, DVR_SEGMENT_SECONDS, max_bytes=int(DVR_MAX_GB * 1024 ** 3),
+                                 max_age_seconds=DVR_MAX_AGE_HOURS * 3600)
+    segment_store.start()
+    metrics.track_segment_store(segment_store)
+
+# One capture worker per video source: the dashboard feed (webcam/upload) plus every active camera
+# The pre-roll also has to hold the post-roll frames recorded after the alert; each worker sizes it from its source FPS
+ingestion = IngestionManager(socketio.emit, detection_queue, SEQUENCE_LENGTH, FRAME_RATE,
+                             settings.get('clip_duration_seconds') + CLIP_POST_ROLL_SECONDS, settings.get('clip_capture_enabled'),
+                             window_stride=DETECTION_WINDOW_STRIDE,
+                             preroll_budget_bytes=PREROLL_MEMORY_BUDGET_MB * 1024 * 1024,
+                             preroll_mode=PREROLL_MODE,
+                             frame_transport=FRAME_TRANSPORT,
+                             observe=metrics.observe_stage,
+                             detection_enabled=False,
+                             resize_interpolation=PREPROCESS_INTERPOLATION,
+                             motion_threshold=MOTION_GATE_THRESHOLD,
+                             motion_hold_seconds=MOTION_GATE_HOLD_SECONDS,
+                             capture_mode=CAPTURE_MODE,
+                             encode_workers=ENCODE_WORKERS,
+                             viewers=viewers,
+                             segment_store=segment_store)
+stream_metrics = metrics.track_streams(ingestion)
+metrics.track_encoder(ingestion.encoder)
 
 # Serve uploaded files (snapshots, clips)
 @app.route('/Uploads/<filename>')
@@ -176,238 +255,108 @@ if IS_DEVELOPMENT:
     def health_check():
         return jsonify({"status": "ok", "environment": ENVIRONMENT}), 200
 
-def preprocess_frame(frame):
-    if frame is None or frame.size == 0:
-        logger.error("Invalid frame received for preprocessing.")
-        return None
-    frame_resized = cv2.resize(frame, (64, 64))
-    frame_normalized = frame_resized.astype('float32') / 255.0
-    return frame_normalized
-
-def run_model_on_sequence(sequence):
-    sequence_array = np.array(sequence)
-    sequence_array = np.expand_dims(sequence_array, axis=0)
-    prediction = model.predict(sequence_array)
-    confidence = float(prediction[0][0])
-    return confidence < 0.5, confidence
-
-def capture_clip(alert_id):
-    if not enable_clip_capture or len(frame_buffer) < MAX_BUFFER_SIZE:
+# Readiness for load balancers and the dashboard: 503 until the model is loaded and warmed up
+@app.route('/ready', methods=['GET'])
+def readiness():
+    return jsonify(startup.snapshot()), 200 if startup.ready else 503
+
+def prepare_clip(alert_id, worker, tx):
+    # The VideoClips row is written with the alert; the writer fills in the real span and size
+    if not settings.get('clip_capture_enabled') or len(worker.frame_buffer) == 0:
         logger.info("Clip not captured: feature disabled or insufficient frames.")
         return None
-    clip_frames = frame_buffer[-MAX_BUFFER_SIZE:]
+    alert_time = time.time()
     timestamp = time.strftime("%Y%m%d-%H%M%S")
-    clip_path = os.path.join(UPLOAD_FOLDER, f"clip_{timestamp}.mp4")
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    frame_shape = clip_frames[0].shape[1], clip_frames[0].shape[0]
-    out = cv2.VideoWriter(clip_path, fourcc, FRAME_RATE, frame_shape)
-    for frame in clip_frames:
-        out.write(cv2.resize(frame, frame_shape))
-    out.release()
-    clip_size = os.path.getsize(clip_path) if os.path.exists(clip_path) else 0
-    db_execute("INSERT INTO VideoClips (alert_id, file_path, start_time, duration, size) VALUES (?, ?, ?, ?, ?)",
-               (alert_id, clip_path, datetime.now(), CLIP_DURATION, clip_size))
-    logger.info(f"Clip saved: {clip_path} ({clip_size} bytes)")
-    return clip_path
-
-def send_email_alert(alert_id, message, clip_path=None):
+    clip_path = os.path.join(UPLOAD_FOLDER, f"clip_{worker.stream_id}_{timestamp}.mp4")
+    clip_duration = settings.get('clip_duration_seconds')
+    job = ClipJob(alert_id, worker.stream_id, worker.frame_buffer, alert_time - clip_duration,
+                  alert_time + CLIP_POST_ROLL_SECONDS, clip_path, worker.clip_fps())
+    job.clip_id = tx.execute("INSERT INTO VideoClips (alert_id, file_path, start_time, duration, size) VALUES (?, ?, ?, ?, ?)",
+                             (alert_id, clip_path, datetime.fromtimestamp(job.start_time), clip_duration + CLIP_POST_ROLL_SECONDS, None))
+    return job
+
+def finish_clip(job, ok, email_job, notifications_enabled):
+    clip_path = job.clip_path if ok else None
+    if ok:
+        db_execute("UPDATE VideoClips SET start_time=?, duration=?, size=? WHERE clip_id=?",
+                   (datetime.fromtimestamp(job.first_timestamp), job.duration, job.size, job.clip_id))
+    else:
+        db_execute("DELETE FROM VideoClips WHERE clip_id=?", (job.clip_id,))
+    if email_job:
+        outbox.release(email_job, attachment=clip_path)
+    elif not notifications_enabled and clip_path and os.path.exists(clip_path):
+        os.remove(clip_path)
+
+def remove_clip_after_send(job, sent):
+    if job.attachment and os.path.exists(job.attachment):
+        os.remove(job.attachment)
+
+def send_email_alert(alert_id, message, tx=None, hold=False):
     if not EMAIL_RECIPIENTS:
         logger.warning("No email recipients configured.")
-        return
-    try:
-        msg = MIMEMultipart()
-        msg['Subject'] = "Shoplifting Alert"
-        msg['From'] = EMAIL_USER
-        msg['To'] = ", ".join(EMAIL_RECIPIENTS)
-        body = f"Shoplifting detected at {time.ctime()}: {message}"
-        msg.attach(MIMEText(body, 'plain'))
-        if clip_path and os.path.exists(clip_path):
-            with open(clip_path, 'rb') as attachment:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(attachment.read())
-                encoders.encode_base64(part)
-                part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(clip_path)}')
-                msg.attach(part)
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASSWORD)
-            server.send_message(msg)
-        db_execute("INSERT INTO Notifications (alert_id, type, recipient, sent_time, status, message) VALUES (?, ?, ?, ?, ?, ?)",
-                   (alert_id, 'email', msg['To'], datetime.now(), 'sent', body))
-        db_execute("UPDATE Settings SET last_email_time=? WHERE setting_id=1", (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
-        logger.info("Email alert sent successfully.")
-    except Exception as e:
-        db_execute("INSERT INTO Notifications (alert_id, type, recipient, sent_time, status, message) VALUES (?, ?, ?, ?, ?, ?)",
-                   (alert_id, 'email', msg['To'], datetime.now(), 'failed', body))
-        logger.error(f"Failed to send email: {e}")
-    finally:
-        if clip_path and os.path.exists(clip_path):
-            os.remove(clip_path)
-
-def send_sms_alert(alert_id, message):
+        return None
+    body = f"Shoplifting detected at {time.ctime()}: {message}"
+    job = outbox.enqueue(alert_id, 'email', ", ".join(EMAIL_RECIPIENTS), body, subject="Shoplifting Alert",
+                         on_done=remove_clip_after_send, tx=tx, hold=hold)
+    logger.info("Email alert queued.")
+    return job
+
+def send_sms_alert(alert_id, message, tx=None):
     if not RECIPIENT_PHONE_NUMBER:
         logger.warning("No SMS recipient configured.")
-        return
-    try:
-        sms_body = f"Shoplifting Alert at {time.ctime()}: {message}"
-        twilio_message = twilio_client.messages.create(body=sms_body, from_=TWILIO_PHONE_NUMBER, to=RECIPIENT_PHONE_NUMBER)
-        db_execute("INSERT INTO Notifications (alert_id, type, recipient, sent_time, status, message) VALUES (?, ?, ?, ?, ?, ?)",
-                   (alert_id, 'sms', RECIPIENT_PHONE_NUMBER, datetime.now(), 'sent', sms_body))
-        db_execute("UPDATE Settings SET last_sms_time=? WHERE setting_id=1", (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
-        logger.info(f"SMS alert sent successfully: SID {twilio_message.sid}")
-    except TwilioRestException as e:
-        db_execute("INSERT INTO Notifications (alert_id, type, recipient, sent_time, status, message) VALUES (?, ?, ?, ?, ?, ?)",
-                   (alert_id, 'sms', RECIPIENT_PHONE_NUMBER, datetime.now(), 'failed', sms_body))
-        logger.error(f"Failed to send SMS: {e}")
-
-def can_send_notification(notif_type):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT last_{notif_type}_time FROM Settings WHERE setting_id=1")
-        last_time = cursor.fetchone()[0]
-        if not last_time:
-            return True
-        last_time_dt = datetime.strptime(last_time, '%Y-%m-%d %H:%M:%S')
-        current_time = datetime.now()
-        return (current_time - last_time_dt).total_seconds() >= NOTIFICATION_COOLDOWN
+        return None
+    sms_body = f"Shoplifting Alert at {time.ctime()}: {message}"
+    job = outbox.enqueue(alert_id, 'sms', RECIPIENT_PHONE_NUMBER, sms_body, tx=tx)
+    logger.info("SMS alert queued.")
+    return job
 
 def allowed_file(filename):
     return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
-def video_processing():
-    global detection_frame_count, current_source, current_camera_id, uploaded_video_path, latest_frame
-    sequence_buffer = []
-    cap = None
-    current_cap_source = None
-
-    while True:
-        try:
-            if current_source == 'uploaded' and uploaded_video_path:
-                if current_cap_source != 'uploaded':
-                    if cap:
-                        cap.release()
-                    logger.info(f"Switching to uploaded video: {uploaded_video_path}")
-                    cap = cv2.VideoCapture(uploaded_video_path)
-                    if not cap.isOpened():
-                        logger.error(f"Failed to open uploaded video: {uploaded_video_path}")
-                        cap = None
-                        current_source = 'webcam'
-                        current_cap_source = 'webcam'
-                        continue
-                    current_cap_source = 'uploaded'
-                    sequence_buffer.clear()
-                    if enable_clip_capture:
-                        frame_buffer.clear()
-                    logger.info("Successfully switched to uploaded video source")
-            else:
-                if current_cap_source != 'webcam':
-                    if cap:
-                        cap.release()
-                    logger.info("Switching to webcam source")
-                    cap = cv2.VideoCapture(0)
-                    if not cap.isOpened():
-                        logger.error("Failed to open webcam")
-                        cap = None
-                        time.sleep(0.1)
-                        continue
-                    current_cap_source = 'webcam'
-                    sequence_buffer.clear()
-                    if enable_clip_capture:
-                        frame_buffer.clear()
-                    logger.info("Successfully switched to webcam source")
-
-            if not cap or not cap.isOpened():
-                logger.warning("Video capture not opened. Retrying...")
-                time.sleep(0.1)
-                continue
-
-            ret, frame = cap.read()
-            if not ret:
-                if current_cap_source == 'uploaded':
-                    logger.info("Reached end of uploaded video, looping back")
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    continue
-                logger.warning("Failed to read frame. Retrying...")
-                time.sleep(0.1)
-                continue
-
-            with detection_lock:
-                latest_frame = frame.copy()
-                if enable_clip_capture:
-                    frame_buffer.append(frame.copy())
-                    if len(frame_buffer) > MAX_BUFFER_SIZE:
-                        frame_buffer.pop(0)
-
-            processed_frame = preprocess_frame(frame)
-            if processed_frame is not None:
-                sequence_buffer.append(processed_frame)
-                if len(sequence_buffer) == SEQUENCE_LENGTH:
-                    detection_queue.put(sequence_buffer.copy())
-                    sequence_buffer.clear()
-
-            with detection_lock:
-                display_text = detection_frame_count > 0
-                if display_text:
-                    detection_frame_count -= 1
-
-            if display_text:
-                cv2.putText(frame, "Shoplifting Detected!", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-            ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-            if ret:
-                logger.debug(f"Emitting frame from {current_cap_source} source")
-                socketio.emit('frame', {'image': base64.b64encode(buffer).decode('utf-8')})
-            else:
-                logger.error("Failed to encode frame as JPEG")
-
-            time.sleep(1/30)
-        except Exception as e:
-            logger.error(f"Video processing error: {e}")
-            time.sleep(0.1)
-
-def detection_worker():
-    global detection_frame_count
-    last_alert_time = 0
-    while True:
-        sequence = detection_queue.get()
-        if sequence is None:
-            break
-        try:
-            is_shoplifting, confidence = run_model_on_sequence(sequence)
-            current_time = time.time()
-            if is_shoplifting and (current_time - last_alert_time) >= NOTIFICATION_COOLDOWN:
-                with detection_lock:
-                    detection_frame_count = 20
-                alert_message = "Suspicious activity detected!"
-                socketio.emit('alert', {
-                    'message': alert_message,
-                    'confidence': confidence,
-                    'source': current_source,
-                    'camera_id': current_camera_id
-                })
-                if enable_logging:
-                    alert_id = db_execute(
-                        "INSERT INTO Alerts (timestamp, confidence, source, status, details, model_version, camera_id, read, is_false_positive) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (datetime.now(), confidence, current_source, 'new', alert_message, '1.0', current_camera_id, 0, 0)
-                    )
-                    db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("alert_detected", f"Alert ID: {alert_id}"))
-                    clip_path = capture_clip(alert_id)
-                    if enable_email_notifications or enable_sms_notifications:
-                        if enable_email_notifications and can_send_notification('email'):
-                            send_email_alert(alert_id, alert_message, clip_path)
-                        if enable_sms_notifications and can_send_notification('sms'):
-                            send_sms_alert(alert_id, alert_message)
-                    else:
-                        logger.info("Notifications disabled.")
-                        if clip_path and os.path.exists(clip_path):
-                            os.remove(clip_path)
-                else:
-                    logger.info("Alert detected but logging is paused")
-                last_alert_time = current_time
-        except Exception as e:
-            logger.error(f"Detection error: {e}")
-        finally:
-            detection_queue.task_done()
+def handle_detection_result(stream_id, confidence, captured_at):
+    worker = ingestion.get(stream_id)
+    if worker is None:
+        logger.info(f"Dropping detection result from removed stream {stream_id}")
+        return
+    current_time = time.time()
+    if not is_shoplifting_confidence(confidence) or (current_time - last_alert_times.get(stream_id, 0)) < settings.get('cooldown_seconds'):
+        return
+    worker.flag_detection(DETECTION_OVERLAY_FRAMES)
+    alert_message = "Suspicious activity detected!"
+    socketio.emit('alert', {
+        'message': alert_message,
+        'confidence': confidence,
+        'source': worker.source_kind,
+        'camera_id': worker.camera_id,
+        'stream_id': stream_id
+    })
+    # Glass-to-alert: capture of the newest frame in the window to the alert going out
+    metrics.observe_stage('alert_latency', stream_id, time.time() - captured_at)
+    if settings.get('logging_enabled'):
+        email_enabled, sms_enabled = settings.get('email_enabled'), settings.get('sms_enabled')
+        notifications_enabled = email_enabled or sms_enabled
+        if not notifications_enabled:
+            logger.info("Notifications disabled.")
+        # Alert, audit entry, clip row and notification rows commit together
+        with db.transaction() as tx:
+            alert_id = tx.execute(
+                "INSERT INTO Alerts (timestamp, confidence, source, status, details, model_version, camera_id, read, is_false_positive) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now(), confidence, worker.source_kind, 'new', alert_message, '1.0', worker.camera_id, 0, 0)
+            )
+            tx.execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("alert_detected", f"Alert ID: {alert_id}, stream: {stream_id}"))
+            clip_job = prepare_clip(alert_id, worker, tx)
+            email_job = None
+            if email_enabled and settings.try_acquire_cooldown('email'):
+                # The email is held until the clip (written after the post-roll) can be attached
+                email_job = send_email_alert(alert_id, alert_message, tx=tx, hold=clip_job is not None)
+            if sms_enabled and settings.try_acquire_cooldown('sms'):
+                send_sms_alert(alert_id, alert_message, tx=tx)
+            if clip_job:
+                clip_job.on_complete = lambda job, ok: finish_clip(job, ok, email_job, notifications_enabled)
+                tx.on_commit(lambda: clip_writer.submit(clip_job))
+    else:
+        logger.info("Alert detected but logging is paused")
+    last_alert_times[stream_id] = current_time
 
 @app.route('/upload_video', methods=['POST'])
 def upload_video():
@@ -483,6 +432,89 @@ def upload_video():
         db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("upload_failed", f"Failed to save {filename}: {e}"))
         return jsonify({"error": f"Failed to save video file: {str(e)}"}), 500
 
+# Prometheus scrape endpoint: stage latency histograms, queue depth, per-source FPS and drops, DB and notification latency
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+# Offline fast analysis of an uploaded file: decoded as fast as the CPU allows instead of in real time
+@app.route('/analyze_video', methods=['POST'])
+def analyze_video():
+    data = request.get_json(silent=True) or request.form
+    filename = secure_filename(data.get('filename') or '')
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not filename or not allowed_file(filename) or not os.path.isfile(file_path):
+        logger.error(f"Invalid analysis request: {filename!r}")
+        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("analysis_failed", f"Unknown upload: {filename}"))
+        return jsonify({"error": "Unknown or unsupported uploaded video"}), 404
+    job = analysis_runner.submit(file_path)
+    db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("analysis_started", f"Job {job.job_id}: {filename}"))
+    return jsonify(job.to_event()), 202
+
+@app.route('/analysis/<job_id>', methods=['GET'])
+def get_analysis(job_id):
+    job = analysis_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Analysis job not found"}), 404
+    try:
+        return jsonify(dict(job.to_event(), result=job.result())), 200
+    except Exception as e:
+        logger.error(f"Error reading analysis result {job_id}: {e}")
+        return jsonify({"error": f"Error reading analysis result: {str(e)}"}), 500
+
+# Per-source pacing: native and achieved FPS, frame lateness and skipped frames, motion gate skip rate
+@app.route('/streams', methods=['GET'])
+def list_streams():
+    seconds_per_frame = inference_scheduler.seconds_per_frame() if inference_scheduler else 0.0
+    streams = []
+    for worker in ingestion.workers_snapshot():
+        stats = worker.stats()
+        gate = stats['motion_gate']
+        # Estimated from the scheduler's measured per-frame inference cost
+        gate['cpu_saved_seconds'] = round(gate['skipped_frames'] * seconds_per_frame, 3)
+        streams.append(stats)
+    return jsonify(streams), 200
+
+# DVR recordings: stored size and the span still on disk per stream
+@app.route('/recordings', methods=['GET'])
+def list_recordings():
+    if segment_store is None:
+        return jsonify({"error": "Recording is disabled (PREROLL_MODE is not 'dvr')"}), 404
+    streams = {stream_id: {'start': first, 'end': last} for stream_id, (first, last) in segment_store.spans().items()}
+    return jsonify(dict(segment_store.stats(), streams=streams)), 200
+
+# Cuts {start, end} (epoch seconds) of a stream's recording into an mp4. The end may be up to
+# CLIP_POST_ROLL_SECONDS ahead, and is waited for without holding a clip writer.
+@app.route('/recordings/<stream_id>/clip', methods=['POST'])
+def cut_recording(stream_id):
+    recorder = segment_store.get(stream_id) if segment_store is not None else None
+    if recorder is None:
+        return jsonify({"error": "No recording for this stream"}), 404
+    data = request.get_json(silent=True) or {}
+    start, end = data.get('start'), data.get('end')
+    now = time.time()
+    if not isinstance(start, (int, float)) or not isinstance(end, (int, float)) or end <= start \
+            or end - start > DVR_MAX_CLIP_SECONDS:
+        logger.error(f"Invalid recording clip range: {start} - {end}")
+        return jsonify({"error": f"start and end must be epoch seconds, at most {DVR_MAX_CLIP_SECONDS:.0f}s apart"}), 400
+    if start > now or end > now + CLIP_POST_ROLL_SECONDS:
+        logger.error(f"Recording clip range {start} - {end} is in the future")
+        return jsonify({"error": f"start must not be in the future, end at most {CLIP_POST_ROLL_SECONDS:.0f}s ahead"}), 400
+    worker = ingestion.get(stream_id)
+    clip_path = os.path.join(UPLOAD_FOLDER, f"clip_{stream_id}_{int(start)}_{int(end)}.mp4")
+    job = ClipJob(None, stream_id, recorder, float(start), float(end), clip_path,
+                  worker.clip_fps() if worker is not None else FRAME_RATE)
+    clip_writer.submit(job)
+    db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)",
+               ("recording_clip", f"{stream_id}: {datetime.fromtimestamp(start)} - {datetime.fromtimestamp(end)}"))
+    return jsonify(dict(job.to_event(), clip_url=f"/Uploads/{os.path.basename(clip_path)}")), 202
+
+# Preview clients: tier, ack latency, backlog and frames dropped per client
+@app.route('/viewers', methods=['GET'])
+def list_viewers():
+    return jsonify(viewers.snapshot()), 200
+
 @socketio.on('set_source')
 def set_source(data):
     global current_source, current_camera_id
@@ -499,6 +531,11 @@ def set_source(data):
         logger.info(f"Received set_source request: source={source}, camera_id={camera_id}")
         current_source = source
         current_camera_id = camera_id if camera_id is not None else None
+        worker = ingestion.get(DEFAULT_STREAM)
+        if current_source == 'uploaded' and uploaded_video_path:
+            worker.set_source(uploaded_video_path, 'uploaded', current_camera_id)
+        else:
+            worker.set_source(WEBCAM_INDEX, 'webcam', current_camera_id)
         db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("set_source", f"Source set to {current_source}, camera_id: {current_camera_id}"))
         logger.info(f"Source updated to {current_source}, camera_id: {current_camera_id}")
         socketio.emit('source_updated', {'source': current_source, 'camera_id': current_camera_id})
@@ -510,14 +547,9 @@ def set_source(data):
 @socketio.on('connect')
 def handle_connect():
     logger.info("Client connected")
-    socketio.emit('notification_status', {
-        'email_enabled': enable_email_notifications,
-        'sms_enabled': enable_sms_notifications,
-        'clip_capture_enabled': enable_clip_capture,
-        'clip_duration_seconds': CLIP_DURATION,
-        'logging_enabled': enable_logging,
-        'cooldown_seconds': NOTIFICATION_COOLDOWN
-    })
+    viewers.connect(request.sid)
+    socketio.emit('server_status', startup.snapshot())
+    socketio.emit('notification_status', settings.snapshot())
     logs = db_fetch("""
         SELECT a.alert_id, a.timestamp, a.details, a.source, a.confidence, a.camera_id, 
                CASE WHEN vc.file_path IS NOT NULL THEN '/Uploads/' || vc.file_path ELSE NULL END AS clip_url
@@ -535,6 +567,32 @@ def handle_connect():
         'clip_url': row['clip_url']
     } for row in logs])
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    viewers.disconnect(request.sid)
+    logger.info(f"Client disconnected ({viewers.snapshot()['connected']} still connected)")
+
+# Clients watch every stream by default; they can narrow to some stream ids, cap their
+# tier ('thumb', 'sd', 'full') or pause (e.g. hidden tab)
+@socketio.on('preview_subscribe')
+def preview_subscribe(data=None):
+    data = data or {}
+    viewers.subscribe(request.sid, data.get('stream_ids'), data.get('tier'))
+
+@socketio.on('preview_unsubscribe')
+def preview_unsubscribe(data=None):
+    viewers.unsubscribe(request.sid)
+
+# Sent by clients for every preview frame they receive: {camera_id (binary frames) or stream_id, sequence}
+@socketio.on('preview_ack')
+def preview_ack(data=None):
+    data = data or {}
+    stream_id = data.get('stream_id')
+    if stream_id is None:
+        camera_id = data.get('camera_id')
+        stream_id = DEFAULT_STREAM if camera_id is None or camera_id == -1 else camera_stream_id(camera_id)
+    viewers.ack(request.sid, stream_id, data.get('sequence'))
+
 @socketio.on('clear_alerts')
 def clear_alerts():
     try:
@@ -547,7 +605,6 @@ def clear_alerts():
 
 @socketio.on('toggle_notifications')
 def toggle_notifications(data):
-    global enable_email_notifications, enable_sms_notifications
     try:
         notification_type = data.get('type')
         enabled = data.get('enabled')
@@ -556,120 +613,67 @@ def toggle_notifications(data):
             db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("toggle_notifications_failed", f"Invalid data: {data}"))
             return
         if notification_type == 'email':
-            enable_email_notifications = enabled
-            db_execute("UPDATE Settings SET email_enabled=?, last_updated=? WHERE setting_id=1",
-                       (int(enabled), datetime.now()))
-            db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)",
-                       ("toggle_email", f"Email set to {enabled}"))
+            settings.update(email_enabled=enabled, audit=("toggle_email", f"Email set to {enabled}"))
             logger.info(f"Email notifications {'enabled' if enabled else 'disabled'}")
         elif notification_type == 'sms':
-            enable_sms_notifications = enabled
-            db_execute("UPDATE Settings SET sms_enabled=?, last_updated=? WHERE setting_id=1",
-                       (int(enabled), datetime.now()))
-            db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)",
-                       ("toggle_sms", f"SMS set to {enabled}"))
+            settings.update(sms_enabled=enabled, audit=("toggle_sms", f"SMS set to {enabled}"))
             logger.info(f"SMS notifications {'enabled' if enabled else 'disabled'}")
-        socketio.emit('notification_status', {
-            'email_enabled': enable_email_notifications,
-            'sms_enabled': enable_sms_notifications,
-            'clip_capture_enabled': enable_clip_capture,
-            'clip_duration_seconds': CLIP_DURATION,
-            'logging_enabled': enable_logging,
-            'cooldown_seconds': NOTIFICATION_COOLDOWN
-        })
     except Exception as e:
         logger.error(f"Error toggling notifications: {e}")
         db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("toggle_notifications_failed", f"Error: {e}"))
 
 @socketio.on('toggle_clip_capture')
 def toggle_clip_capture(data):
-    global enable_clip_capture
     try:
         enabled = data.get('enabled')
         if not isinstance(enabled, bool):
             logger.error(f"Invalid toggle_clip_capture data: {data}")
             db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("toggle_clip_failed", f"Invalid data: {data}"))
             return
-        enable_clip_capture = enabled
-        db_execute("UPDATE Settings SET clip_capture_enabled=?, last_updated=? WHERE setting_id=1",
-                   (int(enabled), datetime.now()))
-        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)",
-                   ("toggle_clip", f"Clip capture set to {enabled}"))
-        if not enable_clip_capture:
-            with detection_lock:
-                frame_buffer.clear()
+        settings.update(clip_capture_enabled=enabled, audit=("toggle_clip", f"Clip capture set to {enabled}"))
+        ingestion.set_clip_capture(enabled)
         logger.info(f"Clip capture {'enabled' if enabled else 'disabled'}")
-        socketio.emit('notification_status', {
-            'email_enabled': enable_email_notifications,
-            'sms_enabled': enable_sms_notifications,
-            'clip_capture_enabled': enable_clip_capture,
-            'clip_duration_seconds': CLIP_DURATION,
-            'logging_enabled': enable_logging,
-            'cooldown_seconds': NOTIFICATION_COOLDOWN
-        })
     except Exception as e:
         logger.error(f"Error toggling clip capture: {e}")
         db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("toggle_clip_failed", f"Error: {e}"))
 
 @socketio.on('set_clip_duration')
 def set_clip_duration(data):
-    global CLIP_DURATION, MAX_BUFFER_SIZE
     try:
         duration = data.get('duration')
         if not isinstance(duration, (int, float)) or duration <= 0 or duration > 1800:
             logger.error(f"Invalid clip duration: {duration}")
             db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("set_clip_duration_failed", f"Invalid duration: {duration}"))
             return
-        CLIP_DURATION = float(duration)
-        MAX_BUFFER_SIZE = int(CLIP_DURATION * FRAME_RATE)
-        db_execute("UPDATE Settings SET clip_duration_seconds=?, last_updated=? WHERE setting_id=1",
-                   (CLIP_DURATION, datetime.now()))
-        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)",
-                   ("set_clip_duration", f"Clip duration set to {CLIP_DURATION} seconds"))
-        logger.info(f"Clip duration updated to {CLIP_DURATION} seconds")
-        socketio.emit('notification_status', {
-            'email_enabled': enable_email_notifications,
-            'sms_enabled': enable_sms_notifications,
-            'clip_capture_enabled': enable_clip_capture,
-            'clip_duration_seconds': CLIP_DURATION,
-            'logging_enabled': enable_logging,
-            'cooldown_seconds': NOTIFICATION_COOLDOWN
-        })
+        duration = float(duration)
+        if settings.update(clip_duration_seconds=duration, audit=("set_clip_duration", f"Clip duration set to {duration} seconds")):
+            ingestion.set_buffer_seconds(duration + CLIP_POST_ROLL_SECONDS)
+        logger.info(f"Clip duration updated to {duration} seconds")
     except Exception as e:
         logger.error(f"Error setting clip duration: {e}")
         db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("set_clip_duration_failed", f"Error: {e}"))
 
 @socketio.on('set_cooldown_duration')
 def set_cooldown_duration(data):
-    global NOTIFICATION_COOLDOWN
     try:
         cooldown = data.get('cooldown')
         if not isinstance(cooldown, (int, float)) or cooldown < 0 or cooldown > 300:
             logger.error(f"Invalid cooldown duration: {cooldown}")
             db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("set_cooldown_failed", f"Invalid cooldown: {cooldown}"))
             return
-        NOTIFICATION_COOLDOWN = int(cooldown)
-        db_execute("UPDATE Settings SET cooldown_seconds=?, last_updated=? WHERE setting_id=1",
-                   (NOTIFICATION_COOLDOWN, datetime.now()))
-        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)",
-                   ("set_cooldown", f"Cooldown duration set to {NOTIFICATION_COOLDOWN} seconds"))
-        logger.info(f"Cooldown duration updated to {NOTIFICATION_COOLDOWN} seconds")
-        socketio.emit('notification_status', {
-            'email_enabled': enable_email_notifications,
-            'sms_enabled': enable_sms_notifications,
-            'clip_capture_enabled': enable_clip_capture,
-            'clip_duration_seconds': CLIP_DURATION,
-            'logging_enabled': enable_logging,
-            'cooldown_seconds': NOTIFICATION_COOLDOWN
-        })
+        cooldown = int(cooldown)
+        settings.update(cooldown_seconds=cooldown, audit=("set_cooldown", f"Cooldown duration set to {cooldown} seconds"))
+        logger.info(f"Cooldown duration updated to {cooldown} seconds")
     except Exception as e:
         logger.error(f"Error setting cooldown duration: {e}")
         db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("set_cooldown_failed", f"Error: {e}"))
 
 @socketio.on('capture_snapshot')
 def capture_snapshot(data=None):
-    global latest_frame
     try:
+        camera_id = data.get('camera_id') if isinstance(data, dict) else None
+        worker = ingestion.get(camera_stream_id(camera_id) if camera_id is not None else DEFAULT_STREAM)
+        latest_frame = worker.get_latest_frame() if worker else None
         if latest_frame is None or not isinstance(latest_frame, np.ndarray) or latest_frame.size == 0:
             logger.error("No valid frame available for snapshot: latest_frame is invalid")
             db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("snapshot_failed", "No valid frame"))
@@ -771,27 +775,14 @@ def update_alert(data):
 
 @socketio.on('toggle_logging')
 def toggle_logging(data):
-    global enable_logging
     try:
         enabled = data.get('enabled')
         if not isinstance(enabled, bool):
             logger.error(f"Invalid toggle_logging data: {data}")
             db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("toggle_logging_failed", f"Invalid data: {data}"))
             return
-        enable_logging = enabled
-        db_execute("UPDATE Settings SET logging_enabled=?, last_updated=? WHERE setting_id=1",
-                   (int(enabled), datetime.now()))
-        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)",
-                   ("toggle_logging", f"Logging set to {enabled}"))
+        settings.update(logging_enabled=enabled, audit=("toggle_logging", f"Logging set to {enabled}"))
         logger.info(f"Alert logging {'enabled' if enabled else 'disabled'}")
-        socketio.emit('notification_status', {
-            'email_enabled': enable_email_notifications,
-            'sms_enabled': enable_sms_notifications,
-            'clip_capture_enabled': enable_clip_capture,
-            'clip_duration_seconds': CLIP_DURATION,
-            'logging_enabled': enable_logging,
-            'cooldown_seconds': NOTIFICATION_COOLDOWN
-        })
     except Exception as e:
         logger.error(f"Error toggling logging: {e}")
         db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("toggle_logging_failed", f"Error: {e}"))
@@ -806,11 +797,144 @@ def log_error(data):
     except Exception as e:
         logger.error(f"Error logging frontend error: {e}")
 
-detection_thread = threading.Thread(target=detection_worker, daemon=True)
-detection_thread.start()
+@socketio.on('get_cameras')
+def get_cameras(data=None):
+    try:
+        running = {worker.camera_id: worker.is_alive() for worker in ingestion.workers_snapshot() if worker.stream_id != DEFAULT_STREAM}
+        cameras = db_fetch("SELECT camera_id, name, location, status, source_uri FROM Cameras ORDER BY camera_id")
+        socketio.emit('cameras', [{
+            'camera_id': row['camera_id'],
+            'stream_id': camera_stream_id(row['camera_id']),
+            'name': row['name'],
+            'location': row['location'],
+            'status': row['status'],
+            'source_uri': row['source_uri'],
+            'running': running.get(row['camera_id'], False)
+        } for row in cameras])
+    except Exception as e:
+        logger.error(f"Error listing cameras: {e}")
+        socketio.emit('camera_error', {'error': f"Error listing cameras: {str(e)}"})
+
+@socketio.on('add_camera')
+def add_camera(data):
+    try:
+        name = (data.get('name') or '').strip()
+        source_uri = str(data.get('source_uri') or '').strip()
+        location = data.get('location')
+        if not name or not source_uri:
+            logger.error(f"Invalid add_camera data: {data}")
+            db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("add_camera_failed", f"Invalid data: {data}"))
+            socketio.emit('camera_error', {'error': "Camera name and source_uri are required"})
+            return
+        existing = db_fetch("SELECT camera_id FROM Cameras WHERE name=?", (name,))
+        if existing:
+            camera_id = existing[0]['camera_id']
+            db_execute("UPDATE Cameras SET location=?, source_uri=?, status='active' WHERE camera_id=?", (location, source_uri, camera_id))
+        else:
+            camera_id = db_execute("INSERT INTO Cameras (name, location, status, source_uri) VALUES (?, ?, 'active', ?)", (name, location, source_uri))
+        ingestion.stop_stream(camera_stream_id(camera_id))
+        ingestion.start_camera({'camera_id': camera_id, 'name': name, 'source_uri': source_uri})
+        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("add_camera", f"Camera {camera_id} ({name}) started: {source_uri}"))
+        get_cameras()
+    except Exception as e:
+        logger.error(f"Error adding camera: {e}")
+        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("add_camera_failed", f"Error: {e}"))
+        socketio.emit('camera_error', {'error': f"Error adding camera: {str(e)}"})
+
+@socketio.on('remove_camera')
+def remove_camera(data):
+    try:
+        camera_id = data.get('camera_id')
+        if not isinstance(camera_id, int):
+            logger.error(f"Invalid remove_camera data: {data}")
+            db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("remove_camera_failed", f"Invalid data: {data}"))
+            return
+        db_execute("UPDATE Cameras SET status='inactive' WHERE camera_id=?", (camera_id,))
+        ingestion.stop_stream(camera_stream_id(camera_id))
+        if inference_scheduler is not None:
+            inference_scheduler.reset_stream(camera_stream_id(camera_id))
+        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("remove_camera", f"Camera {camera_id} stopped"))
+        get_cameras()
+    except Exception as e:
+        logger.error(f"Error removing camera: {e}")
+        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("remove_camera_failed", f"Error: {e}"))
+        socketio.emit('camera_error', {'error': f"Error removing camera: {str(e)}"})
+
+settings.start()
+outbox.start()
+
+# Clips are written off the inference thread, including post-roll after the alert
+clip_writer = ClipWriterPool(CLIP_WRITER_WORKERS, socketio.emit, observe=metrics.observe_stage)
+clip_writer.start()
+
+# Each analysis job runs the analysis CLI in its own process, one job at a time
+analysis_runner = AnalysisRunner(socketio.emit, UPLOAD_FOLDER, workers=ANALYSIS_WORKERS or None,
+                                 segment_seconds=ANALYSIS_SEGMENT_SECONDS, stride=DETECTION_WINDOW_STRIDE,
+                                 backend=INFERENCE_BACKEND, model_path=MODEL_PATH)
+analysis_runner.start()
+
+def start_inference_processes():
+    # Model load and warm-up happen in the worker processes; this process only dispatches chunks
+    pool = InferenceProcessPool(detection_queue, INFERENCE_BACKEND, MODEL_PATH, handle_detection_result, SEQUENCE_LENGTH,
+                                EXPECTED_INPUT_SHAPE[2:], processes=INFERENCE_PROCESSES,
+                                max_batch_size=INFERENCE_MAX_BATCH_SIZE, max_wait=INFERENCE_MAX_WAIT_MS / 1000.0,
+                                observe=metrics.observe_stage, max_age=DETECTION_MAX_AGE_SECONDS,
+                                warmup_frames=DETECTION_WINDOW_STRIDE)
+    try:
+        with startup.phase('model_load'):
+            pool.start()
+            input_shapes = pool.wait_for('loaded')
+        for input_shape in input_shapes:
+            if input_shape != EXPECTED_INPUT_SHAPE:
+                raise ValueError(f"Model input shape mismatch. Expected {EXPECTED_INPUT_SHAPE}, got {input_shape}")
+        startup.set_state('warming_up')
+        with startup.phase('warmup'):
+            pool.wait_for('ready')
+    except Exception:
+        pool.stop()
+        raise
+    pool.start_dispatching()
+    return pool
+
+def load_model_in_background():
+    global model, inference_scheduler
+    try:
+        startup.set_state('loading_model')
+        if INFERENCE_PROCESSES > 0:
+            inference_scheduler = start_inference_processes()
+            stream_metrics.scheduler = inference_scheduler
+            ingestion.set_detection_enabled(True)
+            startup.set_state('ready')
+            return
+        with startup.phase('model_load'):
+            loaded = load_backend(INFERENCE_BACKEND, MODEL_PATH)
+        if tuple(loaded.input_shape) != EXPECTED_INPUT_SHAPE:
+            raise ValueError(f"Model input shape mismatch. Expected {EXPECTED_INPUT_SHAPE}, got {loaded.input_shape}")
+        startup.set_state('warming_up')
+        with startup.phase('warmup'):
+            warm_up(loaded, DETECTION_WINDOW_STRIDE, INFERENCE_MAX_BATCH_SIZE)
+        model = loaded
+        # Gathers new frames from every stream into one encoder call and the ready windows into one head call
+        inference_scheduler = BatchInferenceScheduler(detection_queue, model.encode, model.head, handle_detection_result,
+                                                      SEQUENCE_LENGTH, max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                                                      max_wait=INFERENCE_MAX_WAIT_MS / 1000.0, observe=metrics.observe_stage,
+                                                      max_age=DETECTION_MAX_AGE_SECONDS)
+        inference_scheduler.start()
+        stream_metrics.scheduler = inference_scheduler
+        ingestion.set_detection_enabled(True)
+        startup.set_state('ready')
+    except Exception as e:
+        # The dashboard stays up (live view, logs, settings) and shows the failure
+        logger.error(f"Failed to load model: {e}")
+        db_execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", ("model_load_failed", str(e)))
+        startup.set_state('failed', str(e))
+
+# Capture starts immediately for the live view; frames are only queued for detection once the model is ready
+ingestion.start_stream(DEFAULT_STREAM, WEBCAM_INDEX, 'webcam', fallback_source=WEBCAM_INDEX)
+ingestion.sync_cameras(get_active_cameras())
+startup.mark('services')
 
-video_thread = threading.Thread(target=video_processing, daemon=True)
-video_thread.start()
+threading.Thread(target=load_model_in_background, name="model-loader", daemon=True).start()
 
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000)
\ No newline at end of file
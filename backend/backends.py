@@ -0,0 +1,146 @@
+import os
+import threading
+import logging
+import numpy as np
+from inference import DEFAULT_MODEL_PATH, make_window_predictors
+
+logger = logging.getLogger(__name__)
+
+# Exported models are stored as an encoder/head pair next to each other:
+# <prefix>.encoder.<ext> and <prefix>.head.<ext> (see convert_model.py)
+EXPORT_EXTENSIONS = {'tflite': 'tflite', 'onnx': 'onnx'}
+DEFAULT_EXPORT_PREFIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'lrcn')
+
+
+def export_paths(prefix, backend):
+    ext = EXPORT_EXTENSIONS[backend]
+    return f"{prefix}.encoder.{ext}", f"{prefix}.head.{ext}"
+
+
+class InferenceBackend:
+    # encode(frames (N,64,64,3) float32) -> per-frame embeddings
+    # head(windows (B,T,...) of embeddings) -> [confidence] per window
+    # predict(sequences) -> [confidence] per full sequence
+    name = None
+
+    def __init__(self, path):
+        self.path = path
+        self.input_shape = None
+
+    def encode(self, frames):
+        raise NotImplementedError
+
+    def head(self, windows):
+        raise NotImplementedError
+
+    def predict(self, sequences):
+        batch = np.stack(sequences).astype(np.float32)
+        count, length = batch.shape[:2]
+        features = self.encode(batch.reshape((count * length,) + batch.shape[2:]))
+        return self.head(features.reshape((count, length) + features.shape[1:]))
+
+    def describe(self):
+        return {'backend': self.name, 'path': self.path, 'input_shape': list(self.input_shape[1:])}
+
+
+class KerasBackend(InferenceBackend):
+    name = 'keras'
+
+    def __init__(self, path):
+        super().__init__(path)
+        from keras.models import load_model
+        self.model = load_model(path)
+        self.input_shape = tuple(self.model.input_shape)
+        self.encode, self.head = make_window_predictors(self.model)
+
+
+class TFLiteBackend(InferenceBackend):
+    # One interpreter per model part. Interpreters are not thread-safe and need their
+    # input tensor resized whenever the batch size changes, so calls are serialized.
+    name = 'tflite'
+
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            # tensorflow.lite is not importable as a module in recent TF releases
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        encoder_path, head_path = export_paths(path, self.name)
+        self.encoder = Interpreter(model_path=encoder_path, num_threads=os.cpu_count())
+        self.head_model = Interpreter(model_path=head_path, num_threads=os.cpu_count())
+        self.batch_sizes = {}
+        self.lock = threading.Lock()
+        frame_shape = tuple(self.encoder.get_input_details()[0]['shape'][1:])
+        window_length = int(self.head_model.get_input_details()[0]['shape'][1])
+        self.input_shape = (None, window_length) + frame_shape
+
+    def _run(self, interpreter, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self.lock:
+            input_detail = interpreter.get_input_details()[0]
+            if self.batch_sizes.get(id(interpreter)) != len(batch):
+                interpreter.resize_tensor_input(input_detail['index'], batch.shape)
+                interpreter.allocate_tensors()
+                self.batch_sizes[id(interpreter)] = len(batch)
+            interpreter.set_tensor(input_detail['index'], batch)
+            interpreter.invoke()
+            return interpreter.get_tensor(interpreter.get_output_details()[0]['index']).copy()
+
+    def encode(self, frames):
+        return self._run(self.encoder, frames)
+
+    def head(self, windows):
+        return [float(prediction[0]) for prediction in self._run(self.head_model, windows)]
+
+
+class OnnxBackend(InferenceBackend):
+    name = 'onnx'
+
+    def __init__(self, path):
+        super().__init__(path)
+        import onnxruntime
+        encoder_path, head_path = export_paths(path, self.name)
+        providers = onnxruntime.get_available_providers()
+        self.encoder = onnxruntime.InferenceSession(encoder_path, providers=providers)
+        self.head_model = onnxruntime.InferenceSession(head_path, providers=providers)
+        encoder_input = self.encoder.get_inputs()[0]
+        head_input = self.head_model.get_inputs()[0]
+        self.encoder_input = encoder_input.name
+        self.head_input = head_input.name
+        self.input_shape = (None, int(head_input.shape[1])) + tuple(int(d) for d in encoder_input.shape[1:])
+
+    def encode(self, frames):
+        return self.encoder.run(None, {self.encoder_input: np.asarray(frames, dtype=np.float32)})[0]
+
+    def head(self, windows):
+        outputs = self.head_model.run(None, {self.head_input: np.asarray(windows, dtype=np.float32)})[0]
+        return [float(prediction[0]) for prediction in outputs]
+
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend, TFLiteBackend, OnnxBackend)}
+
+
+def warm_up(backend, chunk_frames, max_batch_size):
+    # First calls trace/compile the graphs; run them on the shapes the scheduler uses
+    # so the first real detection is not delayed by several seconds
+    input_shape = tuple(backend.input_shape[1:])
+    backend.encode(np.zeros((chunk_frames,) + input_shape[1:], dtype=np.float32))
+    for batch_size in sorted({1, max_batch_size}):
+        backend.predict([np.zeros(input_shape, dtype=np.float32)] * batch_size)
+
+
+def default_model_path(name):
+    return DEFAULT_MODEL_PATH if name == 'keras' else DEFAULT_EXPORT_PREFIX
+
+
+def load_backend(name, path=None):
+    # Keras takes the .h5 file; tflite/onnx take the export prefix written by convert_model.py
+    path = path or default_model_path(name)
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown inference backend {name!r}; expected one of {', '.join(BACKENDS)}")
+    backend = backend_class(path)
+    logger.info(f"Loaded {name} inference backend from {path}")
+    return backend
@@ -0,0 +1,86 @@
+import argparse
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from inference import normalize_frames
+from ingestion import MODEL_FRAME_SIZE, RESIZE_INTERPOLATIONS, preprocess_frame
+
+# Micro-benchmark for the capture-side preprocessing path: the former per-frame
+# float32 conversion plus np.array/expand_dims per sequence, against resizing into a
+# preallocated uint8 slab and normalizing once per batch.
+
+
+def legacy_path(frames, sequence_length, stride):
+    sequence = []
+    for frame in frames:
+        sequence.append(cv2.resize(frame, MODEL_FRAME_SIZE).astype('float32') / 255.0)
+        if len(sequence) == sequence_length:
+            np.expand_dims(np.array(sequence), axis=0)
+            sequence = sequence[stride:]
+
+
+def slab_path(frames, sequence_length, stride, interpolation, batch_chunks):
+    slab = np.empty((sequence_length,) + MODEL_FRAME_SIZE[::-1] + (3,), dtype=np.uint8)
+    normalized = np.empty((batch_chunks * stride,) + slab.shape[1:], dtype=np.float32)
+    count = 0
+    pending = []
+    for frame in frames:
+        preprocess_frame(frame, slab[count], interpolation)
+        count += 1
+        if count == stride:
+            pending.append(slab[:count].copy())
+            count = 0
+            if len(pending) == batch_chunks:
+                normalize_frames(pending, normalized)
+                pending = []
+
+
+def time_per_frame(fn, frames, repeats, *args):
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(frames, *args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(frames) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare float32-per-frame and uint8-slab preprocessing.")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=600, help="Frames per run")
+    parser.add_argument('--repeats', type=int, default=5, help="Runs per variant (best is reported)")
+    parser.add_argument('--sequence-length', type=int, default=20)
+    parser.add_argument('--stride', type=int, default=10, help="Frames per detection chunk")
+    parser.add_argument('--batch-chunks', type=int, default=8, help="Chunks normalized together (scheduler batch)")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    pattern = rng.integers(0, 256, (8, args.height, args.width, 3), dtype=np.uint8)
+    frames = [pattern[i % len(pattern)] for i in range(args.frames)]
+    frame_shape = MODEL_FRAME_SIZE[::-1] + (3,)
+    results = {
+        'config': vars(args),
+        'us_per_frame': {
+            'float32_per_frame': round(time_per_frame(legacy_path, frames, args.repeats, args.sequence_length, args.stride), 2),
+        },
+        'bytes_per_sequence': {
+            'float32': int(np.prod(frame_shape)) * 4 * args.sequence_length,
+            'uint8': int(np.prod(frame_shape)) * args.sequence_length,
+        },
+    }
+    for name, interpolation in RESIZE_INTERPOLATIONS.items():
+        results['us_per_frame'][f"uint8_slab_{name}"] = round(
+            time_per_frame(slab_path, frames, args.repeats, args.sequence_length, args.stride, interpolation,
+                           args.batch_chunks), 2)
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from capture import CAPTURE_MODES
+from clip_writer import ClipJob, ClipWriterPool
+from dvr import SegmentStore
+from backends import BACKENDS, default_model_path, load_backend
+from inference import OVERFLOW_POLICIES, BatchInferenceScheduler, DetectionQueue, is_shoplifting_confidence
+from inference_pool import InferenceProcessPool
+from ingestion import FRAME_HEADER, MODEL_FRAME_SIZE, IngestionManager
+from viewers import ViewerRegistry
+
+logger = logging.getLogger(__name__)
+
+SYNTHETIC_SOURCE = 'synthetic'
+SYNTHETIC_PATTERN_FRAMES = 16
+# The synthetic scene alternates between moving and still within this period
+SYNTHETIC_ACTIVITY_PERIOD = 10.0
+# Frames a V4L2 webcam driver typically queues for a reader that falls behind
+SYNTHETIC_DRIVER_BUFFERS = 4
+
+
+class SyntheticCapture:
+    # VideoCapture stand-in that behaves like a live camera: frames are exposed on a
+    # fixed clock whether or not anyone reads them, and, like a V4L2 driver, the last
+    # driver_buffers of them are queued until read, so a slow reader gets old frames.
+    # Each frame is a fresh copy of a cycling pattern (noise plus a moving block, so
+    # JPEG encoding does realistic work). The block only moves for the active
+    # fraction of each activity period, so the motion gate has still stretches to skip.
+    def __init__(self, width, height, fps, seed=0, active_fraction=1.0, driver_buffers=SYNTHETIC_DRIVER_BUFFERS):
+        self.fps = float(fps)
+        self.interval = 1.0 / self.fps
+        self.active_frames = int(round(SYNTHETIC_ACTIVITY_PERIOD * self.fps * min(max(active_fraction, 0.0), 1.0)))
+        self.period_frames = max(1, int(round(SYNTHETIC_ACTIVITY_PERIOD * self.fps)))
+        self.driver_buffers = max(1, int(driver_buffers))
+        rng = np.random.default_rng(seed)
+        base = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        block = max(8, min(width, height) // 6)
+        self.frames = []
+        for i in range(SYNTHETIC_PATTERN_FRAMES):
+            frame = base.copy()
+            x = (width - block) * i // SYNTHETIC_PATTERN_FRAMES
+            frame[height // 3:height // 3 + block, x:x + block] = (0, 0, 255)
+            self.frames.append(frame)
+        # Exposure clock: frame n is exposed at started + n * interval
+        self.started = None
+        self.started_wall = None
+        self.next_index = 0
+        self.grabbed = None
+        # Wall-clock exposure time of the last grabbed frame ("glass" time)
+        self.glass_time = None
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frames[0].shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frames[0].shape[0]
+        return 0.0
+
+    def set(self, prop, value):
+        return True
+
+    def grab(self):
+        if not self.opened:
+            return False
+        now = time.monotonic()
+        if self.started is None:
+            self.started, self.started_wall = now, time.time()
+        exposed = int((now - self.started) / self.interval)
+        if self.next_index > exposed:
+            time.sleep(self.started + self.next_index * self.interval - now)
+        elif exposed - self.next_index >= self.driver_buffers:
+            # The driver overwrote frames nobody read
+            self.next_index = exposed - self.driver_buffers + 1
+        self.grabbed = self.next_index
+        self.glass_time = self.started_wall + self.next_index * self.interval
+        self.next_index += 1
+        return True
+
+    def retrieve(self):
+        if self.grabbed is None:
+            return False, None
+        cycles, offset = divmod(self.grabbed, self.period_frames)
+        position = cycles * self.active_frames + min(offset, self.active_frames)
+        return True, self.frames[position % len(self.frames)].copy()
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.opened = False
+
+
+class StageRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.started = time.monotonic()
+
+    def observe(self, stage, stream_id, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.started = time.monotonic()
+
+    def summary(self):
+        with self.lock:
+            samples = {stage: np.asarray(values) for stage, values in self.samples.items()}
+            elapsed = time.monotonic() - self.started
+        return elapsed, {stage: summarize(values, elapsed) for stage, values in sorted(samples.items())}
+
+
+def summarize(values, elapsed):
+    if len(values) == 0:
+        return {'count': 0}
+    values_ms = values * 1000.0
+    return {
+        'count': int(len(values)),
+        'per_second': round(len(values) / elapsed, 2) if elapsed > 0 else None,
+        'mean_ms': round(float(values_ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(values_ms, 50)), 3),
+        'p99_ms': round(float(np.percentile(values_ms, 99)), 3),
+        'max_ms': round(float(values_ms.max()), 3),
+    }
+
+
+def summarize_drops(drop_counts):
+    totals = defaultdict(int)
+    for (_, reason), frames in drop_counts.items():
+        totals[reason] += frames
+    return dict(totals)
+
+
+def summarize_motion_gate(streams, seconds_per_frame):
+    passed = sum(stream['motion_gate']['passed_chunks'] for stream in streams)
+    skipped = sum(stream['motion_gate']['skipped_chunks'] for stream in streams)
+    skipped_frames = sum(stream['motion_gate']['skipped_frames'] for stream in streams)
+    return {
+        'passed_chunks': passed,
+        'skipped_chunks': skipped,
+        'skip_rate': round(skipped / (passed + skipped), 4) if passed + skipped else 0.0,
+        'skipped_frames': skipped_frames,
+        # Priced at the measured inference cost per encoded frame
+        'cpu_saved_seconds': round(skipped_frames * seconds_per_frame, 3),
+    }
+
+
+def peak_rss_bytes(children=False):
+    # children: the largest peak of any child process that has been waited for (the
+    # inference processes, once the pool has stopped), not their sum
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_benchmark(args):
+    model_path = args.model or default_model_path(args.backend)
+    model = None
+    if args.inference_processes:
+        # The model is only loaded in the inference processes
+        sequence_length = args.sequence_length
+    else:
+        model = load_backend(args.backend, model_path)
+        sequence_length = model.input_shape[1]
+
+    recorder = StageRecorder()
+    emitted = {'events': 0, 'bytes': 0, 'bytes_by_room': {}}
+    emitted_lock = threading.Lock()
+    rooms = {}
+
+    def emit(event, data=None, to=None, **kwargs):
+        # Stands in for socketio.emit; counts what would have gone to clients, and every
+        # simulated client in the room acknowledges the frame after its ack delay
+        size = len(data) if isinstance(data, (bytes, bytearray)) else 0
+        with emitted_lock:
+            emitted['events'] += 1
+            emitted['bytes'] += size
+            if to is not None:
+                emitted['bytes_by_room'][to] = emitted['bytes_by_room'].get(to, 0) + size
+            members = list(rooms.get(to, ()))
+        if not members:
+            return
+        if isinstance(data, (bytes, bytearray)):
+            _, _, sequence, camera_id, _ = FRAME_HEADER.unpack_from(data)
+            stream_id = f"bench-{camera_id}"
+        else:
+            sequence, stream_id = data['sequence'], data['stream_id']
+        for sid in members:
+            if ack_delays[sid]:
+                timer = threading.Timer(ack_delays[sid], viewers.ack, (sid, stream_id, sequence))
+                timer.daemon = True
+                timer.start()
+            else:
+                viewers.ack(sid, stream_id, sequence)
+
+    def enter_room(sid, room):
+        with emitted_lock:
+            rooms.setdefault(room, set()).add(sid)
+
+    def leave_room(sid, room):
+        with emitted_lock:
+            rooms.get(room, set()).discard(sid)
+
+    viewers = ViewerRegistry(enter_room=enter_room, leave_room=leave_room)
+    viewer_tiers = args.viewer_tiers.split(',')
+    viewer_ack_ms = [float(ms) for ms in args.viewer_ack_ms.split(',')]
+    ack_delays = {}
+    for i in range(args.viewers):
+        sid = f"bench-viewer-{i}"
+        ack_delays[sid] = viewer_ack_ms[i % len(viewer_ack_ms)] / 1000.0
+        viewers.connect(sid, viewer_tiers[i % len(viewer_tiers)].strip())
+        if args.viewer_streams == 'one':
+            viewers.subscribe(sid, [f"bench-{i % args.streams}"])
+
+    def capture_factory(source):
+        if source == SYNTHETIC_SOURCE:
+            return SyntheticCapture(args.width, args.height, args.fps, active_fraction=args.active_fraction,
+                                    driver_buffers=args.driver_buffers)
+        return cv2.VideoCapture(source)
+
+    def frame_timestamp(cap):
+        # Synthetic frames carry their exposure time, so latencies are measured from the glass
+        glass_time = getattr(cap, 'glass_time', None)
+        return time.time() if glass_time is None else glass_time
+
+    results = {'windows': 0, 'positive': 0}
+
+    def on_result(stream_id, confidence, captured_at):
+        results['windows'] += 1
+        if is_shoplifting_confidence(confidence):
+            results['positive'] += 1
+            recorder.observe('alert_latency', stream_id, time.time() - captured_at)
+
+    detection_queue = DetectionQueue(args.queue_capacity, args.queue_policy, window_length=sequence_length)
+    clip_dir = tempfile.mkdtemp(prefix='sld-bench-')
+    segment_store = None
+    if args.preroll_mode == 'dvr':
+        segment_store = SegmentStore(os.path.join(clip_dir, 'recordings'), args.segment_seconds)
+    ingestion = IngestionManager(emit, detection_queue, sequence_length, args.fps,
+                                 args.clip_seconds + args.post_roll_seconds, args.clip_interval > 0,
+                                 window_stride=args.stride or sequence_length // 2,
+                                 preroll_mode=args.preroll_mode, frame_transport=args.transport,
+                                 capture_factory=capture_factory, observe=recorder.observe,
+                                 resize_interpolation=args.interpolation,
+                                 motion_threshold=args.motion_threshold, motion_hold_seconds=args.motion_hold,
+                                 capture_mode=args.capture_mode, frame_timestamp=frame_timestamp,
+                                 encode_workers=args.encode_workers, viewers=viewers, segment_store=segment_store)
+    if args.inference_processes:
+        scheduler = InferenceProcessPool(detection_queue, args.backend, model_path, on_result, sequence_length,
+                                         MODEL_FRAME_SIZE[::-1] + (3,), processes=args.inference_processes,
+                                         max_batch_size=args.batch_size, max_wait=args.max_wait_ms / 1000.0,
+                                         observe=recorder.observe, max_age=args.max_age,
+                                         warmup_frames=args.stride or sequence_length // 2)
+        scheduler.start()
+        input_shapes = scheduler.wait_for('ready')
+        if any(shape[1] != sequence_length for shape in input_shapes):
+            scheduler.stop()
+            raise ValueError(f"Model windows are {input_shapes[0][1]} frames; pass --sequence-length {input_shapes[0][1]}")
+        scheduler.start_dispatching()
+    else:
+        scheduler = BatchInferenceScheduler(detection_queue, model.encode, model.head, on_result, sequence_length,
+                                            max_batch_size=args.batch_size, max_wait=args.max_wait_ms / 1000.0,
+                                            observe=recorder.observe, max_age=args.max_age)
+        scheduler.start()
+    clip_writer = ClipWriterPool(args.clip_workers, emit, observe=recorder.observe)
+    clip_writer.start()
+
+    source = SYNTHETIC_SOURCE if args.source == SYNTHETIC_SOURCE else os.path.abspath(args.source)
+    source_kind = 'webcam' if source == SYNTHETIC_SOURCE else 'uploaded'
+    for i in range(args.streams):
+        ingestion.start_stream(f"bench-{i}", source, source_kind, camera_id=i)
+
+    logger.info(f"Warming up for {args.warmup}s")
+    time.sleep(args.warmup)
+    recorder.reset()
+    depths = []
+    clips_submitted = 0
+    next_clip = time.monotonic() + args.clip_interval if args.clip_interval > 0 else None
+    deadline = time.monotonic() + args.duration
+    logger.info(f"Measuring {args.streams} stream(s) for {args.duration}s")
+    while time.monotonic() < deadline:
+        depths.append(detection_queue.qsize())
+        if next_clip is not None and time.monotonic() >= next_clip:
+            now = time.time()
+            for worker in ingestion.workers_snapshot():
+                clip_path = os.path.join(clip_dir, f"clip_{worker.stream_id}_{clips_submitted}.mp4")
+                clip_writer.submit(ClipJob(clips_submitted, worker.stream_id, worker.frame_buffer, now - args.clip_seconds,
+                                           now + args.post_roll_seconds, clip_path, worker.clip_fps()))
+                clips_submitted += 1
+            next_clip += args.clip_interval
+        time.sleep(args.sample_interval)
+
+    if clips_submitted:
+        # The last clips still wait for their post-roll, which the streams have to keep recording
+        clip_writer.join()
+    elapsed, stages = recorder.summary()
+    streams = [worker.stats() for worker in ingestion.workers_snapshot()]
+    ingestion.stop_all()
+    scheduler.stop()
+    scheduler.join(10.0)
+    clip_writer.stop()
+    recording = segment_store.stats() if segment_store is not None else None
+    shutil.rmtree(clip_dir, ignore_errors=True)
+    peak_rss = peak_rss_bytes()
+    peak_rss_children = peak_rss_bytes(children=True)
+    depths = np.asarray(depths) if depths else np.zeros(1)
+    return {
+        'config': {
+            'source': args.source,
+            'width': args.width,
+            'height': args.height,
+            'fps': args.fps,
+            'streams': args.streams,
+            'duration_seconds': args.duration,
+            'batch_size': args.batch_size,
+            'queue_capacity': args.queue_capacity,
+            'queue_policy': args.queue_policy,
+            'max_age_seconds': args.max_age,
+            'preroll_mode': args.preroll_mode,
+            'transport': args.transport,
+            'interpolation': args.interpolation,
+            'motion_threshold': args.motion_threshold,
+            'motion_hold_seconds': args.motion_hold,
+            'active_fraction': args.active_fraction,
+            'capture_mode': args.capture_mode,
+            'encode_workers': args.encode_workers,
+            'viewers': args.viewers,
+            'viewer_tiers': args.viewer_tiers,
+            'viewer_streams': args.viewer_streams,
+            'viewer_ack_ms': args.viewer_ack_ms,
+            'driver_buffers': args.driver_buffers,
+            'backend': args.backend,
+            'model': os.path.basename(model_path),
+            'inference_processes': args.inference_processes,
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'stages': stages,
+        'detection_queue_depth': {
+            'mean': round(float(depths.mean()), 2),
+            'p99': float(np.percentile(depths, 99)),
+            'max': int(depths.max()),
+        },
+        'streams': streams,
+        'inference': {
+            'batches': scheduler.batches_run,
+            'frames_encoded': scheduler.frames_encoded,
+            'windows': results['windows'],
+            'positive_windows': results['positive'],
+            'frames_dropped': summarize_drops(detection_queue.drop_counts()),
+            'seconds_per_frame': round(scheduler.seconds_per_frame(), 6),
+            'motion_gate': summarize_motion_gate(streams, scheduler.seconds_per_frame()),
+        },
+        'emitted': emitted,
+        'viewers': viewers.snapshot(),
+        'clips_written': stages.get('clip_write', {}).get('count', 0),
+        'recording': recording,
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1) if peak_rss else None,
+        'peak_rss_children_mb': round(peak_rss_children / (1024 * 1024), 1) if peak_rss_children else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure what the capture/inference pipeline sustains on this machine.")
+    parser.add_argument('--source', default=SYNTHETIC_SOURCE, help="'synthetic' or a video file looped at its native FPS")
+    parser.add_argument('--width', type=int, default=1280, help="Synthetic frame width")
+    parser.add_argument('--height', type=int, default=720, help="Synthetic frame height")
+    parser.add_argument('--fps', type=float, default=30.0, help="Synthetic source frame rate")
+    parser.add_argument('--streams', type=int, default=1, help="Concurrent capture streams")
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Seconds run before measuring (model graph tracing)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='keras', help="Inference backend")
+    parser.add_argument('--model', default=None, help="Keras model file or tflite/onnx export prefix")
+    parser.add_argument('--inference-processes', type=int, default=0,
+                        help="Run the model in this many worker processes (0: on a thread in the benchmark process)")
+    parser.add_argument('--sequence-length', type=int, default=20, help="Model window length (with --inference-processes)")
+    parser.add_argument('--batch-size', type=int, default=8, help="Inference scheduler max batch size")
+    parser.add_argument('--max-wait-ms', type=float, default=50.0, help="Inference scheduler batching window")
+    parser.add_argument('--queue-capacity', type=int, default=32, help="Detection queue capacity in chunks (0: unbounded)")
+    parser.add_argument('--queue-policy', choices=OVERFLOW_POLICIES, default='drop_oldest')
+    parser.add_argument('--max-age', type=float, default=2.0, help="Drop detection chunks older than this (0: never)")
+    parser.add_argument('--stride', type=int, default=None, help="Frames between detection windows (default: half a window)")
+    parser.add_argument('--interpolation', choices=('linear', 'area'), default='linear', help="Model input resize filter")
+    parser.add_argument('--motion-threshold', type=float, default=0.0,
+                        help="Skip chunks with a smaller changed-pixel fraction (0: gate off)")
+    parser.add_argument('--motion-hold', type=float, default=2.0, help="Seconds the motion gate stays open after activity")
+    parser.add_argument('--active-fraction', type=float, default=1.0,
+                        help="Fraction of each synthetic activity period in which the scene moves")
+    parser.add_argument('--capture-mode', choices=CAPTURE_MODES, default='thread',
+                        help="'thread': grab thread serving the newest frame; 'inline': read in the processing loop")
+    parser.add_argument('--driver-buffers', type=int, default=SYNTHETIC_DRIVER_BUFFERS,
+                        help="Frames the synthetic camera queues for a slow reader")
+    parser.add_argument('--encode-workers', type=int, default=2, help="Preview JPEG encoder threads (0: on the capture thread)")
+    parser.add_argument('--viewers', type=int, default=1, help="Simulated preview clients (0: nobody watching)")
+    parser.add_argument('--viewer-tiers', default='full',
+                        help="Comma-separated preview tiers (thumb, sd, full) assigned to the simulated clients in turn")
+    parser.add_argument('--viewer-ack-ms', default='0',
+                        help="Comma-separated delays before the simulated clients acknowledge a frame, assigned in turn")
+    parser.add_argument('--viewer-streams', choices=('all', 'one'), default='all',
+                        help="Whether each simulated client watches every stream or only one (assigned in turn)")
+    parser.add_argument('--preroll-mode', choices=('raw', 'jpeg', 'dvr'), default='jpeg')
+    parser.add_argument('--segment-seconds', type=float, default=10.0, help="Recording segment length (dvr pre-roll mode)")
+    parser.add_argument('--transport', choices=('binary', 'base64'), default='binary')
+    parser.add_argument('--clip-interval', type=float, default=0.0, help="Write a clip per stream every N seconds (0: off)")
+    parser.add_argument('--clip-seconds', type=float, default=6.0, help="Clip pre-roll length")
+    parser.add_argument('--post-roll-seconds', type=float, default=3.0, help="Clip post-roll length")
+    parser.add_argument('--clip-workers', type=int, default=2, help="Clip writer threads")
+    parser.add_argument('--sample-interval', type=float, default=0.05, help="Queue depth sampling period")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    report = run_benchmark(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
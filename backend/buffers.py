@@ -0,0 +1,140 @@
+import cv2
+import threading
+import logging
+from collections import deque
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRingBuffer:
+    # Fixed-capacity pre-roll backed by one contiguous uint8 array. Each slot keeps
+    # the frame's capture timestamp and the write sequence that filled it, so readers
+    # can copy frames outside the lock and discard any slot the writer reused meanwhile.
+    def __init__(self, max_frames, memory_budget_bytes):
+        self.max_frames = max(1, int(max_frames))
+        self.memory_budget_bytes = int(memory_budget_bytes)
+        self.lock = threading.Lock()
+        self.frames = None
+        self.timestamps = None
+        self.slot_seq = None
+        self.capacity = 0
+        self.write_seq = 0
+
+    def _allocate(self, frame):
+        frame_bytes = frame.nbytes
+        capacity = min(self.max_frames, self.memory_budget_bytes // frame_bytes)
+        if capacity < self.max_frames:
+            logger.warning(f"Pre-roll capped at {capacity} of {self.max_frames} frames by the "
+                           f"{self.memory_budget_bytes // (1024 * 1024)}MB memory budget")
+        self.capacity = max(1, capacity)
+        self.frames = np.empty((self.capacity,) + frame.shape, dtype=np.uint8)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.slot_seq = np.full(self.capacity, -1, dtype=np.int64)
+        self.write_seq = 0
+
+    def append(self, frame, timestamp):
+        with self.lock:
+            if self.frames is None or self.frames.shape[1:] != frame.shape:
+                self._allocate(frame)
+            slot = self.write_seq % self.capacity
+            self.slot_seq[slot] = -1
+            np.copyto(self.frames[slot], frame)
+            self.timestamps[slot] = timestamp
+            self.slot_seq[slot] = self.write_seq
+            self.write_seq += 1
+
+    def clear(self):
+        with self.lock:
+            self.write_seq = 0
+            if self.slot_seq is not None:
+                self.slot_seq.fill(-1)
+
+    def resize(self, max_frames):
+        with self.lock:
+            max_frames = max(1, int(max_frames))
+            if max_frames != self.max_frames:
+                self.max_frames = max_frames
+                self.frames = None
+                self.timestamps = None
+                self.slot_seq = None
+                self.capacity = 0
+                self.write_seq = 0
+
+    def __len__(self):
+        with self.lock:
+            return min(self.write_seq, self.capacity)
+
+    def iter_range(self, start_time, end_time):
+        # Yields (timestamp, frame copy) in capture order for start_time <= t <= end_time.
+        # Only the slot indices are taken under the lock; each frame is copied afterwards.
+        with self.lock:
+            if self.frames is None or self.write_seq == 0:
+                return
+            frames, timestamps, slot_seq = self.frames, self.timestamps, self.slot_seq
+            first_seq = max(0, self.write_seq - self.capacity)
+            seqs = np.arange(first_seq, self.write_seq)
+            slots = seqs % self.capacity
+            in_range = (timestamps[slots] >= start_time) & (timestamps[slots] <= end_time)
+            selected = list(zip(seqs[in_range].tolist(), slots[in_range].tolist()))
+        for seq, slot in selected:
+            frame = frames[slot].copy()
+            timestamp = float(timestamps[slot])
+            if slot_seq[slot] != seq:
+                # Overwritten by the writer while we were copying
+                continue
+            yield timestamp, frame
+
+
+class JpegRingBuffer:
+    # Compressed pre-roll holding the JPEG bytes already encoded for the live stream.
+    # Bounded by frame count and by total encoded bytes; frames are decoded only when
+    # a clip is written.
+    def __init__(self, max_frames, memory_budget_bytes):
+        self.max_frames = max(1, int(max_frames))
+        self.memory_budget_bytes = int(memory_budget_bytes)
+        self.lock = threading.Lock()
+        self.entries = deque()
+        self.total_bytes = 0
+        self.budget_frames = None
+
+    def append(self, data, timestamp):
+        with self.lock:
+            self.entries.append((timestamp, data))
+            self.total_bytes += len(data)
+            while len(self.entries) > self.max_frames:
+                self.total_bytes -= len(self.entries.popleft()[1])
+            if self.total_bytes > self.memory_budget_bytes:
+                while self.total_bytes > self.memory_budget_bytes and len(self.entries) > 1:
+                    self.total_bytes -= len(self.entries.popleft()[1])
+                if self.budget_frames is None:
+                    logger.warning(f"Compressed pre-roll capped at {len(self.entries)} of {self.max_frames} frames by the "
+                                   f"{self.memory_budget_bytes // (1024 * 1024)}MB memory budget")
+                self.budget_frames = len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.budget_frames = None
+
+    def resize(self, max_frames):
+        with self.lock:
+            self.max_frames = max(1, int(max_frames))
+            self.budget_frames = None
+            while len(self.entries) > self.max_frames:
+                self.total_bytes -= len(self.entries.popleft()[1])
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def iter_range(self, start_time, end_time):
+        with self.lock:
+            selected = [(timestamp, data) for timestamp, data in self.entries if start_time <= timestamp <= end_time]
+        for timestamp, data in selected:
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                logger.warning("Skipping undecodable pre-roll frame")
+                continue
+            yield timestamp, frame
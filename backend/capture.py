@@ -0,0 +1,159 @@
+import cv2
+import threading
+import time
+import logging
+from pacing import FramePacer
+
+logger = logging.getLogger(__name__)
+
+# 'thread': a grab thread drains the device and hands over only the newest frame
+# 'inline': the consumer reads on its own thread (frames queue up in the driver while it works)
+CAPTURE_MODES = ('thread', 'inline')
+READ_RETRY_DELAY = 0.1
+
+
+def wall_clock_timestamp(cap):
+    return time.time()
+
+
+def _ignore_timing(stage, stream_id, seconds):
+    pass
+
+
+class InlineCapture:
+    # Frames are read by the consumer between its own per-frame work. A live device
+    # keeps capturing meanwhile, so when the consumer is slower than the source the
+    # driver's buffer fills and read() returns frames that are already old.
+    def __init__(self, cap, stream_id, fps, paced, loop, timestamp=None, observe=None):
+        self.cap = cap
+        self.stream_id = stream_id
+        self.loop = loop
+        self.timestamp = timestamp or wall_clock_timestamp
+        self.observe = observe or _ignore_timing
+        self.pacer = FramePacer(fps, sleep_to_deadline=paced)
+        self.frames_read = 0
+
+    def start(self):
+        pass
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def next_frame(self, timeout=None):
+        # Returns (frame, captured_at, frames skipped since the previous frame) or None
+        skipped = 0
+        for _ in range(self.pacer.wait()):
+            if not self.cap.grab():
+                break
+            skipped += 1
+        t0 = time.perf_counter()
+        ret, frame = self.cap.read()
+        self.observe('capture', self.stream_id, time.perf_counter() - t0)
+        if not ret:
+            if self.loop:
+                logger.info(f"[{self.stream_id}] Reached end of uploaded video, looping back")
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            else:
+                logger.warning(f"[{self.stream_id}] Failed to read frame. Retrying...")
+                time.sleep(READ_RETRY_DELAY)
+            return None
+        self.frames_read += 1
+        return frame, self.timestamp(self.cap), skipped
+
+    def close(self):
+        self.cap.release()
+
+    def stats(self):
+        return {'capture_mode': 'inline', 'frames_read': self.frames_read}
+
+
+class FrameGrabber(threading.Thread):
+    # Owns the capture device: grabs continuously so the driver never queues frames,
+    # retrieves each one and keeps only the newest with its timestamp. The consumer
+    # takes frames at its own rate; frames it was too slow for are overwritten and
+    # reported as skipped. Files are played at their native rate.
+    def __init__(self, cap, stream_id, fps, paced, loop, timestamp=None, observe=None):
+        super().__init__(name=f"grab-{stream_id}", daemon=True)
+        self.cap = cap
+        self.stream_id = stream_id
+        self.loop = loop
+        self.timestamp = timestamp or wall_clock_timestamp
+        self.observe = observe or _ignore_timing
+        self.pacer = FramePacer(fps) if paced else None
+        self.condition = threading.Condition()
+        self.frame = None
+        self.captured_at = None
+        # Frames produced (including ones skipped while pacing) and the last one handed over
+        self.sequence = 0
+        self.consumed = 0
+        self.frames_read = 0
+        self._stopping = False
+
+    def is_opened(self):
+        return self.is_alive() or not self._stopping
+
+    def run(self):
+        try:
+            while not self._stopping:
+                skipped = 0
+                if self.pacer is not None:
+                    for _ in range(self.pacer.wait()):
+                        if not self.cap.grab():
+                            break
+                        skipped += 1
+                t0 = time.perf_counter()
+                ret = self.cap.grab()
+                if ret:
+                    ret, frame = self.cap.retrieve()
+                self.observe('capture', self.stream_id, time.perf_counter() - t0)
+                if not ret:
+                    if self.loop:
+                        logger.info(f"[{self.stream_id}] Reached end of uploaded video, looping back")
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    else:
+                        logger.warning(f"[{self.stream_id}] Failed to read frame. Retrying...")
+                        time.sleep(READ_RETRY_DELAY)
+                    continue
+                captured_at = self.timestamp(self.cap)
+                with self.condition:
+                    self.frame = frame
+                    self.captured_at = captured_at
+                    self.sequence += skipped + 1
+                    self.frames_read += 1
+                    self.condition.notify_all()
+        except Exception as e:
+            logger.error(f"[{self.stream_id}] Frame grabber error: {e}")
+        finally:
+            # Released here rather than by the consumer, so it never races a grab() in progress
+            self.cap.release()
+            with self.condition:
+                self._stopping = True
+                self.condition.notify_all()
+
+    def next_frame(self, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > self.consumed or self._stopping, timeout)
+            if self.sequence <= self.consumed:
+                return None
+            skipped = self.sequence - self.consumed - 1
+            self.consumed = self.sequence
+            # Handed over, not copied: the next retrieve() allocates a new frame
+            frame, self.frame = self.frame, None
+            return frame, self.captured_at, skipped
+
+    def close(self, timeout=2.0):
+        with self.condition:
+            self._stopping = True
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+
+    def stats(self):
+        return {'capture_mode': 'thread', 'frames_read': self.frames_read}
+
+
+def open_frame_source(mode, cap, stream_id, fps, paced, loop, timestamp=None, observe=None):
+    source_class = InlineCapture if mode == 'inline' else FrameGrabber
+    source = source_class(cap, stream_id, fps, paced, loop, timestamp=timestamp, observe=observe)
+    source.start()
+    return source
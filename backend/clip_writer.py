@@ -0,0 +1,163 @@
+import cv2
+import heapq
+import itertools
+import os
+import threading
+import time
+import logging
+from queue import Queue
+
+logger = logging.getLogger(__name__)
+
+
+class ClipJob:
+    def __init__(self, alert_id, stream_id, preroll, start_time, end_time, clip_path, frame_rate, on_complete=None):
+        self.alert_id = alert_id
+        self.stream_id = stream_id
+        self.preroll = preroll
+        self.start_time = start_time
+        self.end_time = end_time
+        self.clip_path = clip_path
+        self.frame_rate = frame_rate
+        self.on_complete = on_complete
+        self.clip_id = None
+        self.frames_written = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.size = 0
+
+    @property
+    def duration(self):
+        if self.first_timestamp is None:
+            return 0.0
+        return max(self.last_timestamp - self.first_timestamp, 1.0 / self.frame_rate)
+
+    def to_event(self):
+        return {
+            'alert_id': self.alert_id,
+            'stream_id': self.stream_id,
+            'frames_written': self.frames_written,
+            'file_path': self.clip_path,
+        }
+
+
+class ClipWriterPool:
+    # Jobs whose end time (the post-roll) is still ahead wait on a timer thread while the
+    # capture worker keeps recording; only jobs ready to encode take a writer thread.
+    def __init__(self, num_workers, emit, progress_interval=30, observe=None):
+        self.num_workers = max(1, int(num_workers))
+        self.emit = emit
+        self.progress_interval = progress_interval
+        # observe(stage, stream_id, seconds): 'clip_write' time spent encoding, excluding the post-roll wait
+        self.observe = observe
+        self.jobs = Queue()
+        self.threads = []
+        self.recording = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self._stopping = False
+
+    def start(self):
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"clip-writer-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        threading.Thread(target=self._wait_post_roll, name="clip-post-roll", daemon=True).start()
+        logger.info(f"Started {self.num_workers} clip writer(s)")
+
+    def submit(self, job):
+        if job.end_time > time.time():
+            with self.condition:
+                heapq.heappush(self.recording, (job.end_time, next(self.counter), job))
+                self.condition.notify()
+            self.emit('clip_progress', dict(job.to_event(), state='recording'))
+            return
+        self.jobs.put(job)
+        self.emit('clip_progress', dict(job.to_event(), state='queued'))
+
+    def pending(self):
+        with self.condition:
+            return self.jobs.qsize() + len(self.recording)
+
+    def _wait_post_roll(self):
+        while True:
+            with self.condition:
+                while not self._stopping and (not self.recording or self.recording[0][0] > time.time()):
+                    self.condition.wait(self.recording[0][0] - time.time() if self.recording else None)
+                if self._stopping:
+                    break
+                _, _, job = heapq.heappop(self.recording)
+                # Queued under the lock, so join() always finds the job in one place or the other
+                self.jobs.put(job)
+            self.emit('clip_progress', dict(job.to_event(), state='queued'))
+
+    def join(self):
+        # Returns once every submitted job, including those still recording, is written
+        with self.condition:
+            while self.recording:
+                self.condition.wait(0.1)
+        self.jobs.join()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                self._finish(job)
+            finally:
+                self.jobs.task_done()
+
+    def _finish(self, job):
+        ok = False
+        try:
+            ok = self._write(job)
+        except Exception as e:
+            logger.error(f"Clip writer error for alert {job.alert_id}: {e}")
+        if ok:
+            self.emit('clip_completed', dict(job.to_event(), duration=job.duration, size=job.size))
+            logger.info(f"Clip saved: {job.clip_path} ({job.size} bytes)")
+        else:
+            self.emit('clip_failed', job.to_event())
+        if job.on_complete:
+            try:
+                job.on_complete(job, ok)
+            except Exception as e:
+                logger.error(f"Clip completion handler error for alert {job.alert_id}: {e}")
+
+    def _write(self, job):
+        self.emit('clip_progress', dict(job.to_event(), state='encoding'))
+        started = time.perf_counter()
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = None
+        try:
+            for frame_ts, frame in job.preroll.iter_range(job.start_time, job.end_time):
+                if out is None:
+                    frame_size = (frame.shape[1], frame.shape[0])
+                    out = cv2.VideoWriter(job.clip_path, fourcc, job.frame_rate, frame_size)
+                    job.first_timestamp = frame_ts
+                elif (frame.shape[1], frame.shape[0]) != frame_size:
+                    # The source changed resolution mid-clip; VideoWriter drops frames of another size
+                    frame = cv2.resize(frame, frame_size)
+                out.write(frame)
+                job.last_timestamp = frame_ts
+                job.frames_written += 1
+                if job.frames_written % self.progress_interval == 0:
+                    self.emit('clip_progress', dict(job.to_event(), state='encoding'))
+        finally:
+            if out is not None:
+                out.release()
+            if self.observe:
+                self.observe('clip_write', job.stream_id, time.perf_counter() - started)
+        if out is None:
+            logger.info(f"Clip not captured for alert {job.alert_id}: no buffered frames in range.")
+            return False
+        job.size = os.path.getsize(job.clip_path) if os.path.exists(job.clip_path) else 0
+        return job.size > 0
+
+    def stop(self):
+        with self.condition:
+            self._stopping = True
+            self.condition.notify()
+        for _ in self.threads:
+            self.jobs.put(None)
@@ -0,0 +1,261 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from backends import DEFAULT_EXPORT_PREFIX, EXPORT_EXTENSIONS, export_paths, load_backend
+from inference import DEFAULT_MODEL_PATH, is_shoplifting_confidence, split_lrcn
+
+logger = logging.getLogger(__name__)
+
+FRAME_SIZE = (64, 64)
+
+
+def load_windows(paths, sequence_length, max_windows, stride=None):
+    # Consecutive-frame windows from the given videos, preprocessed like the live
+    # pipeline. Used both as the int8 calibration set and for the comparison report.
+    stride = stride or sequence_length
+    windows = []
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            logger.warning(f"Skipping unreadable video {path}")
+            continue
+        frames = []
+        while len(windows) < max_windows:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(frame, FRAME_SIZE).astype(np.float32) / 255.0)
+            if len(frames) == sequence_length:
+                windows.append(np.stack(frames))
+                frames = frames[stride:] if stride < sequence_length else []
+        cap.release()
+        if len(windows) >= max_windows:
+            break
+    if not windows:
+        return None
+    return np.stack(windows)
+
+
+def _unrolled(part):
+    # TFLite has no builtin kernel for the LSTM's loop over a dynamic batch (its tensor-list
+    # ops need the Flex delegate, which tflite_runtime does not ship). The window length
+    # is fixed, so recurrent layers are exported unrolled into plain matmuls instead.
+    import keras
+
+    def clone(layer):
+        config = layer.get_config()
+        if 'unroll' in config:
+            config['unroll'] = True
+        return layer.__class__.from_config(config)
+
+    unrolled = keras.models.clone_model(part, clone_function=clone)
+    unrolled.set_weights(part.get_weights())
+    return unrolled
+
+
+def export_tflite(part, input_shape, path, calibration=None):
+    # int8: weights and activations quantized from the calibration samples; ops with no
+    # int8 kernel stay float. Inputs and outputs stay float32 so the backend feeds both
+    # variants the same way. The batch dimension stays dynamic.
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(_unrolled(part))
+    if calibration is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample[np.newaxis]] for sample in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    # Converted before the file is opened, so a failed conversion leaves no empty model behind
+    model = converter.convert()
+    with open(path, 'wb') as f:
+        f.write(model)
+
+
+def export_onnx(part, input_shape, path, calibration=None):
+    float_path = path if calibration is None else path + '.float'
+    # Keras only exports models that have been called; the split parts never were
+    part(np.zeros((1,) + tuple(input_shape), dtype=np.float32))
+    try:
+        part.export(float_path, format='onnx')
+    except (TypeError, ValueError):
+        # Keras releases without ONNX export
+        import tensorflow as tf
+        import tf2onnx
+        spec = (tf.TensorSpec((None,) + tuple(input_shape), tf.float32, name='input'),)
+        tf2onnx.convert.from_keras(part, input_signature=spec, opset=13, output_path=float_path)
+    if calibration is None:
+        return
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    import onnxruntime
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.input_name = onnxruntime.InferenceSession(float_path).get_inputs()[0].name
+            self.samples = iter(calibration)
+
+        def get_next(self):
+            sample = next(self.samples, None)
+            return None if sample is None else {self.input_name: sample[np.newaxis]}
+
+    quantize_static(float_path, path, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+    os.remove(float_path)
+
+
+EXPORTERS = {'tflite': export_tflite, 'onnx': export_onnx}
+# Packages each format needs beyond requirements.txt (see requirements-optional.txt)
+EXPORT_REQUIREMENTS = {'tflite': (), 'onnx': ('onnx', 'tf2onnx', 'onnxruntime')}
+
+
+def missing_packages(backend):
+    return [name for name in EXPORT_REQUIREMENTS[backend] if importlib.util.find_spec(name) is None]
+
+
+def convert(model, prefix, formats, calibration_windows=None):
+    # Exports the frame encoder and temporal head separately so every backend keeps the
+    # encode-once / sliding-window inference path. Returns {variant: prefix}.
+    parts = split_lrcn(model)
+    if parts is None:
+        raise ValueError("Model is not a TimeDistributed CNN followed by a temporal head; cannot export")
+    encoder, head = parts
+    frame_shape = tuple(model.input_shape[2:])
+    head_shape = tuple(head.input_shape[1:])
+    variants = {}
+    for backend in formats:
+        exporter = EXPORTERS[backend]
+        encoder_path, head_path = export_paths(prefix, backend)
+        exporter(encoder, frame_shape, encoder_path)
+        exporter(head, head_shape, head_path)
+        variants[backend] = prefix
+        logger.info(f"Exported {backend} model to {encoder_path} / {head_path}")
+        if calibration_windows is not None:
+            int8_prefix = f"{prefix}.int8"
+            frames = calibration_windows.reshape((-1,) + frame_shape)
+            embeddings = np.asarray(encoder.predict(frames, verbose=0)).reshape(
+                (len(calibration_windows),) + head_shape)
+            encoder_path, head_path = export_paths(int8_prefix, backend)
+            exporter(encoder, frame_shape, encoder_path, calibration=frames)
+            exporter(head, head_shape, head_path, calibration=embeddings)
+            variants[f"{backend}.int8"] = int8_prefix
+            logger.info(f"Exported int8 {backend} model to {encoder_path} / {head_path}")
+    return variants
+
+
+def measure(backend, windows, batch_size, repeats):
+    latencies = []
+    confidences = []
+    for _ in range(repeats):
+        confidences = []
+        for i in range(0, len(windows), batch_size):
+            batch = list(windows[i:i + batch_size])
+            started = time.perf_counter()
+            confidences.extend(backend.predict(batch))
+            latencies.append((time.perf_counter() - started) / len(batch))
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return np.asarray(confidences), {
+        'ms_per_window_p50': round(float(np.percentile(latencies_ms, 50)), 3),
+        'ms_per_window_p99': round(float(np.percentile(latencies_ms, 99)), 3),
+        'ms_per_window_mean': round(float(latencies_ms.mean()), 3),
+    }
+
+
+def file_size(backend_name, path):
+    if backend_name == 'keras':
+        return os.path.getsize(path)
+    return sum(os.path.getsize(p) for p in export_paths(path, backend_name))
+
+
+def compare(keras_path, variants, windows, batch_size=8, repeats=3):
+    # Accuracy is agreement with the Keras baseline on the same windows (the shipped
+    # model has no labelled evaluation set); latency is per window at the given batch size.
+    baseline = load_backend('keras', keras_path)
+    baseline.predict(list(windows[:batch_size]))
+    reference, latency = measure(baseline, windows, batch_size, repeats)
+    report = {'keras': dict(latency, size_bytes=file_size('keras', keras_path))}
+    for variant, prefix in variants.items():
+        backend_name = variant.split('.')[0]
+        backend = load_backend(backend_name, prefix)
+        backend.predict(list(windows[:batch_size]))
+        confidences, latency = measure(backend, windows, batch_size, repeats)
+        errors = np.abs(confidences - reference)
+        agreement = np.mean([is_shoplifting_confidence(a) == is_shoplifting_confidence(b)
+                             for a, b in zip(confidences, reference)])
+        report[variant] = dict(latency, size_bytes=file_size(backend_name, prefix),
+                               speedup=round(report['keras']['ms_per_window_mean'] / latency['ms_per_window_mean'], 2),
+                               mean_abs_error=round(float(errors.mean()), 5),
+                               max_abs_error=round(float(errors.max()), 5),
+                               decision_agreement=round(float(agreement), 4))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the LRCN model to TFLite/ONNX, optionally int8, and compare it with Keras.")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="Keras model file")
+    parser.add_argument('--output-prefix', default=DEFAULT_EXPORT_PREFIX, help="Exports are written as <prefix>[.int8].{encoder,head}.<ext>")
+    parser.add_argument('--format', choices=sorted(EXPORT_EXTENSIONS) + ['all'], default='all')
+    parser.add_argument('--int8', action='store_true', help="Also write int8 models calibrated on --calibration")
+    parser.add_argument('--calibration', nargs='*', default=[], help="Videos sampled for int8 calibration")
+    parser.add_argument('--calibration-windows', type=int, default=200, help="Windows sampled for calibration")
+    parser.add_argument('--eval', nargs='*', default=None, help="Videos for the comparison report (default: calibration videos)")
+    parser.add_argument('--eval-windows', type=int, default=200, help="Windows used for the comparison report")
+    parser.add_argument('--batch-size', type=int, default=8, help="Windows per call when measuring latency")
+    parser.add_argument('--report', help="Write the comparison report JSON here (default: <prefix>.report.json)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    formats = []
+    for backend in (sorted(EXPORT_EXTENSIONS) if args.format == 'all' else [args.format]):
+        missing = missing_packages(backend)
+        if not missing:
+            formats.append(backend)
+        elif args.format == 'all':
+            logger.warning(f"Skipping {backend} export: {', '.join(missing)} not installed")
+        else:
+            parser.error(f"{backend} export needs {', '.join(missing)} (pip install -r requirements-optional.txt)")
+
+    from keras.models import load_model
+    model = load_model(args.model)
+    sequence_length = model.input_shape[1]
+
+    calibration = None
+    if args.int8:
+        calibration = load_windows(args.calibration, sequence_length, args.calibration_windows, stride=sequence_length // 2)
+        if calibration is None:
+            parser.error("--int8 needs --calibration videos with at least one full window")
+        logger.info(f"Calibrating on {len(calibration)} windows")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output_prefix)), exist_ok=True)
+    variants = convert(model, args.output_prefix, formats, calibration)
+
+    eval_windows = load_windows(args.eval if args.eval is not None else args.calibration, sequence_length,
+                                args.eval_windows)
+    eval_source = 'video'
+    if eval_windows is None:
+        # Latency is still meaningful on noise; agreement figures are not
+        logger.warning("No evaluation videos given; comparing on random windows")
+        eval_windows = np.random.default_rng(0).random((args.eval_windows,) + tuple(model.input_shape[1:]), dtype=np.float32)
+        eval_source = 'random'
+    report = {
+        'model': os.path.basename(args.model),
+        'eval_windows': len(eval_windows),
+        'eval_source': eval_source,
+        'batch_size': args.batch_size,
+        'variants': compare(args.model, variants, eval_windows, args.batch_size),
+    }
+    report_path = args.report or f"{args.output_prefix}.report.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    for variant, row in report['variants'].items():
+        logger.info(f"{variant:12s} {row['ms_per_window_mean']:8.3f} ms/window  {row['size_bytes'] / 1e6:7.2f} MB"
+                    + (f"  agreement {row['decision_agreement']:.2%}  MAE {row['mean_abs_error']}" if variant != 'keras' else ''))
+    logger.info(f"Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+# Connections kept open at most; callers wait for one to be returned beyond that
+DEFAULT_MAX_CONNECTIONS = 8
+
+
+def _lastrowid(cursor, query):
+    return cursor.lastrowid if query.lstrip().upper().startswith('INSERT') else None
+
+
+def _ignore_timing(operation, seconds):
+    pass
+
+
+class Transaction:
+    def __init__(self, conn, observe=_ignore_timing):
+        self.conn = conn
+        self.observe = observe
+        self.commit_callbacks = []
+
+    def execute(self, query, params=()):
+        started = time.perf_counter()
+        cursor = self.conn.execute(query, params)
+        self.observe('execute', time.perf_counter() - started)
+        return _lastrowid(cursor, query)
+
+    def fetch(self, query, params=()):
+        started = time.perf_counter()
+        rows = self.conn.execute(query, params).fetchall()
+        self.observe('fetch', time.perf_counter() - started)
+        return rows
+
+    def on_commit(self, callback):
+        self.commit_callbacks.append(callback)
+
+
+class Database:
+    # A bounded pool of long-lived connections (WAL lets readers and the single writer
+    # proceed concurrently), checked out per statement or per transaction() unit of work.
+    # Server threads are short-lived (one per request or socket event), so connections
+    # belong to the pool rather than to a thread.
+    def __init__(self, path, busy_timeout_ms=5000, observe=None, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        # observe(operation, seconds) for 'execute', 'fetch' and 'commit' (BEGIN IMMEDIATE through COMMIT)
+        self.observe = observe or _ignore_timing
+        self.max_connections = max(1, int(max_connections))
+        # The transaction open on this thread, whose connection its statements use
+        self.local = threading.local()
+        self.idle = []
+        self.opened = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def _open(self):
+        # isolation_level=None: statements autocommit unless inside transaction()
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0, isolation_level=None,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        logger.debug(f"Opened SQLite connection {self.opened}/{self.max_connections}")
+        return conn
+
+    def _checkout(self):
+        with self.condition:
+            while not self.idle and self.opened >= self.max_connections:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        try:
+            return self._open()
+        except BaseException:
+            with self.condition:
+                self.opened -= 1
+                self.condition.notify()
+            raise
+
+    def _checkin(self, conn):
+        with self.condition:
+            if not self.closed:
+                self.idle.append(conn)
+                self.condition.notify()
+                return
+            self.opened -= 1
+        conn.close()
+
+    @contextmanager
+    def _connection(self):
+        tx = getattr(self.local, 'transaction', None)
+        if tx is not None:
+            yield tx.conn
+            return
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    def execute(self, query, params=()):
+        with self._connection() as conn:
+            started = time.perf_counter()
+            cursor = conn.execute(query, params)
+            self.observe('execute', time.perf_counter() - started)
+            return _lastrowid(cursor, query)
+
+    def fetch(self, query, params=()):
+        with self._connection() as conn:
+            started = time.perf_counter()
+            rows = conn.execute(query, params).fetchall()
+            self.observe('fetch', time.perf_counter() - started)
+            return rows
+
+    @contextmanager
+    def transaction(self):
+        outer = getattr(self.local, 'transaction', None)
+        if outer is not None:
+            # Nested unit of work joins the enclosing transaction
+            yield outer
+            return
+        conn = self._checkout()
+        tx = Transaction(conn, self.observe)
+        self.local.transaction = tx
+        try:
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield tx
+                conn.execute("COMMIT")
+                self.observe('commit', time.perf_counter() - started)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            self.local.transaction = None
+            self._checkin(conn)
+        for callback in tx.commit_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Post-commit callback error: {e}")
+
+    def stats(self):
+        with self.condition:
+            return {'open': self.opened, 'idle': len(self.idle)}
+
+    def close_all(self):
+        # Idle connections close now, checked-out ones when they are returned
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
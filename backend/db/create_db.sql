@@ -1,9 +1,10 @@
--- Cameras table (unchanged)
+-- Cameras table (added 'source_uri': device index, RTSP/HTTP URL or file path opened by the capture worker)
 CREATE TABLE Cameras (
     camera_id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL UNIQUE,
     location TEXT,
-    status TEXT DEFAULT 'active' CHECK (status IN ('active', 'inactive'))
+    status TEXT DEFAULT 'active' CHECK (status IN ('active', 'inactive')),
+    source_uri TEXT
 );
 
 -- Alerts table (added 'read', 'is_false_positive', and notes length constraint)
@@ -0,0 +1,309 @@
+import cv2
+import os
+import struct
+import threading
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Each record: capture time f64, JPEG length u32, then the JPEG bytes
+RECORD_HEADER = struct.Struct('<dI')
+# Finished segments are named <first ms>_<last ms>_<frames>.seg, so the index is rebuilt
+# from a directory listing; the segment being written is <first ms>.part
+SEGMENT_SUFFIX = '.seg'
+PARTIAL_SUFFIX = '.part'
+DEFAULT_SEGMENT_SECONDS = 10.0
+# Seconds between retention passes, so segments also expire while none is being finished
+RETENTION_INTERVAL = 60.0
+
+
+def _segment_name(start_time, end_time, frames):
+    return f"{int(start_time * 1000)}_{int(end_time * 1000)}_{frames}{SEGMENT_SUFFIX}"
+
+
+def _scan_records(path):
+    # (first timestamp, last timestamp, frames, bytes of complete records) of a segment file
+    first = last = None
+    frames = 0
+    valid = 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            timestamp, length = RECORD_HEADER.unpack(header)
+            if len(f.read(length)) < length:
+                break
+            if first is None:
+                first = timestamp
+            last = timestamp
+            frames += 1
+            valid = f.tell()
+    return first, last, frames, valid
+
+
+def _read_records(f, start_time, end_time, limit=None):
+    # Yields (timestamp, JPEG bytes) for start_time <= t <= end_time, reading at most limit bytes
+    while limit is None or f.tell() + RECORD_HEADER.size <= limit:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            break
+        timestamp, length = RECORD_HEADER.unpack(header)
+        if timestamp > end_time:
+            break
+        if timestamp < start_time:
+            f.seek(length, os.SEEK_CUR)
+            continue
+        data = f.read(length)
+        if len(data) < length:
+            break
+        yield timestamp, data
+
+
+class Segment:
+    def __init__(self, path, start_time, end_time, frames, size):
+        self.path = path
+        self.start_time = start_time
+        self.end_time = end_time
+        self.frames = frames
+        self.size = size
+
+
+class StreamRecorder:
+    # One stream's recording. Takes the place of the in-memory pre-roll: append() gets
+    # the JPEGs already encoded for the live view and iter_range() decodes any span
+    # still on disk, reading across as many segments as it covers.
+    def __init__(self, store, stream_id):
+        self.store = store
+        self.stream_id = stream_id
+        self.directory = os.path.join(store.root, stream_id)
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        # Finished segments, oldest first; guarded by the store's lock
+        self.segments = []
+        self.file = None
+        self.path = None
+        self.start_time = None
+        self.end_time = None
+        self.frames = 0
+        self.size = 0
+
+    def append(self, data, timestamp):
+        with self.lock:
+            if self.file is not None and timestamp - self.start_time >= self.store.segment_seconds:
+                self._finish()
+            if self.file is None:
+                self.path = os.path.join(self.directory, f"{int(timestamp * 1000)}{PARTIAL_SUFFIX}")
+                self.file = open(self.path, 'wb')
+                self.start_time = timestamp
+                self.frames = 0
+                self.size = 0
+            self.file.write(RECORD_HEADER.pack(timestamp, len(data)))
+            self.file.write(data)
+            self.end_time = timestamp
+            self.frames += 1
+            self.size += RECORD_HEADER.size + len(data)
+
+    def _finish(self):
+        self.file.close()
+        self.file = None
+        path = os.path.join(self.directory, _segment_name(self.start_time, self.end_time, self.frames))
+        try:
+            os.replace(self.path, path)
+        except OSError as e:
+            logger.error(f"[{self.stream_id}] Failed to finish recording segment {self.path}: {e}")
+            return
+        self.store._add_segment(self, Segment(path, self.start_time, self.end_time, self.frames, self.size))
+
+    def clear(self):
+        # The source changed or recording stopped: later frames start a new segment, the
+        # recording so far stays until retention removes it
+        with self.lock:
+            if self.file is not None:
+                self._finish()
+
+    def resize(self, max_frames):
+        # Retention is by the store's size and age limits, not by the clip length
+        pass
+
+    def __len__(self):
+        with self.store.lock:
+            frames = sum(segment.frames for segment in self.segments)
+        with self.lock:
+            return frames + self.frames if self.file is not None else frames
+
+    def iter_range(self, start_time, end_time):
+        # Yields (timestamp, frame) in capture order. Segments are only picked under the
+        # locks; a segment that retention deletes before it is read is skipped. The one
+        # being written is opened under the lock, so finishing it meanwhile (a rename)
+        # does not lose it, and read only up to what was written then.
+        with self.store.lock:
+            paths = [segment.path for segment in self.segments
+                     if segment.end_time >= start_time and segment.start_time <= end_time]
+        current = None
+        with self.lock:
+            if self.file is not None and self.end_time >= start_time and self.start_time <= end_time:
+                self.file.flush()
+                current = open(self.path, 'rb'), self.size
+        try:
+            for path in paths:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    logger.warning(f"[{self.stream_id}] Recording segment {os.path.basename(path)} expired, skipping")
+                    continue
+                with f:
+                    yield from self._decode(_read_records(f, start_time, end_time))
+            if current is not None:
+                yield from self._decode(_read_records(current[0], start_time, end_time, current[1]))
+        finally:
+            if current is not None:
+                current[0].close()
+
+    def _decode(self, records):
+        for timestamp, data in records:
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                logger.warning(f"[{self.stream_id}] Skipping undecodable recorded frame")
+                continue
+            yield timestamp, frame
+
+    def span(self):
+        with self.store.lock:
+            first = self.segments[0].start_time if self.segments else None
+            last = self.segments[-1].end_time if self.segments else None
+        with self.lock:
+            if self.file is not None:
+                first = self.start_time if first is None else first
+                last = self.end_time
+        return first, last
+
+
+class SegmentStore:
+    # Continuous recording of every stream as short segment files under root/<stream_id>/,
+    # kept within max_bytes in total and max_age_seconds of age (oldest segments go first).
+    # The index is rebuilt from the file names on start, so recordings survive restarts.
+    # The limits are applied whenever a segment is finished and by start()'s timer thread.
+    def __init__(self, root, segment_seconds=DEFAULT_SEGMENT_SECONDS, max_bytes=None, max_age_seconds=None,
+                 retention_interval=RETENTION_INTERVAL):
+        self.root = root
+        self.segment_seconds = max(1.0, float(segment_seconds))
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.retention_interval = retention_interval
+        self.lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.recorders = {}
+        self.total_bytes = 0
+        self.segments_deleted = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for stream_id in sorted(os.listdir(self.root)):
+            if not os.path.isdir(os.path.join(self.root, stream_id)):
+                continue
+            recorder = self.recorder(stream_id)
+            for name in os.listdir(recorder.directory):
+                path = os.path.join(recorder.directory, name)
+                try:
+                    segment = self._load_segment(path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable recording segment {path}: {e}")
+                    continue
+                if segment is not None:
+                    recorder.segments.append(segment)
+                    self.total_bytes += segment.size
+            recorder.segments.sort(key=lambda segment: segment.start_time)
+        logger.info(f"Recordings loaded from {self.root}: {self.total_bytes // (1024 * 1024)}MB")
+        self._enforce_retention()
+
+    def _load_segment(self, path):
+        name = os.path.basename(path)
+        if name.endswith(PARTIAL_SUFFIX):
+            # Left open by a crash or restart: keep the complete records and finish it
+            first, last, frames, valid = _scan_records(path)
+            if not frames:
+                os.remove(path)
+                return None
+            with open(path, 'r+b') as f:
+                f.truncate(valid)
+            finished = os.path.join(os.path.dirname(path), _segment_name(first, last, frames))
+            os.replace(path, finished)
+            return Segment(finished, first, last, frames, valid)
+        if not name.endswith(SEGMENT_SUFFIX):
+            return None
+        start_ms, end_ms, frames = name[:-len(SEGMENT_SUFFIX)].split('_')
+        return Segment(path, int(start_ms) / 1000.0, int(end_ms) / 1000.0, int(frames), os.path.getsize(path))
+
+    def recorder(self, stream_id):
+        with self.lock:
+            recorder = self.recorders.get(stream_id)
+            if recorder is None:
+                recorder = self.recorders[stream_id] = StreamRecorder(self, stream_id)
+            return recorder
+
+    def get(self, stream_id):
+        with self.lock:
+            return self.recorders.get(stream_id)
+
+    def _add_segment(self, recorder, segment):
+        with self.lock:
+            recorder.segments.append(segment)
+            self.total_bytes += segment.size
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        now = time.time()
+        removed = []
+        with self.lock:
+            while True:
+                heads = [recorder for recorder in self.recorders.values() if recorder.segments]
+                if not heads:
+                    break
+                oldest = min(heads, key=lambda recorder: recorder.segments[0].start_time)
+                segment = oldest.segments[0]
+                too_big = self.max_bytes is not None and self.total_bytes > self.max_bytes
+                too_old = self.max_age_seconds is not None and now - segment.end_time > self.max_age_seconds
+                if not too_big and not too_old:
+                    break
+                oldest.segments.pop(0)
+                self.total_bytes -= segment.size
+                self.segments_deleted += 1
+                removed.append(segment.path)
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove expired recording segment {path}: {e}")
+
+    def start(self):
+        threading.Thread(target=self._run_retention, name="dvr-retention", daemon=True).start()
+
+    def _run_retention(self):
+        while not self._stop_event.wait(self.retention_interval):
+            try:
+                self._enforce_retention()
+            except Exception as e:
+                logger.error(f"Recording retention error: {e}")
+
+    def close(self):
+        self._stop_event.set()
+        for recorder in list(self.recorders.values()):
+            recorder.clear()
+
+    def spans(self):
+        # {stream_id: (first, last)} capture times still on disk
+        with self.lock:
+            recorders = sorted(self.recorders.items())
+        return {stream_id: recorder.span() for stream_id, recorder in recorders}
+
+    def stats(self):
+        with self.lock:
+            return {
+                'bytes': self.total_bytes,
+                'segments': sum(len(recorder.segments) for recorder in self.recorders.values()),
+                'segments_deleted': self.segments_deleted,
+            }
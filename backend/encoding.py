@@ -0,0 +1,181 @@
+import cv2
+import threading
+import time
+import logging
+from collections import deque
+from queue import Queue
+
+logger = logging.getLogger(__name__)
+
+# Frames a stream may have waiting for an encoder thread; older ones are dropped as stale
+DEFAULT_MAX_QUEUED = 2
+# Preview tiers: (maximum width, JPEG quality); 'full' keeps the capture size and the pool's quality
+PREVIEW_TIERS = {
+    'thumb': (320, 60),
+    'sd': (640, 70),
+    'full': (None, None),
+}
+
+
+def _ignore_timing(stage, stream_id, seconds):
+    pass
+
+
+class EncodeJob:
+    # frame already carries the overlay; clean_frame is the same capture without it
+    # and is only set when an overlay frame also has to go into the JPEG pre-roll.
+    # tiers: preview tiers to encode, each once (empty: pre-roll only, nobody is watching)
+    def __init__(self, frame, captured_at, overlay, keep_clean=False, clean_frame=None, tiers=('full',)):
+        self.frame = frame
+        self.captured_at = captured_at
+        self.overlay = overlay
+        self.keep_clean = keep_clean
+        self.tiers = tuple(tiers)
+        self.clean_frame = clean_frame
+        self.submitted = time.perf_counter()
+        self.state = 'queued'
+        self.lane = None
+        self.ok = False
+        self.buffers = {}
+        self.clean_buffer = None
+
+
+class EncodeLane:
+    # One stream's frames in capture order. Jobs may finish out of order on the pool;
+    # deliver(job) is called strictly in order, and only for jobs that were encoded.
+    def __init__(self, stream_id, deliver, max_queued=DEFAULT_MAX_QUEUED):
+        self.stream_id = stream_id
+        self.deliver = deliver
+        self.max_queued = max(1, int(max_queued))
+        self.lock = threading.Lock()
+        self.jobs = deque()
+        self.frames_encoded = 0
+        self.frames_dropped = 0
+        self.encode_seconds = 0.0
+
+    def _drop_stale(self):
+        queued = [job for job in self.jobs if job.state == 'queued']
+        for job in queued[:max(0, len(queued) - self.max_queued + 1)]:
+            job.state = 'dropped'
+            job.frame = job.clean_frame = None
+            self.frames_dropped += 1
+
+    def _deliver_ready(self):
+        while self.jobs and self.jobs[0].state in ('done', 'dropped'):
+            job = self.jobs.popleft()
+            if job.state != 'done' or not job.ok:
+                continue
+            try:
+                self.deliver(job)
+            except Exception as e:
+                logger.error(f"[{self.stream_id}] Frame delivery error: {e}")
+
+    def seconds_per_encode(self):
+        with self.lock:
+            return self.encode_seconds / self.frames_encoded if self.frames_encoded else 0.0
+
+    def stats(self):
+        with self.lock:
+            return {'frames_encoded': self.frames_encoded, 'encode_frames_dropped': self.frames_dropped,
+                    'encode_pending': len(self.jobs)}
+
+
+class EncoderPool:
+    # JPEG-encodes preview frames on a few threads (cv2.imencode releases the GIL), so
+    # the capture loop only hands frames over. With workers=0 frames are encoded on the
+    # submitting thread as before.
+    def __init__(self, workers, quality, observe=None):
+        self.num_workers = max(0, int(workers))
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+        self.tier_params = {tier: [int(cv2.IMWRITE_JPEG_QUALITY), int(tier_quality or quality)]
+                            for tier, (_, tier_quality) in PREVIEW_TIERS.items()}
+        # observe(stage, stream_id, seconds): 'encode' per frame, 'encode_wait' from submit to encode start
+        self.observe = observe or _ignore_timing
+        self.jobs = Queue()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"jpeg-encoder-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        if self.num_workers:
+            logger.info(f"Started {self.num_workers} JPEG encoder thread(s)")
+
+    def lane(self, stream_id, deliver, max_queued=DEFAULT_MAX_QUEUED):
+        return EncodeLane(stream_id, deliver, max_queued)
+
+    def submit(self, lane, job):
+        job.lane = lane
+        with lane.lock:
+            if self.num_workers:
+                lane._drop_stale()
+            lane.jobs.append(job)
+            lane._deliver_ready()
+        if self.num_workers:
+            self.jobs.put(job)
+        else:
+            self._encode(job)
+
+    def backlog(self):
+        return self.jobs.qsize()
+
+    def _encode(self, job):
+        lane = job.lane
+        with lane.lock:
+            if job.state != 'queued':
+                return
+            job.state = 'encoding'
+        self.observe('encode_wait', lane.stream_id, time.perf_counter() - job.submitted)
+        t0 = time.perf_counter()
+        try:
+            job.ok = self._encode_tiers(job)
+            if job.ok and job.keep_clean:
+                # Evidence frames never carry the overlay; without one the full-tier encode is reused
+                if job.clean_frame is None and 'full' in job.buffers:
+                    job.clean_buffer = job.buffers['full']
+                else:
+                    clean_frame = job.frame if job.clean_frame is None else job.clean_frame
+                    job.ok, job.clean_buffer = cv2.imencode('.jpg', clean_frame, self.params)
+        except Exception as e:
+            logger.error(f"[{lane.stream_id}] JPEG encode error: {e}")
+            job.ok = False
+        elapsed = time.perf_counter() - t0
+        self.observe('encode', lane.stream_id, elapsed)
+        job.frame = job.clean_frame = None
+        with lane.lock:
+            job.state = 'done'
+            if job.ok:
+                lane.frames_encoded += 1
+                lane.encode_seconds += elapsed
+            else:
+                logger.error(f"[{lane.stream_id}] Failed to encode frame as JPEG")
+            lane._deliver_ready()
+
+    def _encode_tiers(self, job):
+        # Largest tier first, each smaller one resized from the previous (INTER_AREA averages
+        # rather than aliasing, and shrinking an already reduced image is cheaper)
+        source = job.frame
+        for tier in sorted(job.tiers, key=lambda tier: PREVIEW_TIERS[tier][0] or float('inf'), reverse=True):
+            width = PREVIEW_TIERS[tier][0]
+            if width is not None and source.shape[1] > width:
+                height = max(1, round(source.shape[0] * width / source.shape[1]))
+                source = cv2.resize(source, (width, height), interpolation=cv2.INTER_AREA)
+            ok, job.buffers[tier] = cv2.imencode('.jpg', source, self.tier_params[tier])
+            if not ok:
+                return False
+        return True
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    break
+                self._encode(job)
+            finally:
+                self.jobs.task_done()
+
+    def stop(self):
+        for _ in self.threads:
+            self.jobs.put(None)
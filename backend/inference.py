@@ -0,0 +1,349 @@
+import os
+import threading
+import time
+import logging
+from collections import defaultdict, deque
+from queue import Empty, Queue
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models',
+                                  'LRCN_model___Date_Time_2025_01_28__21_19_11___Loss_0.5761117339134216___Accuracy_0.739130437374115.h5')
+# The model's first output is the "normal" class probability
+SHOPLIFTING_THRESHOLD = 0.5
+
+
+def is_shoplifting_confidence(confidence):
+    return confidence < SHOPLIFTING_THRESHOLD
+
+
+def predict_batch(model, sequences):
+    # predict_on_batch skips the per-call dataset/callback setup of model.predict
+    batch = np.stack(sequences)
+    predictions = model.predict_on_batch(batch)
+    return [float(prediction[0]) for prediction in np.asarray(predictions)]
+
+
+def split_lrcn(model):
+    # The LRCN is TimeDistributed(CNN) layers followed by LSTM/Dense. Rebuild the
+    # TimeDistributed prefix as a single-frame encoder and the rest as a temporal
+    # head over per-frame embeddings; both reuse the loaded layers and weights.
+    import keras
+    layers = list(model.layers)
+    split = 0
+    while split < len(layers) and isinstance(layers[split], keras.layers.TimeDistributed):
+        split += 1
+    if split == 0 or split == len(layers):
+        return None
+    frame_input = keras.Input(shape=tuple(model.input_shape[2:]))
+    x = frame_input
+    for layer in layers[:split]:
+        x = layer.layer(x)
+    encoder = keras.Model(frame_input, x, name='lrcn_frame_encoder')
+    head_input = keras.Input(shape=(model.input_shape[1],) + tuple(x.shape[1:]))
+    y = head_input
+    for layer in layers[split:]:
+        y = layer(y)
+    head = keras.Model(head_input, y, name='lrcn_temporal_head')
+    return encoder, head
+
+
+def make_window_predictors(model):
+    # Returns (encode_fn, head_fn). When the model cannot be split the "embedding"
+    # of a frame is the frame itself and the head is the full model.
+    try:
+        parts = split_lrcn(model)
+    except Exception as e:
+        logger.warning(f"Could not split model into encoder/head: {e}")
+        parts = None
+    if parts is None:
+        logger.info("Sliding-window detection using the full model per window")
+        return (lambda frames: frames), (lambda windows: predict_batch(model, windows))
+    encoder, head = parts
+    logger.info(f"Sliding-window detection using frame encoder {encoder.output_shape} and temporal head")
+    return (lambda frames: np.asarray(encoder.predict_on_batch(frames)),
+            lambda windows: [float(prediction[0]) for prediction in np.asarray(head.predict_on_batch(windows))])
+
+
+class EmbeddingRing:
+    def __init__(self, length):
+        self.length = length
+        self.buffer = None
+        self.count = 0
+
+    def clear(self):
+        self.count = 0
+
+    def extend(self, features):
+        if self.buffer is None or self.buffer.shape[1:] != features.shape[1:]:
+            self.buffer = np.empty((self.length,) + features.shape[1:], dtype=features.dtype)
+            self.count = 0
+        for feature in features:
+            self.buffer[self.count % self.length] = feature
+            self.count += 1
+
+    def ready(self):
+        return self.count >= self.length
+
+    def window(self, out=None):
+        start = self.count % self.length
+        if out is None:
+            return np.concatenate((self.buffer[start:], self.buffer[:start]))
+        tail = self.length - start
+        out[:tail] = self.buffer[start:]
+        out[tail:] = self.buffer[:start]
+        return out
+
+
+def normalize_frames(chunks, out):
+    # uint8 frames -> float32 in [0, 1], written straight into out (no temporaries)
+    offset = 0
+    for chunk in chunks:
+        np.divide(chunk, np.float32(255.0), out=out[offset:offset + len(chunk)])
+        offset += len(chunk)
+    return out[:offset]
+
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'coalesce')
+
+
+class DetectionQueue(Queue):
+    # Bounded queue of (stream_id, frames, reset, captured_at) chunks. put() never
+    # blocks the capture thread: when the queue is full the overflow policy drops the
+    # oldest chunk, drops the new one, or coalesces the new chunk into the stream's
+    # pending one (keeping only the last window_length frames). A stream that lost a
+    # chunk has its next chunk flagged as reset, so its embedding ring never splices
+    # frames from either side of the gap.
+    def __init__(self, capacity=0, policy='drop_oldest', window_length=None):
+        if policy not in OVERFLOW_POLICIES:
+            logger.warning(f"Unknown detection queue overflow policy {policy}, using 'drop_oldest'")
+            policy = 'drop_oldest'
+        self.capacity = max(0, int(capacity))
+        self.policy = policy
+        self.window_length = window_length
+        self.dropped = defaultdict(int)
+        super().__init__()
+
+    def _init(self, maxsize):
+        self.queue = deque()
+        self.broken_streams = set()
+
+    def _put(self, item):
+        if item is None:
+            self.queue.append(item)
+            return
+        item = self._after_gap(item)
+        stream_id, frames = item[0], item[1]
+        if not self.capacity or self._qsize() < self.capacity:
+            self.queue.append(item)
+            return
+        # Items that are not enqueued must not count as unfinished tasks (put() increments after _put)
+        if self.policy == 'coalesce' and self._coalesce(item):
+            self.unfinished_tasks -= 1
+            return
+        if self.policy == 'drop_newest':
+            self._record(stream_id, 'overflow', len(frames))
+            self.broken_streams.add(stream_id)
+            self.unfinished_tasks -= 1
+            return
+        # When the queue holds no later chunk of the evicted stream and the new chunk
+        # is from that stream, the new chunk is the one right after the gap
+        self._evict_oldest()
+        self.queue.append(self._after_gap(item))
+
+    def _after_gap(self, item):
+        stream_id, frames, reset, captured_at = item
+        if stream_id not in self.broken_streams:
+            return item
+        self.broken_streams.discard(stream_id)
+        return stream_id, frames, True, captured_at
+
+    def _coalesce(self, item):
+        stream_id, frames, reset, captured_at = item
+        for index in range(len(self.queue) - 1, -1, -1):
+            pending = self.queue[index]
+            if pending is not None and pending[0] == stream_id:
+                merged = np.concatenate((np.asarray(pending[1]), np.asarray(frames)))
+                if self.window_length and len(merged) > self.window_length:
+                    self._record(stream_id, 'coalesced', len(merged) - self.window_length)
+                    merged = merged[-self.window_length:]
+                self.queue[index] = (stream_id, merged, pending[2] or reset, captured_at)
+                return True
+        return False
+
+    def _evict_oldest(self):
+        for index, pending in enumerate(self.queue):
+            if pending is None:
+                continue
+            del self.queue[index]
+            stream_id = pending[0]
+            self._record(stream_id, 'overflow', len(pending[1]))
+            self.unfinished_tasks -= 1
+            for later in range(index, len(self.queue)):
+                following = self.queue[later]
+                if following is not None and following[0] == stream_id:
+                    self.queue[later] = (stream_id, following[1], True, following[3])
+                    return
+            self.broken_streams.add(stream_id)
+            return
+
+    def _record(self, stream_id, reason, frames):
+        self.dropped[(stream_id, reason)] += frames
+
+    def record_drop(self, stream_id, reason, frames):
+        with self.mutex:
+            self._record(stream_id, reason, frames)
+
+    def drop_counts(self):
+        # {(stream_id, reason): frames dropped}
+        with self.mutex:
+            return dict(self.dropped)
+
+    def drops_for(self, stream_id):
+        with self.mutex:
+            return {reason: frames for (sid, reason), frames in self.dropped.items() if sid == stream_id}
+
+
+class BatchInferenceScheduler(threading.Thread):
+    def __init__(self, request_queue, encode_fn, head_fn, on_result, window_length, max_batch_size=8, max_wait=0.05,
+                 observe=None, max_age=None):
+        super().__init__(name="inference-scheduler", daemon=True)
+        self.request_queue = request_queue
+        self.encode_fn = encode_fn
+        self.head_fn = head_fn
+        self.on_result = on_result
+        self.window_length = window_length
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        # observe(stage, stream_id, seconds): one 'inference' timing per batch (stream_id None)
+        self.observe = observe
+        # Chunks whose newest frame is older than max_age seconds are dropped instead of
+        # producing an alert long after the event
+        self.max_age = max_age or None
+        self.rings = {}
+        self.rings_lock = threading.Lock()
+        self.batches_run = 0
+        self.frames_encoded = 0
+        self.windows_run = 0
+        self.dropped_stale = 0
+        # Wall time spent in _run_batch, for per-frame cost estimates
+        self.busy_seconds = 0.0
+        # Reused across batches: normalized frames and stacked windows
+        self.frame_buffer = None
+        self.window_buffer = None
+        self._stopping = False
+
+    def reset_stream(self, stream_id):
+        with self.rings_lock:
+            self.rings.pop(stream_id, None)
+
+    def _collect_batch(self):
+        first = self.request_queue.get()
+        if first is None:
+            self.request_queue.task_done()
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.request_queue.get(timeout=remaining) if remaining > 0 else self.request_queue.get_nowait()
+            except Empty:
+                break
+            if item is None:
+                self.request_queue.task_done()
+                self._stopping = True
+                break
+            batch.append(item)
+        return batch
+
+    def _run_batch(self, batch):
+        # Each request is (stream_id, frames, reset, captured_at): the frames a stream
+        # captured since its previous request. Every frame is encoded exactly once; each
+        # request then yields one window over the stream's last window_length frames.
+        batch = self._drop_stale(batch)
+        if not batch:
+            return
+        chunks = [np.asarray(chunk) for _, chunk, _, _ in batch]
+        total = sum(len(chunk) for chunk in chunks)
+        if self.frame_buffer is None or len(self.frame_buffer) < total or self.frame_buffer.shape[1:] != chunks[0].shape[1:]:
+            self.frame_buffer = np.empty((total,) + chunks[0].shape[1:], dtype=np.float32)
+        frames = normalize_frames(chunks, self.frame_buffer)
+        features = self.encode_fn(frames)
+        self.frames_encoded += len(frames)
+        window_shape = (self.window_length,) + features.shape[1:]
+        if self.window_buffer is None or len(self.window_buffer) < len(batch) or self.window_buffer.shape[1:] != window_shape:
+            self.window_buffer = np.empty((max(len(batch), self.max_batch_size),) + window_shape, dtype=features.dtype)
+        owners = []
+        offset = 0
+        with self.rings_lock:
+            for stream_id, chunk, reset, captured_at in batch:
+                ring = self.rings.get(stream_id)
+                if ring is None:
+                    ring = self.rings[stream_id] = EmbeddingRing(self.window_length)
+                elif reset:
+                    ring.clear()
+                ring.extend(features[offset:offset + len(chunk)])
+                offset += len(chunk)
+                if ring.ready():
+                    ring.window(out=self.window_buffer[len(owners)])
+                    owners.append((stream_id, captured_at))
+        if not owners:
+            return
+        confidences = self.head_fn(self.window_buffer[:len(owners)])
+        self.batches_run += 1
+        self.windows_run += len(owners)
+        logger.debug(f"Ran inference batch: {len(frames)} frames encoded, {len(owners)} windows")
+        for (stream_id, captured_at), confidence in zip(owners, confidences):
+            if self.observe:
+                # Capture of the window's newest frame to its result
+                self.observe('detection_latency', stream_id, time.time() - captured_at)
+            try:
+                self.on_result(stream_id, confidence, captured_at)
+            except Exception as e:
+                logger.error(f"Detection result handling error for {stream_id}: {e}")
+
+    def seconds_per_frame(self):
+        # Average inference cost of one submitted frame (its encoding plus its share of
+        # the window head calls); used to estimate what skipping frames saves
+        return self.busy_seconds / self.frames_encoded if self.frames_encoded else 0.0
+
+    def _drop_stale(self, batch):
+        if self.max_age is None:
+            return batch
+        cutoff = time.time() - self.max_age
+        fresh = []
+        for item in batch:
+            stream_id, chunk, _, captured_at = item
+            if captured_at >= cutoff:
+                fresh.append(item)
+                continue
+            # The stream's following chunks no longer continue its ring
+            self.reset_stream(stream_id)
+            self.dropped_stale += len(chunk)
+            if hasattr(self.request_queue, 'record_drop'):
+                self.request_queue.record_drop(stream_id, 'stale', len(chunk))
+        return fresh
+
+    def run(self):
+        while not self._stopping:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+            started = time.perf_counter()
+            try:
+                self._run_batch(batch)
+                elapsed = time.perf_counter() - started
+                self.busy_seconds += elapsed
+                if self.observe:
+                    self.observe('inference', None, elapsed)
+            except Exception as e:
+                logger.error(f"Detection error: {e}")
+            finally:
+                for _ in batch:
+                    self.request_queue.task_done()
+        logger.info("Inference scheduler stopped")
+
+    def stop(self):
+        self.request_queue.put(None)
@@ -0,0 +1,371 @@
+import sys
+import threading
+import time
+import types
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from queue import Queue, Empty
+import numpy as np
+
+from backends import load_backend, warm_up
+from inference import BatchInferenceScheduler
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a free slab slot before re-checking the worker is still alive
+SLOT_WAIT_TIMEOUT = 0.5
+WORKER_STOP_TIMEOUT = 5.0
+
+
+@contextmanager
+def _bare_main_module():
+    # spawn re-imports the parent's __main__ in the child. For the server that is
+    # app_v2, whose import opens the database and starts capture, so the processes
+    # are started while __main__ is an empty module; the child only needs this one.
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+class _SlabQueue(Queue):
+    # The worker's local request queue. A chunk stays in its slab slot while queued and
+    # is copied out when the scheduler takes it, and only then is the slot freed: at
+    # most as many chunks as there are slots wait here, and beyond that the parent's bounded
+    # detection queue fills and applies its overflow policy. Drops it records are
+    # reported to the parent.
+    def __init__(self, send, slab):
+        super().__init__()
+        self.send = send
+        self.slab = slab
+
+    def _get(self):
+        item = super()._get()
+        if item is None:
+            return None
+        stream_id, slot, count, reset, captured_at = item
+        frames = self.slab[slot, :count].copy()
+        self.send(('free', slot))
+        return stream_id, frames, reset, captured_at
+
+    def record_drop(self, stream_id, reason, frames):
+        self.send(('drop', stream_id, reason, frames))
+
+
+def _worker_main(config, conn):
+    # Runs in a spawned process: loads the backend, then serves chunks the parent
+    # writes into the shared slab. Messages to the parent are small tuples:
+    # ('free', slot), ('result', stream_id, confidence, captured_at),
+    # ('observe', stage, stream_id, seconds), ('batch', seconds, frames_encoded, windows_run,
+    # batches_run) with the scheduler's cumulative counters, and ('drop', ...).
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [inference-{config['index']}] %(levelname)s %(message)s")
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    try:
+        backend = load_backend(config['backend'], config['model_path'])
+        send(('loaded', list(backend.input_shape)))
+        warm_up(backend, config['warmup_frames'], config['max_batch_size'])
+    except Exception as e:
+        send(('error', str(e)))
+        return
+    shm = shared_memory.SharedMemory(name=config['shm_name'])
+    slab = np.ndarray((config['slots'], config['slot_frames']) + tuple(config['frame_shape']), dtype=np.uint8,
+                      buffer=shm.buf)
+    requests = _SlabQueue(send, slab)
+    scheduler = None
+
+    def forward_observation(stage, stream_id, seconds):
+        if stage == 'inference':
+            send(('batch', seconds, scheduler.frames_encoded, scheduler.windows_run, scheduler.batches_run))
+        else:
+            send(('observe', stage, stream_id, seconds))
+
+    scheduler = BatchInferenceScheduler(requests, backend.encode, backend.head,
+                                        lambda stream_id, confidence, captured_at: send(('result', stream_id, confidence, captured_at)),
+                                        config['window_length'], max_batch_size=config['max_batch_size'],
+                                        max_wait=config['max_wait'], observe=forward_observation, max_age=config['max_age'])
+    scheduler.start()
+    send(('ready',))
+    try:
+        while True:
+            message = conn.recv()
+            kind = message[0]
+            if kind == 'chunk':
+                _, slot, stream_id, count, reset, captured_at = message
+                requests.put((stream_id, slot, count, reset, captured_at))
+            elif kind == 'reset':
+                scheduler.reset_stream(message[1])
+            elif kind == 'stop':
+                break
+    except (EOFError, OSError):
+        pass
+    finally:
+        scheduler.stop()
+        scheduler.join(WORKER_STOP_TIMEOUT)
+        requests.slab = None
+        del slab
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, index, process, conn, shm, slots, slot_frames, frame_shape):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.shm = shm
+        self.slab = np.ndarray((slots, slot_frames) + tuple(frame_shape), dtype=np.uint8, buffer=shm.buf)
+        self.free_slots = Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+        self.send_lock = threading.Lock()
+        self.state = 'starting'
+        self.error = None
+        self.input_shape = None
+        self.streams = 0
+        self.alive = True
+        # Cumulative counters last reported by the process
+        self.frames_encoded = 0
+        self.windows_run = 0
+        self.batches_run = 0
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class InferenceProcessPool:
+    # Drop-in for BatchInferenceScheduler that runs the model in worker processes, so
+    # TensorFlow's Python-side work no longer competes for the GIL with capture,
+    # encoding and the Socket.IO handlers. Chunks are taken from the same detection
+    # queue and copied into a per-worker shared-memory slab (no pickled arrays); only
+    # slot numbers and results cross the pipe. Each stream is pinned to one worker,
+    # which keeps its embedding ring and batches across the streams it serves.
+    def __init__(self, request_queue, backend_name, model_path, on_result, window_length, frame_shape,
+                 processes=1, max_batch_size=8, max_wait=0.05, observe=None, max_age=None, warmup_frames=None,
+                 slots_per_worker=None):
+        self.request_queue = request_queue
+        self.backend_name = backend_name
+        self.model_path = model_path
+        self.on_result = on_result
+        self.window_length = window_length
+        self.frame_shape = tuple(frame_shape)
+        self.processes = max(1, int(processes))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait
+        self.observe = observe
+        self.max_age = max_age
+        self.warmup_frames = warmup_frames or window_length
+        # Chunks a worker may have waiting for its scheduler: enough for the next two
+        # batches; further chunks back up in the detection queue
+        self.slots_per_worker = slots_per_worker or 2 * self.max_batch_size
+        self.workers = []
+        self.affinity = {}
+        self.lock = threading.Lock()
+        self.state_changed = threading.Condition(self.lock)
+        self.dispatcher = None
+        self.batches_run = 0
+        self.frames_encoded = 0
+        self.windows_run = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        slot_bytes = self.window_length * int(np.prod(self.frame_shape))
+        for index in range(self.processes):
+            shm = shared_memory.SharedMemory(create=True, size=self.slots_per_worker * slot_bytes)
+            parent_conn, child_conn = context.Pipe()
+            config = {
+                'index': index,
+                'backend': self.backend_name,
+                'model_path': self.model_path,
+                'shm_name': shm.name,
+                'slots': self.slots_per_worker,
+                'slot_frames': self.window_length,
+                'frame_shape': self.frame_shape,
+                'window_length': self.window_length,
+                'max_batch_size': self.max_batch_size,
+                'max_wait': self.max_wait,
+                'max_age': self.max_age,
+                'warmup_frames': self.warmup_frames,
+            }
+            process = context.Process(target=_worker_main, args=(config, child_conn), name=f"inference-{index}", daemon=True)
+            with _bare_main_module():
+                process.start()
+            child_conn.close()
+            worker = _Worker(index, process, parent_conn, shm, self.slots_per_worker, self.window_length, self.frame_shape)
+            self.workers.append(worker)
+            threading.Thread(target=self._read_results, args=(worker,), name=f"inference-results-{index}", daemon=True).start()
+        logger.info(f"Started {self.processes} inference process(es) with {self.backend_name} backend")
+
+    def wait_for(self, state, timeout=None):
+        # Blocks until every worker reached state ('loaded' or 'ready'); raises if one failed.
+        # Returns the input shapes the workers reported.
+        order = ('starting', 'loaded', 'ready')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.state_changed:
+            while True:
+                failed = [worker for worker in self.workers if worker.state == 'failed']
+                if failed:
+                    raise RuntimeError(f"Inference process {failed[0].index} failed: {failed[0].error}")
+                if all(order.index(worker.state) >= order.index(state) for worker in self.workers):
+                    return [worker.input_shape for worker in self.workers]
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Inference processes not {state} after {timeout}s")
+                self.state_changed.wait(remaining)
+
+    def start_dispatching(self):
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name="inference-dispatcher", daemon=True)
+        self.dispatcher.start()
+
+    def _set_state(self, worker, state, error=None):
+        with self.state_changed:
+            worker.state = state
+            worker.error = error
+            if state == 'failed':
+                worker.alive = False
+            self.state_changed.notify_all()
+
+    def _read_results(self, worker):
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            try:
+                if kind == 'free':
+                    worker.free_slots.put(message[1])
+                elif kind == 'result':
+                    _, stream_id, confidence, captured_at = message
+                    self.on_result(stream_id, confidence, captured_at)
+                elif kind == 'observe':
+                    if self.observe:
+                        self.observe(*message[1:])
+                elif kind == 'batch':
+                    _, seconds, frames_encoded, windows_run, batches_run = message
+                    with self.lock:
+                        self.busy_seconds += seconds
+                        self.frames_encoded += frames_encoded - worker.frames_encoded
+                        self.windows_run += windows_run - worker.windows_run
+                        self.batches_run += batches_run - worker.batches_run
+                        worker.frames_encoded, worker.windows_run, worker.batches_run = frames_encoded, windows_run, batches_run
+                    if self.observe:
+                        self.observe('inference', None, seconds)
+                elif kind == 'drop':
+                    if hasattr(self.request_queue, 'record_drop'):
+                        self.request_queue.record_drop(*message[1:])
+                elif kind == 'loaded':
+                    worker.input_shape = tuple(message[1])
+                    self._set_state(worker, 'loaded')
+                elif kind == 'ready':
+                    self._set_state(worker, 'ready')
+                elif kind == 'error':
+                    self._set_state(worker, 'failed', message[1])
+            except Exception as e:
+                logger.error(f"Inference process {worker.index} message handling error: {e}")
+        if worker.state != 'failed':
+            self._set_state(worker, 'failed', 'process exited')
+        logger.warning(f"Inference process {worker.index} disconnected")
+
+    def _assign(self, stream_id):
+        # Returns (worker, moved): moved when the stream's previous worker failed, so
+        # the new one has to start the stream's ring afresh
+        with self.lock:
+            index = self.affinity.get(stream_id)
+            if index is not None and self.workers[index].alive:
+                return self.workers[index], False
+            live = [worker for worker in self.workers if worker.alive]
+            if not live:
+                return None, False
+            worker = min(live, key=lambda w: w.streams)
+            worker.streams += 1
+            self.affinity[stream_id] = worker.index
+            return worker, index is not None
+
+    def _dispatch(self, item):
+        stream_id, frames, reset, captured_at = item
+        frames = np.asarray(frames)
+        if len(frames) > self.window_length:
+            # Only the last window's worth can influence the result; it also refills the ring
+            frames = frames[-self.window_length:]
+            reset = True
+        while True:
+            worker, moved = self._assign(stream_id)
+            reset = reset or moved
+            if worker is None:
+                if hasattr(self.request_queue, 'record_drop'):
+                    self.request_queue.record_drop(stream_id, 'inference_down', len(frames))
+                return
+            try:
+                slot = worker.free_slots.get(timeout=SLOT_WAIT_TIMEOUT)
+                break
+            except Empty:
+                # Backpressure: every slot holds a chunk the worker has not taken yet, so
+                # the bounded detection queue fills and applies its overflow policy meanwhile
+                continue
+        worker.slab[slot, :len(frames)] = frames
+        worker.send(('chunk', slot, stream_id, len(frames), reset, captured_at))
+
+    def _dispatch_loop(self):
+        while True:
+            item = self.request_queue.get()
+            try:
+                if item is None:
+                    break
+                self._dispatch(item)
+            except Exception as e:
+                logger.error(f"Inference dispatch error: {e}")
+            finally:
+                self.request_queue.task_done()
+        self._shutdown()
+
+    def _shutdown(self):
+        for worker in self.workers:
+            try:
+                worker.send(('stop',))
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers:
+            worker.process.join(WORKER_STOP_TIMEOUT)
+            if worker.process.is_alive():
+                logger.warning(f"Terminating inference process {worker.index}")
+                worker.process.terminate()
+            worker.conn.close()
+            worker.slab = None
+            worker.shm.close()
+            worker.shm.unlink()
+        logger.info("Inference processes stopped")
+
+    def reset_stream(self, stream_id):
+        with self.lock:
+            index = self.affinity.pop(stream_id, None)
+            if index is not None:
+                self.workers[index].streams -= 1
+        if index is not None:
+            try:
+                self.workers[index].send(('reset', stream_id))
+            except (OSError, ValueError):
+                pass
+
+    def seconds_per_frame(self):
+        with self.lock:
+            return self.busy_seconds / self.frames_encoded if self.frames_encoded else 0.0
+
+    def stop(self):
+        if self.dispatcher is None:
+            self._shutdown()
+        else:
+            self.request_queue.put(None)
+
+    def join(self, timeout=None):
+        if self.dispatcher is not None:
+            self.dispatcher.join(timeout)
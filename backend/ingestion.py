@@ -0,0 +1,475 @@
+import cv2
+import math
+import numpy as np
+import os
+import threading
+import base64
+import struct
+import time
+import logging
+from buffers import FrameRingBuffer, JpegRingBuffer
+from capture import CAPTURE_MODES, open_frame_source
+from encoding import EncodeJob, EncoderPool
+from motion import MotionGate
+from pacing import FramePacer, source_fps
+from viewers import preview_room
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAM = 'default'
+JPEG_QUALITY = 80
+# 'dvr' writes the stream's JPEGs to disk segments (dvr.SegmentStore) instead of keeping a pre-roll in memory
+PREROLL_MODES = ('raw', 'jpeg', 'dvr')
+FRAME_TRANSPORTS = ('binary', 'base64')
+# How long the worker waits for a new frame before re-checking for stop/source changes
+FRAME_WAIT_TIMEOUT = 0.5
+# How long starting a stream waits for the stream's previous worker to let go of its
+# source, pre-roll and room (it checks for stop between frames and reconnect attempts)
+WORKER_STOP_TIMEOUT = 5.0
+MODEL_FRAME_SIZE = (64, 64)
+# INTER_AREA averages source pixels (less aliasing when shrinking HD frames) at some CPU cost
+RESIZE_INTERPOLATIONS = {'linear': cv2.INTER_LINEAR, 'area': cv2.INTER_AREA}
+
+# Binary 'frame_bin' payload: header followed by the raw JPEG bytes.
+# version u8, flags u8 (bit 0: detection overlay), sequence u32, camera_id i32 (-1: dashboard stream), capture time f64
+FRAME_HEADER = struct.Struct('<BBIid')
+FRAME_HEADER_VERSION = 1
+FRAME_FLAG_OVERLAY = 0x01
+
+
+def camera_stream_id(camera_id):
+    return f"camera-{camera_id}"
+
+
+def parse_capture_source(source):
+    # Device indices are stored as text in the Cameras table ("0", "1", ...)
+    if isinstance(source, int):
+        return source
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+
+def pack_frame(sequence, camera_id, timestamp, overlay, jpeg_bytes):
+    flags = FRAME_FLAG_OVERLAY if overlay else 0
+    header = FRAME_HEADER.pack(FRAME_HEADER_VERSION, flags, sequence & 0xFFFFFFFF,
+                               -1 if camera_id is None else int(camera_id), timestamp)
+    return header + jpeg_bytes
+
+
+def preprocess_frame(frame, out=None, interpolation=cv2.INTER_LINEAR):
+    # Resizes to the model input as uint8, into out when given. Scaling to [0, 1]
+    # happens once per batch in the inference scheduler.
+    if frame is None or frame.size == 0:
+        logger.error("Invalid frame received for preprocessing.")
+        return None
+    return cv2.resize(frame, MODEL_FRAME_SIZE, dst=out, interpolation=interpolation)
+
+
+def _ignore_timing(stage, stream_id, seconds):
+    pass
+
+
+class CameraWorker(threading.Thread):
+    def __init__(self, manager, stream_id, source, source_kind='webcam', camera_id=None, camera_name=None, fallback_source=None):
+        super().__init__(name=f"capture-{stream_id}", daemon=True)
+        self.manager = manager
+        self.stream_id = stream_id
+        self.source = source
+        self.source_kind = source_kind
+        self.camera_id = camera_id
+        self.camera_name = camera_name
+        self.fallback_source = fallback_source
+        self.lock = threading.Lock()
+        # Frames resized since the last detection chunk, written in place (uint8, 4x smaller than float32)
+        self.sequence_slab = np.empty((manager.sequence_length,) + MODEL_FRAME_SIZE[::-1] + (3,), dtype=np.uint8)
+        self.slab_count = 0
+        self.fps = float(manager.frame_rate)
+        # Consumer-side pacing stats; the frame source paces files itself
+        self.pacer = FramePacer(self.fps, sleep_to_deadline=False)
+        self.frame_source = None
+        self.motion_gate = MotionGate(manager.motion_threshold, manager.motion_hold_seconds)
+        self.frame_buffer = manager.create_preroll_buffer(stream_id, self.fps)
+        # Preview frames are encoded on the manager's encoder pool and delivered here in capture order
+        self.encode_lane = manager.encoder.lane(stream_id, self._deliver_encoded)
+        self.latest_frame = None
+        self.detection_frame_count = 0
+        self.frame_sequence = 0
+        # Preview work skipped while nobody watched the stream, and the measured cost of doing it
+        self.preview_emits_skipped = 0
+        self.preview_encodes_skipped = 0
+        self.emit_seconds = 0.0
+        self._window_reset = True
+        self._source_changed = True
+        self._stop_event = threading.Event()
+
+    def set_source(self, source, source_kind, camera_id=None):
+        with self.lock:
+            self.source = source
+            self.source_kind = source_kind
+            self.camera_id = camera_id
+            self._source_changed = True
+
+    def stop(self):
+        self._stop_event.set()
+
+    def flag_detection(self, frame_count):
+        with self.lock:
+            self.detection_frame_count = frame_count
+
+    def clear_frame_buffer(self):
+        self.frame_buffer.clear()
+
+    def get_latest_frame(self):
+        with self.lock:
+            return None if self.latest_frame is None else self.latest_frame.copy()
+
+    def clip_fps(self):
+        # Rate frames actually reached the pre-roll (lower than native when frames are skipped)
+        achieved = self.pacer.achieved_fps()
+        return min(self.fps, achieved) if achieved >= 1.0 else self.fps
+
+    def stats(self):
+        stats = dict(self.pacer.stats(), stream_id=self.stream_id, camera_id=self.camera_id,
+                     source=self.source_kind, running=self.is_alive())
+        if hasattr(self.manager.detection_queue, 'drops_for'):
+            stats['detection_frames_dropped'] = self.manager.detection_queue.drops_for(self.stream_id)
+        stats['motion_gate'] = self.motion_gate.stats()
+        stats.update(self.encode_lane.stats())
+        stats['preview'] = self.preview_stats()
+        frame_source = self.frame_source
+        if frame_source is not None:
+            stats.update(frame_source.stats())
+        return stats
+
+    def preview_stats(self):
+        emitted = self.frame_sequence
+        seconds_per_emit = self.emit_seconds / emitted if emitted else 0.0
+        # Estimated from this stream's own measured encode and emit times
+        saved = (self.preview_encodes_skipped * self.encode_lane.seconds_per_encode()
+                 + self.preview_emits_skipped * seconds_per_emit)
+        return {
+            'watched': self.manager.has_viewers(self.stream_id),
+            'frames_skipped': self.preview_emits_skipped,
+            'encodes_skipped': self.preview_encodes_skipped,
+            'cpu_saved_seconds': round(saved, 3),
+        }
+
+    def _deliver_encoded(self, job):
+        if job.keep_clean:
+            self.frame_buffer.append(job.clean_buffer.tobytes(), job.captured_at)
+        if not job.tiers:
+            return
+        self.frame_sequence += 1
+        t0 = time.perf_counter()
+        # Recorded before the emit so a fast acknowledgement always finds the send time
+        self.manager.preview_sent(self.stream_id, self.frame_sequence, job.tiers)
+        for tier in job.tiers:
+            self._emit_frame(job.buffers[tier], job.captured_at, job.overlay, tier)
+        elapsed = time.perf_counter() - t0
+        self.emit_seconds += elapsed
+        self.manager.observe('emit', self.stream_id, elapsed)
+
+    def _emit_frame(self, buffer, captured_at, overlay, tier):
+        if self.manager.frame_transport == 'binary':
+            camera_id = None if self.stream_id == DEFAULT_STREAM else self.camera_id
+            self.manager.emit_preview(self.stream_id, 'frame_bin',
+                                      pack_frame(self.frame_sequence, camera_id, captured_at, overlay, buffer.tobytes()), tier)
+        else:
+            self.manager.emit_preview(self.stream_id, 'frame', {
+                'image': base64.b64encode(buffer).decode('utf-8'),
+                'stream_id': self.stream_id,
+                'camera_id': self.camera_id,
+                'sequence': self.frame_sequence,
+                'tier': tier
+            }, tier)
+
+    def _open_capture(self):
+        with self.lock:
+            source, source_kind = self.source, self.source_kind
+            self._source_changed = False
+        logger.info(f"[{self.stream_id}] Opening {source_kind} source: {source}")
+        cap = self.manager.capture_factory(parse_capture_source(source))
+        if not cap.isOpened():
+            logger.error(f"[{self.stream_id}] Failed to open {source_kind} source: {source}")
+            cap.release()
+            if source_kind == 'uploaded' and self.fallback_source is not None:
+                self.set_source(self.fallback_source, 'webcam', self.camera_id)
+            return None
+        self.slab_count = 0
+        self._window_reset = True
+        self.motion_gate.reset()
+        self.clear_frame_buffer()
+        # Files are played at their native rate; live devices pace themselves in grab()
+        self.fps = source_fps(cap, self.manager.frame_rate)
+        is_file = source_kind == 'uploaded' or os.path.isfile(str(source))
+        self.pacer.reset(self.fps, sleep_to_deadline=False)
+        self.frame_buffer.resize(self.manager.buffer_frames(self.fps))
+        logger.info(f"[{self.stream_id}] Successfully opened {source_kind} source at {self.fps:.2f} FPS")
+        return self.manager.open_frame_source(cap, self.stream_id, self.fps, paced=is_file, loop=source_kind == 'uploaded')
+
+    def run(self):
+        observe = self.manager.observe
+        while not self._stop_event.is_set():
+            try:
+                if self._source_changed:
+                    if self.frame_source:
+                        self.frame_source.close()
+                    self.frame_source = self._open_capture()
+
+                if not self.frame_source or not self.frame_source.is_opened():
+                    logger.warning(f"[{self.stream_id}] Video capture not opened. Retrying...")
+                    self._stop_event.wait(self.manager.reconnect_delay)
+                    with self.lock:
+                        self._source_changed = True
+                    continue
+
+                # The newest frame; any the loop was too slow for are reported as skipped
+                grabbed = self.frame_source.next_frame(FRAME_WAIT_TIMEOUT)
+                if grabbed is None:
+                    continue
+                frame, captured_at, skipped = grabbed
+                self.pacer.present(skipped, max(0.0, time.time() - captured_at))
+                with self.lock:
+                    self.latest_frame = frame.copy()
+                # The DVR records continuously; the in-memory pre-roll is only kept for alert clips
+                preroll_mode = self.manager.preroll_mode
+                buffer_raw = preroll_mode == 'raw' and self.manager.clip_capture_enabled
+                buffer_jpeg = preroll_mode == 'dvr' or (preroll_mode == 'jpeg' and self.manager.clip_capture_enabled)
+                if buffer_raw:
+                    self.frame_buffer.append(frame, captured_at)
+
+                t0 = time.perf_counter()
+                processed_frame = preprocess_frame(frame, self.sequence_slab[self.slab_count],
+                                                   self.manager.resize_interpolation)
+                observe('preprocess', self.stream_id, time.perf_counter() - t0)
+                if processed_frame is not None:
+                    self.slab_count += 1
+                    if self.slab_count >= self.manager.window_stride:
+                        # The chunk waits in the queue (or in the motion gate) while the slab is refilled,
+                        # so it gets its own copy
+                        t0 = time.perf_counter()
+                        admitted = self.motion_gate.filter(self.sequence_slab[:self.slab_count].copy(), captured_at)
+                        observe('motion_gate', self.stream_id, time.perf_counter() - t0)
+                        self.slab_count = 0
+                        if admitted is not None:
+                            chunk, resumed = admitted
+                            self.manager.submit_frames(self, chunk, self._window_reset or resumed, captured_at)
+                            self._window_reset = False
+
+                with self.lock:
+                    display_text = self.detection_frame_count > 0
+                    if display_text:
+                        self.detection_frame_count -= 1
+
+                tiers = self.manager.preview_tiers(self.stream_id)
+                if not tiers:
+                    # Nobody is watching: no overlay, no emit, and an encode only when the pre-roll keeps JPEGs
+                    self.preview_emits_skipped += 1
+                    if buffer_jpeg:
+                        self.manager.encoder.submit(self.encode_lane, EncodeJob(frame, captured_at, False, keep_clean=True,
+                                                                                tiers=()))
+                    else:
+                        self.preview_encodes_skipped += 1
+                    continue
+
+                if display_text:
+                    cv2.putText(frame, "Shoplifting Detected!", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+
+                # The frame is handed over: nothing here touches it after submit.
+                # latest_frame is replaced, not modified, so it can serve as the clean copy.
+                clean_frame = self.latest_frame if display_text and buffer_jpeg else None
+                self.manager.encoder.submit(self.encode_lane, EncodeJob(frame, captured_at, display_text, keep_clean=buffer_jpeg,
+                                                                        clean_frame=clean_frame, tiers=tiers))
+            except Exception as e:
+                logger.error(f"[{self.stream_id}] Video processing error: {e}")
+                time.sleep(0.1)
+
+        if self.frame_source:
+            self.frame_source.close()
+        if self.manager.preroll_mode == 'dvr':
+            # Finishes the segment being written; the recording stays on disk
+            self.frame_buffer.clear()
+        self.manager.worker_stopped(self)
+        logger.info(f"[{self.stream_id}] Capture worker stopped")
+
+
+class IngestionManager:
+    def __init__(self, emit, detection_queue, sequence_length, frame_rate, buffer_seconds, clip_capture_enabled, window_stride=None,
+                 preroll_budget_bytes=512 * 1024 * 1024, preroll_mode='raw', frame_transport='binary', reconnect_delay=2.0,
+                 capture_factory=None, observe=None, detection_enabled=True, resize_interpolation='linear',
+                 motion_threshold=0.0, motion_hold_seconds=2.0, capture_mode='thread', frame_timestamp=None,
+                 encode_workers=0, viewers=None, segment_store=None):
+        self.emit = emit
+        # False while the model is still loading: frames are captured and streamed but not queued
+        self.detection_enabled = detection_enabled
+        # capture_factory(source) -> VideoCapture-like object; replaced by synthetic sources in benchmarks
+        self.capture_factory = capture_factory or cv2.VideoCapture
+        # observe(stage, stream_id, seconds) receives per-frame stage timings
+        self.observe = observe or _ignore_timing
+        self.detection_queue = detection_queue
+        self.sequence_length = sequence_length
+        # Frames between consecutive detection windows; sequence_length gives non-overlapping blocks
+        self.window_stride = min(max(1, int(window_stride or sequence_length)), sequence_length)
+        # Fallback rate for sources that do not report CAP_PROP_FPS
+        self.frame_rate = frame_rate
+        self.buffer_seconds = buffer_seconds
+        self.clip_capture_enabled = clip_capture_enabled
+        self.preroll_budget_bytes = preroll_budget_bytes
+        if preroll_mode not in PREROLL_MODES:
+            logger.warning(f"Unknown pre-roll mode {preroll_mode}, using 'raw'")
+            preroll_mode = 'raw'
+        # Required for the 'dvr' pre-roll mode: each stream records into segment_store.recorder(stream_id)
+        self.segment_store = segment_store
+        if preroll_mode == 'dvr' and segment_store is None:
+            logger.warning("The 'dvr' pre-roll mode needs a segment store, using 'jpeg'")
+            preroll_mode = 'jpeg'
+        self.preroll_mode = preroll_mode
+        if frame_transport not in FRAME_TRANSPORTS:
+            logger.warning(f"Unknown frame transport {frame_transport}, using 'binary'")
+            frame_transport = 'binary'
+        self.frame_transport = frame_transport
+        self.reconnect_delay = reconnect_delay
+        if resize_interpolation not in RESIZE_INTERPOLATIONS:
+            logger.warning(f"Unknown resize interpolation {resize_interpolation}, using 'linear'")
+            resize_interpolation = 'linear'
+        self.resize_interpolation = RESIZE_INTERPOLATIONS[resize_interpolation]
+        # Chunks whose changed-pixel fraction stays below motion_threshold are not sent to
+        # the model (0 disables the gate); see motion.MotionGate
+        self.motion_threshold = max(0.0, float(motion_threshold))
+        self.motion_hold_seconds = motion_hold_seconds
+        if capture_mode not in CAPTURE_MODES:
+            logger.warning(f"Unknown capture mode {capture_mode}, using 'thread'")
+            capture_mode = 'thread'
+        self.capture_mode = capture_mode
+        # frame_timestamp(cap) -> wall-clock time of the frame just retrieved (default: now);
+        # benchmarks substitute the synthetic source's exposure time
+        self.frame_timestamp = frame_timestamp
+        # Preview JPEG encoding shared by all streams; 0 workers encodes on each capture thread
+        self.encoder = EncoderPool(encode_workers, JPEG_QUALITY, observe=self.observe)
+        self.encoder.start()
+        # viewers.preview_tiers(stream_id) picks the preview tiers encoded for each frame, and
+        # each tier is emitted once to the stream's room for it. Without a registry full frames are broadcast.
+        self.viewers = viewers
+        self.workers = {}
+        # {stream_id: worker} asked to stop and not finished yet; a new worker for the
+        # stream is only started once the old one has exited
+        self.stopping = {}
+        self.lock = threading.Lock()
+        # Serializes start_stream, which may wait for a stopping worker outside self.lock
+        self.start_lock = threading.Lock()
+
+    def start_stream(self, stream_id, source, source_kind='webcam', camera_id=None, camera_name=None, fallback_source=None):
+        with self.start_lock:
+            with self.lock:
+                existing = self.workers.get(stream_id)
+                if existing and existing.is_alive():
+                    return existing
+                previous = self.stopping.get(stream_id)
+            if previous is not None:
+                previous.join(WORKER_STOP_TIMEOUT)
+                if previous.is_alive():
+                    raise RuntimeError(f"Capture worker {stream_id} did not stop within {WORKER_STOP_TIMEOUT}s")
+            worker = CameraWorker(self, stream_id, source, source_kind, camera_id, camera_name, fallback_source)
+            worker.start()
+            with self.lock:
+                self.workers[stream_id] = worker
+        logger.info(f"Started capture worker {stream_id} ({source_kind}: {source})")
+        return worker
+
+    def stop_stream(self, stream_id):
+        with self.lock:
+            worker = self.workers.pop(stream_id, None)
+            if worker is not None and worker.is_alive():
+                self.stopping[stream_id] = worker
+        if worker is None:
+            return False
+        worker.stop()
+        logger.info(f"Stopping capture worker {stream_id}")
+        return True
+
+    def worker_stopped(self, worker):
+        with self.lock:
+            if self.stopping.get(worker.stream_id) is worker:
+                del self.stopping[worker.stream_id]
+
+    def start_camera(self, camera):
+        return self.start_stream(camera_stream_id(camera['camera_id']), camera['source_uri'], 'webcam',
+                                 camera['camera_id'], camera['name'])
+
+    def sync_cameras(self, cameras):
+        wanted = {}
+        for camera in cameras:
+            if not camera['source_uri']:
+                logger.warning(f"Camera {camera['camera_id']} ({camera['name']}) has no source_uri, skipping")
+                continue
+            wanted[camera_stream_id(camera['camera_id'])] = camera
+        for stream_id in [s for s in self.stream_ids() if s != DEFAULT_STREAM and s not in wanted]:
+            self.stop_stream(stream_id)
+        for camera in wanted.values():
+            self.start_camera(camera)
+
+    def buffer_frames(self, fps):
+        return max(1, int(math.ceil(self.buffer_seconds * fps)))
+
+    def create_preroll_buffer(self, stream_id, fps):
+        if self.preroll_mode == 'dvr':
+            return self.segment_store.recorder(stream_id)
+        if self.preroll_mode == 'jpeg':
+            return JpegRingBuffer(self.buffer_frames(fps), self.preroll_budget_bytes)
+        return FrameRingBuffer(self.buffer_frames(fps), self.preroll_budget_bytes)
+
+    def get(self, stream_id):
+        with self.lock:
+            return self.workers.get(stream_id)
+
+    def stream_ids(self):
+        with self.lock:
+            return list(self.workers.keys())
+
+    def workers_snapshot(self):
+        with self.lock:
+            return list(self.workers.values())
+
+    def open_frame_source(self, cap, stream_id, fps, paced, loop):
+        return open_frame_source(self.capture_mode, cap, stream_id, fps, paced, loop,
+                                 timestamp=self.frame_timestamp, observe=self.observe)
+
+    def has_viewers(self, stream_id):
+        return self.viewers is None or self.viewers.has_viewers(stream_id)
+
+    def preview_tiers(self, stream_id):
+        return ('full',) if self.viewers is None else self.viewers.preview_tiers(stream_id)
+
+    def preview_sent(self, stream_id, sequence, tiers):
+        if self.viewers is not None:
+            self.viewers.frame_sent(stream_id, sequence, tiers)
+
+    def emit_preview(self, stream_id, event, payload, tier='full'):
+        if self.viewers is None:
+            self.emit(event, payload)
+        else:
+            self.emit(event, payload, to=preview_room(stream_id, tier))
+
+    def submit_frames(self, worker, frames, reset=False, captured_at=None):
+        if not self.detection_enabled:
+            return
+        self.detection_queue.put((worker.stream_id, frames, reset, time.time() if captured_at is None else captured_at))
+
+    def set_detection_enabled(self, enabled):
+        self.detection_enabled = enabled
+
+    def set_clip_capture(self, enabled):
+        self.clip_capture_enabled = enabled
+        # Turning alert clips off does not stop the DVR recording
+        if not enabled and self.preroll_mode != 'dvr':
+            for worker in self.workers_snapshot():
+                worker.clear_frame_buffer()
+
+    def set_buffer_seconds(self, buffer_seconds):
+        self.buffer_seconds = buffer_seconds
+        for worker in self.workers_snapshot():
+            worker.frame_buffer.resize(self.buffer_frames(worker.fps))
+
+    def stop_all(self):
+        for stream_id in self.stream_ids():
+            self.stop_stream(stream_id)
@@ -0,0 +1,166 @@
+from prometheus_client import CollectorRegistry, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Everything is registered on a private registry so /metrics only shows pipeline
+# metrics, not whatever else the process (or a test) registers globally.
+REGISTRY = CollectorRegistry()
+STAGES = ('capture', 'preprocess', 'motion_gate', 'inference', 'encode_wait', 'encode', 'emit', 'clip_write',
+          'detection_latency', 'alert_latency')
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+SEND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+stage_seconds = Histogram('sld_stage_seconds',
+                          'Pipeline stage latency per frame (inference: per batch; detection/alert_latency: frame capture to result/alert)',
+                          ['stage'], buckets=STAGE_BUCKETS, registry=REGISTRY)
+db_statement_seconds = Histogram('sld_db_statement_seconds', 'SQLite statement latency', ['operation'],
+                                 buckets=DB_BUCKETS, registry=REGISTRY)
+notification_send_seconds = Histogram('sld_notification_send_seconds', 'Notification send latency per attempt',
+                                      ['channel', 'outcome'], buckets=SEND_BUCKETS, registry=REGISTRY)
+detection_queue_depth = Gauge('sld_detection_queue_depth', 'Frame chunks waiting for the inference scheduler',
+                              registry=REGISTRY)
+encode_queue_depth = Gauge('sld_encode_queue_depth', 'Preview frames waiting for a JPEG encoder thread',
+                           registry=REGISTRY)
+
+# Resolving label children once keeps per-frame observations to a lock and a bucket scan
+_stage_children = {stage: stage_seconds.labels(stage) for stage in STAGES}
+
+
+def observe_stage(stage, stream_id, seconds):
+    child = _stage_children.get(stage)
+    if child is None:
+        child = _stage_children[stage] = stage_seconds.labels(stage)
+    child.observe(seconds)
+
+
+def observe_db(operation, seconds):
+    db_statement_seconds.labels(operation).observe(seconds)
+
+
+def observe_notification(channel, ok, seconds):
+    notification_send_seconds.labels(channel, 'sent' if ok else 'error').observe(seconds)
+
+
+def track_queue(queue):
+    detection_queue_depth.set_function(queue.qsize)
+
+
+def track_encoder(encoder):
+    encode_queue_depth.set_function(encoder.backlog)
+
+
+class ViewerCollector:
+    def __init__(self, viewers):
+        self.viewers = viewers
+
+    def collect(self):
+        snapshot = self.viewers.snapshot()
+        watching = GaugeMetricFamily('sld_preview_viewers', 'Socket.IO clients watching the live preview', labels=['tier'])
+        for tier, count in snapshot['tiers'].items():
+            watching.add_metric([tier], count)
+        held = GaugeMetricFamily('sld_preview_viewers_held',
+                                 'Preview clients held back on at least one stream until they acknowledge its backlog',
+                                 value=snapshot['held'])
+        dropped = CounterMetricFamily('sld_preview_client_frames_dropped',
+                                      'Preview frames not sent to a client because it was behind (connected clients)',
+                                      value=snapshot['frames_dropped'])
+        changes = CounterMetricFamily('sld_preview_tier_changes', 'Automatic preview tier changes', labels=['direction'])
+        for direction, count in snapshot['tier_changes'].items():
+            changes.add_metric([direction], count)
+        yield watching
+        yield held
+        yield dropped
+        yield changes
+
+
+def track_viewers(viewers):
+    REGISTRY.register(ViewerCollector(viewers))
+
+
+class SegmentStoreCollector:
+    def __init__(self, store):
+        self.store = store
+
+    def collect(self):
+        stats = self.store.stats()
+        yield GaugeMetricFamily('sld_dvr_bytes', 'Bytes of recorded segments on disk', value=stats['bytes'])
+        yield GaugeMetricFamily('sld_dvr_segments', 'Recorded segments on disk', value=stats['segments'])
+        yield CounterMetricFamily('sld_dvr_segments_deleted', 'Recorded segments removed by the size and age limits',
+                                  value=stats['segments_deleted'])
+
+
+def track_segment_store(store):
+    REGISTRY.register(SegmentStoreCollector(store))
+
+
+class StreamCollector:
+    # Per-source values are read from the capture workers at scrape time, so streams
+    # that are removed disappear from /metrics instead of leaving stale series.
+    def __init__(self, ingestion):
+        self.ingestion = ingestion
+        self.detection_queue = ingestion.detection_queue
+        # Set once the model is loaded; prices the frames the motion gate skipped
+        self.scheduler = None
+
+    def collect(self):
+        fps = GaugeMetricFamily('sld_source_fps', 'Achieved capture FPS per source', labels=['stream'])
+        target = GaugeMetricFamily('sld_source_target_fps', 'Native FPS reported by the source', labels=['stream'])
+        lateness = GaugeMetricFamily('sld_source_lateness_seconds', 'Age of the newest frame when the capture loop took it',
+                                     labels=['stream'])
+        dropped = CounterMetricFamily('sld_frames_dropped', 'Frames dropped before processing', labels=['stream', 'reason'])
+        gate_chunks = CounterMetricFamily('sld_motion_gate_chunks', 'Detection chunks seen by the motion gate',
+                                          labels=['stream', 'decision'])
+        gate_skip_rate = GaugeMetricFamily('sld_motion_gate_skip_ratio', 'Fraction of detection chunks skipped as static',
+                                           labels=['stream'])
+        # Estimates: skipped frames priced at the current measured per-frame cost, so they
+        # can go down when that cost is re-measured, which a counter must not
+        gate_saved = GaugeMetricFamily('sld_motion_gate_cpu_saved_seconds',
+                                       'Inference time not spent on skipped frames (estimated)', labels=['stream'])
+        encoded = CounterMetricFamily('sld_frames_encoded', 'Preview frames JPEG-encoded', labels=['stream'])
+        preview_skipped = CounterMetricFamily('sld_preview_frames_skipped', 'Preview frames not emitted because nobody watched',
+                                              labels=['stream'])
+        preview_saved = GaugeMetricFamily('sld_preview_cpu_saved_seconds',
+                                          'Encode and emit time not spent on unwatched streams (estimated)', labels=['stream'])
+        seconds_per_frame = self.scheduler.seconds_per_frame() if self.scheduler else 0.0
+        for worker in self.ingestion.workers_snapshot():
+            stats = worker.pacer.stats()
+            fps.add_metric([worker.stream_id], stats['achieved_fps'])
+            target.add_metric([worker.stream_id], stats['target_fps'])
+            lateness.add_metric([worker.stream_id], stats['lateness_ms'] / 1000.0)
+            dropped.add_metric([worker.stream_id, 'late'], stats['frames_skipped'])
+            encode = worker.encode_lane.stats()
+            encoded.add_metric([worker.stream_id], encode['frames_encoded'])
+            dropped.add_metric([worker.stream_id, 'encode_stale'], encode['encode_frames_dropped'])
+            preview = worker.preview_stats()
+            preview_skipped.add_metric([worker.stream_id], preview['frames_skipped'])
+            preview_saved.add_metric([worker.stream_id], preview['cpu_saved_seconds'])
+            gate = worker.motion_gate.stats()
+            gate_chunks.add_metric([worker.stream_id, 'passed'], gate['passed_chunks'])
+            gate_chunks.add_metric([worker.stream_id, 'skipped'], gate['skipped_chunks'])
+            gate_skip_rate.add_metric([worker.stream_id], gate['skip_rate'])
+            gate_saved.add_metric([worker.stream_id], gate['skipped_frames'] * seconds_per_frame)
+        # Detection drops stay reported for removed streams: they are cumulative counters
+        if hasattr(self.detection_queue, 'drop_counts'):
+            for (stream_id, reason), frames in sorted(self.detection_queue.drop_counts().items()):
+                dropped.add_metric([stream_id, reason], frames)
+        yield fps
+        yield target
+        yield lateness
+        yield dropped
+        yield encoded
+        yield preview_skipped
+        yield preview_saved
+        yield gate_chunks
+        yield gate_skip_rate
+        yield gate_saved
+
+
+def track_streams(ingestion):
+    collector = StreamCollector(ingestion)
+    REGISTRY.register(collector)
+    return collector
+
+
+def render():
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
@@ -0,0 +1,75 @@
+import numpy as np
+
+# A downscaled pixel counts as changed when any channel moved by more than this
+PIXEL_DELTA = 25
+
+
+class MotionGate:
+    # Decides per detection chunk whether the scene is active enough to be worth a
+    # model call, using frame differencing on the 64x64 frames the worker already
+    # produced. The score is the largest fraction of changed pixels between any two
+    # consecutive frames. Once activity is seen the gate stays open for hold_seconds,
+    # so someone pausing mid-action is still analysed.
+    def __init__(self, threshold, hold_seconds=2.0, pixel_delta=PIXEL_DELTA):
+        self.threshold = threshold
+        self.hold_seconds = hold_seconds
+        self.pixel_delta = pixel_delta
+        self.passed_chunks = 0
+        self.skipped_chunks = 0
+        self.skipped_frames = 0
+        self.last_score = 0.0
+        self.reset()
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def reset(self):
+        self.previous = None
+        self.open_until = 0.0
+        self.held = None
+
+    def score(self, chunk):
+        frames = chunk if self.previous is None else np.concatenate((self.previous[np.newaxis], chunk))
+        self.previous = chunk[-1].copy()
+        if len(frames) < 2:
+            return 0.0
+        diff = np.abs(frames[1:].astype(np.int16) - frames[:-1])
+        changed = diff.max(axis=-1) > self.pixel_delta
+        return float(changed.mean(axis=(1, 2)).max())
+
+    def filter(self, chunk, now):
+        # Returns (frames, resumed) to submit, or None to skip the chunk. When the gate
+        # reopens, the last skipped chunk is prepended so the first window after the
+        # gap is made of contiguous frames; resumed tells the caller to reset the
+        # stream's window, which no longer continues from what was last submitted.
+        if not self.enabled:
+            return chunk, False
+        self.last_score = self.score(chunk)
+        if self.last_score >= self.threshold:
+            self.open_until = now + self.hold_seconds
+        if now >= self.open_until:
+            if self.held is not None:
+                self.skipped_frames += len(self.held)
+            self.held = chunk
+            self.skipped_chunks += 1
+            return None
+        self.passed_chunks += 1
+        if self.held is None:
+            return chunk, False
+        # The held chunk was counted as skipped but is analysed after all
+        held, self.held = self.held, None
+        self.skipped_chunks -= 1
+        return np.concatenate((held, chunk)), True
+
+    def stats(self):
+        total = self.passed_chunks + self.skipped_chunks
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'last_score': round(self.last_score, 4),
+            'passed_chunks': self.passed_chunks,
+            'skipped_chunks': self.skipped_chunks,
+            'skipped_frames': self.skipped_frames + (0 if self.held is None else len(self.held)),
+            'skip_rate': round(self.skipped_chunks / total, 4) if total else 0.0,
+        }
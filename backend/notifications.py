@@ -0,0 +1,249 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationJob:
+    def __init__(self, notification_id, alert_id, channel, recipient, message, subject=None, attachment=None, on_done=None):
+        self.notification_id = notification_id
+        self.alert_id = alert_id
+        self.channel = channel
+        self.recipient = recipient
+        self.message = message
+        self.subject = subject
+        self.attachment = attachment
+        self.on_done = on_done
+        self.attempts = 0
+
+
+def build_email(sender, recipient, subject, body, attachment=None):
+    # Imported on first use: servers without email alerts never load the MIME machinery
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.mime.base import MIMEBase
+    from email import encoders
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg.attach(MIMEText(body, 'plain'))
+    if attachment and os.path.exists(attachment):
+        with open(attachment, 'rb') as f:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(f.read())
+            encoders.encode_base64(part)
+            part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment)}')
+            msg.attach(part)
+    return msg
+
+
+class SmtpMailer:
+    # Keeps one authenticated SMTP session per sending thread and reconnects when the
+    # server drops it, instead of a connect/STARTTLS/login round-trip per alert.
+    # smtplib is imported on first send, like the Twilio client below.
+    def __init__(self, host, port, user=None, password=None, use_tls=True, timeout=30, idle_check_seconds=60):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_check_seconds = idle_check_seconds
+        self.local = threading.local()
+
+    def _connect(self):
+        import smtplib
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        logger.info(f"SMTP session opened to {self.host}:{self.port}")
+        return server
+
+    def _session(self):
+        import smtplib
+        server = getattr(self.local, 'server', None)
+        last_used = getattr(self.local, 'last_used', 0)
+        if server is not None and time.monotonic() - last_used > self.idle_check_seconds:
+            try:
+                if server.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("NOOP failed")
+            except (smtplib.SMTPException, OSError):
+                self._close()
+                server = None
+        if server is None:
+            server = self.local.server = self._connect()
+        return server
+
+    def _close(self):
+        import smtplib
+        server = getattr(self.local, 'server', None)
+        self.local.server = None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+    def send(self, msg):
+        import smtplib
+        try:
+            self._session().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+            # Stale session: reconnect once, let any further error reach the retry logic
+            self._close()
+            self._session().send_message(msg)
+        self.local.last_used = time.monotonic()
+
+    def send_job(self, job):
+        self.send(build_email(self.user, job.recipient, job.subject, job.message, job.attachment))
+
+
+class SmsSender:
+    def __init__(self, from_number, client_factory):
+        self.from_number = from_number
+        self.client_factory = client_factory
+        self.client = None
+        self.lock = threading.Lock()
+
+    def send_job(self, job):
+        with self.lock:
+            if self.client is None:
+                self.client = self.client_factory()
+        message = self.client.messages.create(body=job.message, from_=self.from_number, to=job.recipient)
+        logger.info(f"SMS alert sent successfully: SID {getattr(message, 'sid', None)}")
+
+
+def twilio_client_factory(account_sid, auth_token):
+    def factory():
+        from twilio.rest import Client
+        return Client(account_sid, auth_token)
+    return factory
+
+
+class NotificationOutbox:
+    # Notifications rows are written as 'pending' and delivered by a dispatcher thread
+    # through per-channel thread pools (the pool size is the channel's concurrency
+    # limit). Failed sends are retried with exponential backoff before being marked failed.
+    def __init__(self, db, senders, concurrency=None, max_attempts=5, base_delay=2.0, max_delay=300.0, observe=None):
+        self.db = db
+        # observe(channel, ok, seconds) per send attempt
+        self.observe = observe
+        self.senders = senders
+        concurrency = concurrency or {}
+        self.executors = {channel: ThreadPoolExecutor(max_workers=max(1, int(concurrency.get(channel, 1))),
+                                                      thread_name_prefix=f"notify-{channel}")
+                          for channel in senders}
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.schedule = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self._stopping = False
+
+    def start(self):
+        self._recover_pending()
+        self.thread = threading.Thread(target=self._dispatch, name="notification-dispatcher", daemon=True)
+        self.thread.start()
+
+    def _recover_pending(self):
+        rows = self.db.fetch("SELECT notification_id, alert_id, type, recipient, message FROM Notifications WHERE status='pending'")
+        for row in rows:
+            if row['type'] in self.senders:
+                subject = "Shoplifting Alert" if row['type'] == 'email' else None
+                self._schedule(NotificationJob(row['notification_id'], row['alert_id'], row['type'], row['recipient'],
+                                               row['message'], subject), 0)
+        if rows:
+            logger.info(f"Recovered {len(rows)} pending notification(s)")
+
+    def enqueue(self, alert_id, channel, recipient, message, subject=None, attachment=None, on_done=None, tx=None, hold=False):
+        # With tx the row joins the caller's unit of work and is only dispatched after commit.
+        # Held jobs wait for release(), e.g. until their attachment has been written.
+        notification_id = (tx or self.db).execute(
+            "INSERT INTO Notifications (alert_id, type, recipient, sent_time, status, message) VALUES (?, ?, ?, ?, ?, ?)",
+            (alert_id, channel, recipient, datetime.now(), 'pending', message))
+        job = NotificationJob(notification_id, alert_id, channel, recipient, message, subject, attachment, on_done)
+        if not hold:
+            if tx is not None:
+                tx.on_commit(lambda: self._schedule(job, 0))
+            else:
+                self._schedule(job, 0)
+        return job
+
+    def release(self, job, attachment=None):
+        if attachment is not None:
+            job.attachment = attachment
+        self._schedule(job, 0)
+
+    def pending(self):
+        with self.condition:
+            return len(self.schedule)
+
+    def _schedule(self, job, delay):
+        with self.condition:
+            heapq.heappush(self.schedule, (time.monotonic() + delay, next(self.counter), job))
+            self.condition.notify()
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                while not self._stopping and (not self.schedule or self.schedule[0][0] > time.monotonic()):
+                    timeout = self.schedule[0][0] - time.monotonic() if self.schedule else None
+                    self.condition.wait(timeout)
+                if self._stopping:
+                    break
+                _, _, job = heapq.heappop(self.schedule)
+            self.executors[job.channel].submit(self._deliver, job)
+
+    def _deliver(self, job):
+        job.attempts += 1
+        started = time.perf_counter()
+        try:
+            self.senders[job.channel](job)
+        except Exception as e:
+            if self.observe:
+                self.observe(job.channel, False, time.perf_counter() - started)
+            if job.attempts < self.max_attempts:
+                delay = min(self.max_delay, self.base_delay * (2 ** (job.attempts - 1)))
+                delay *= random.uniform(0.8, 1.2)
+                logger.warning(f"Failed to send {job.channel} notification {job.notification_id} "
+                               f"(attempt {job.attempts}/{self.max_attempts}), retrying in {delay:.1f}s: {e}")
+                self._schedule(job, delay)
+                return
+            logger.error(f"Failed to send {job.channel} notification {job.notification_id} after {job.attempts} attempts: {e}")
+            self._finish(job, 'failed')
+            return
+        if self.observe:
+            self.observe(job.channel, True, time.perf_counter() - started)
+        logger.info(f"{job.channel.capitalize()} notification {job.notification_id} sent")
+        self._finish(job, 'sent')
+
+    def _finish(self, job, status):
+        try:
+            self.db.execute("UPDATE Notifications SET status=?, sent_time=? WHERE notification_id=?",
+                            (status, datetime.now(), job.notification_id))
+        except Exception as e:
+            logger.error(f"Failed to update notification {job.notification_id}: {e}")
+        if job.on_done:
+            try:
+                job.on_done(job, status == 'sent')
+            except Exception as e:
+                logger.error(f"Notification completion handler error: {e}")
+
+    def stop(self):
+        with self.condition:
+            self._stopping = True
+            self.condition.notify()
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
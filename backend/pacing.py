@@ -0,0 +1,87 @@
+import cv2
+import math
+import time
+from collections import deque
+
+MIN_SOURCE_FPS = 1.0
+MAX_SOURCE_FPS = 240.0
+
+
+def source_fps(cap, default_fps):
+    # Webcams and some containers report 0 or nonsense for CAP_PROP_FPS
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not fps or math.isnan(fps) or fps < MIN_SOURCE_FPS or fps > MAX_SOURCE_FPS:
+        return float(default_fps)
+    return float(fps)
+
+
+class FramePacer:
+    # Paces a capture loop against absolute deadlines (start + n / fps) rather than a
+    # fixed sleep after each frame, so per-frame work does not slow playback down.
+    # When the loop falls more than one interval behind, wait() returns how many
+    # source frames to skip to catch up instead of accumulating lag.
+    def __init__(self, fps, sleep_to_deadline=True, stats_window=2.0):
+        self.stats_window = stats_window
+        self.frames_presented = 0
+        self.frames_skipped = 0
+        self.reset(fps, sleep_to_deadline)
+
+    def reset(self, fps, sleep_to_deadline=True):
+        self.fps = float(fps)
+        self.interval = 1.0 / self.fps
+        # Live devices block in read() until the next frame, so only files are slept to the deadline
+        self.sleep_to_deadline = sleep_to_deadline
+        self.next_deadline = None
+        self.lateness = 0.0
+        self.max_lateness = 0.0
+        self.frame_times = deque()
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_deadline is None:
+            self.next_deadline = now + self.interval
+            self._record(now)
+            return 0
+        if self.sleep_to_deadline and now < self.next_deadline:
+            time.sleep(self.next_deadline - now)
+            now = time.monotonic()
+        lateness = max(0.0, now - self.next_deadline)
+        skip = int(lateness // self.interval)
+        self.next_deadline += (skip + 1) * self.interval
+        if self.next_deadline < now:
+            self.next_deadline = now + self.interval
+        self.lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.frames_skipped += skip
+        self._record(now)
+        return skip
+
+    def present(self, skipped=0, lateness=0.0):
+        # For loops fed by a grab thread, which paces the source itself: records a
+        # consumed frame, the frames it superseded and how old it already was
+        self.lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.frames_skipped += skipped
+        self._record(time.monotonic())
+
+    def _record(self, now):
+        self.frames_presented += 1
+        self.frame_times.append(now)
+        while self.frame_times and now - self.frame_times[0] > self.stats_window:
+            self.frame_times.popleft()
+
+    def achieved_fps(self):
+        times = self.frame_times
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def stats(self):
+        return {
+            'target_fps': round(self.fps, 2),
+            'achieved_fps': round(self.achieved_fps(), 2),
+            'lateness_ms': round(self.lateness * 1000, 2),
+            'max_lateness_ms': round(self.max_lateness * 1000, 2),
+            'frames_presented': self.frames_presented,
+            'frames_skipped': self.frames_skipped,
+        }
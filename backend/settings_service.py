@@ -0,0 +1,143 @@
+import threading
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_FIELDS = {
+    'email_enabled': bool,
+    'sms_enabled': bool,
+    'clip_capture_enabled': bool,
+    'clip_duration_seconds': float,
+    'logging_enabled': bool,
+    'cooldown_seconds': int,
+}
+COOLDOWN_CHANNELS = ('email', 'sms')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class SettingsService:
+    # The Settings row is read once at startup. Reads and cooldown checks are served
+    # from memory (cooldowns on the monotonic clock); changes, last_*_time stamps and
+    # their audit entries are written behind by a flusher thread.
+    def __init__(self, db, emit, flush_interval=1.0):
+        self.db = db
+        self.emit = emit
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.values = {}
+        self.last_sent = {}
+        self.dirty_fields = set()
+        self.dirty_times = {}
+        self.pending_audit = []
+        self.wakeup = threading.Event()
+        self.thread = None
+        self._stopping = False
+
+    def load(self):
+        rows = self.db.fetch("SELECT * FROM Settings WHERE setting_id=1")
+        if not rows:
+            self.db.execute("INSERT INTO Settings (setting_id, email_enabled, sms_enabled, clip_capture_enabled, clip_duration_seconds, cooldown_seconds, logging_enabled) VALUES (1, 0, 0, 0, 6.0, 60, 1)")
+            rows = self.db.fetch("SELECT * FROM Settings WHERE setting_id=1")
+        row = rows[0]
+        now_wall, now_mono = datetime.now(), time.monotonic()
+        with self.lock:
+            self.values = {name: cast(row[name]) for name, cast in SETTINGS_FIELDS.items()}
+            for channel in COOLDOWN_CHANNELS:
+                last_time = row[f"last_{channel}_time"]
+                if last_time:
+                    elapsed = (now_wall - datetime.strptime(last_time, TIME_FORMAT)).total_seconds()
+                    self.last_sent[channel] = now_mono - max(0.0, elapsed)
+        return self.snapshot()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._flush_loop, name="settings-writer", daemon=True)
+        self.thread.start()
+
+    def get(self, name):
+        return self.values[name]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def update(self, audit=None, **changes):
+        # Applies changes in memory, queues them for the database and broadcasts only
+        # the fields whose value actually changed. Returns that dict.
+        changed = {}
+        with self.lock:
+            for name, value in changes.items():
+                value = SETTINGS_FIELDS[name](value)
+                if self.values.get(name) != value:
+                    self.values[name] = value
+                    self.dirty_fields.add(name)
+                    changed[name] = value
+            if audit:
+                self.pending_audit.append(audit)
+        if changed or audit:
+            self.wakeup.set()
+        if changed:
+            self.emit('notification_status', changed)
+        return changed
+
+    def audit(self, action, details):
+        with self.lock:
+            self.pending_audit.append((action, details))
+        self.wakeup.set()
+
+    def try_acquire_cooldown(self, channel):
+        # Atomic check-and-stamp so concurrent alerts cannot both pass the cooldown
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_sent.get(channel)
+            if last is not None and now - last < self.values['cooldown_seconds']:
+                return False
+            self.last_sent[channel] = now
+            self.dirty_times[channel] = datetime.now().strftime(TIME_FORMAT)
+        self.wakeup.set()
+        return True
+
+    def _flush_loop(self):
+        while not self._stopping:
+            self.wakeup.wait()
+            # Coalesce bursts of toggles into one write
+            time.sleep(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            fields = {name: self.values[name] for name in self.dirty_fields}
+            times = dict(self.dirty_times)
+            audit = list(self.pending_audit)
+            self.dirty_fields.clear()
+            self.dirty_times.clear()
+            self.pending_audit.clear()
+        if not fields and not times and not audit:
+            return
+        assignments = [f"{name}=?" for name in fields] + [f"last_{channel}_time=?" for channel in times]
+        params = [int(v) if isinstance(v, bool) else v for v in fields.values()] + list(times.values())
+        try:
+            with self.db.transaction() as tx:
+                if fields:
+                    assignments.append("last_updated=?")
+                    params.append(datetime.now())
+                if assignments:
+                    tx.execute(f"UPDATE Settings SET {', '.join(assignments)} WHERE setting_id=1", tuple(params))
+                for action, details in audit:
+                    tx.execute("INSERT INTO AuditLog (action, details) VALUES (?, ?)", (action, details))
+        except Exception as e:
+            logger.error(f"Failed to persist settings: {e}")
+            with self.lock:
+                for name in fields:
+                    self.dirty_fields.add(name)
+                for channel, value in times.items():
+                    self.dirty_times.setdefault(channel, value)
+                self.pending_audit[:0] = audit
+            self.wakeup.set()
+
+    def stop(self):
+        self._stopping = True
+        self.wakeup.set()
+        self.flush()
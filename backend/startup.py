@@ -0,0 +1,69 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+STARTUP_STATES = ('starting', 'loading_model', 'warming_up', 'ready', 'failed')
+
+
+class StartupTracker:
+    # Records how long each startup phase took and the server's readiness state.
+    # The web server binds before the model is loaded; clients learn when detection
+    # is available from the 'server_status' event or GET /ready.
+    def __init__(self, emit=None):
+        self.emit = emit
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.state = 'starting'
+        self.error = None
+        self.phases = []
+        self.ready_after = None
+        self.last_mark = time.perf_counter()
+
+    def _record(self, name, seconds):
+        with self.lock:
+            self.phases.append((name, seconds))
+        logger.info(f"Startup phase '{name}' took {seconds:.3f}s")
+
+    def mark(self, name):
+        # Module-level phases: everything since the previous mark belongs to name
+        now = time.perf_counter()
+        self._record(name, now - self.last_mark)
+        self.last_mark = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - started)
+
+    def set_state(self, state, error=None):
+        with self.lock:
+            self.state = state
+            self.error = error
+            if state == 'ready':
+                self.ready_after = time.monotonic() - self.started
+        if state == 'ready':
+            logger.info(f"Server ready {self.ready_after:.2f}s after start")
+        elif state == 'failed':
+            logger.error(f"Startup failed: {error}")
+        if self.emit:
+            self.emit('server_status', self.snapshot())
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'ready': self.state == 'ready',
+                'error': self.error,
+                'phases': [{'name': name, 'seconds': round(seconds, 3)} for name, seconds in self.phases],
+                'ready_after_seconds': None if self.ready_after is None else round(self.ready_after, 3),
+            }
@@ -0,0 +1,65 @@
+import time
+
+import cv2
+import numpy as np
+
+from clip_writer import ClipJob, ClipWriterPool
+
+
+class FakePreroll:
+    # Frames stamped at 10 FPS over [start, end], like a recorder that covers the whole range
+    def iter_range(self, start_time, end_time):
+        timestamp = start_time
+        while timestamp <= end_time:
+            yield timestamp, np.zeros((48, 64, 3), dtype=np.uint8)
+            timestamp += 0.1
+
+
+def test_a_clip_waiting_for_its_post_roll_does_not_hold_a_writer(tmp_path):
+    events = []
+    finished = []
+    pool = ClipWriterPool(1, lambda event, data: events.append((event, data['alert_id'], data.get('state'))))
+    pool.start()
+    now = time.time()
+    waiting = ClipJob(1, 'default', FakePreroll(), now - 1.0, now + 0.5, str(tmp_path / 'waiting.mp4'), 10,
+                      on_complete=lambda job, ok: finished.append((job.alert_id, ok, time.time())))
+    ready = ClipJob(2, 'default', FakePreroll(), now - 2.0, now - 1.0, str(tmp_path / 'ready.mp4'), 10,
+                    on_complete=lambda job, ok: finished.append((job.alert_id, ok, time.time())))
+    pool.submit(waiting)
+    pool.submit(ready)
+    assert pool.pending() == 2
+    pool.join()
+    assert pool.pending() == 0
+    pool.stop()
+    assert [(alert_id, ok) for alert_id, ok, _ in finished] == [(2, True), (1, True)]
+    assert finished[0][2] < waiting.end_time <= finished[1][2]
+    assert ('clip_progress', 1, 'recording') in events
+    assert events.index(('clip_completed', 2, None)) < events.index(('clip_progress', 1, 'queued'))
+
+
+class ResizingPreroll:
+    # The source switches to a higher resolution halfway through the range
+    def iter_range(self, start_time, end_time):
+        for i in range(20):
+            size = (48, 64) if i < 10 else (96, 128)
+            yield start_time + i * 0.1, np.full(size + (3,), i * 10, dtype=np.uint8)
+
+
+def test_frames_of_another_size_are_resized_to_the_clip(tmp_path):
+    pool = ClipWriterPool(1, lambda event, data: None)
+    pool.start()
+    now = time.time()
+    job = ClipJob(1, 'default', ResizingPreroll(), now - 3.0, now - 1.0, str(tmp_path / 'clip.mp4'), 10)
+    pool.submit(job)
+    pool.join()
+    pool.stop()
+    assert job.frames_written == 20
+    capture = cv2.VideoCapture(job.clip_path)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame.shape)
+    capture.release()
+    assert frames == [(48, 64, 3)] * 20
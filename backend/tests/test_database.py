@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'test.db'), max_connections=4)
+    database.execute("CREATE TABLE Items (item_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL)")
+    yield database
+    database.close_all()
+
+
+def test_short_lived_threads_share_a_bounded_set_of_connections(db):
+    def insert(i):
+        db.execute("INSERT INTO Items (name) VALUES (?)", (f"item-{i}",))
+        db.fetch("SELECT COUNT(*) FROM Items")
+
+    for batch in range(20):
+        threads = [threading.Thread(target=insert, args=(batch * 10 + i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert db.fetch("SELECT COUNT(*) AS n FROM Items")[0]['n'] == 200
+    stats = db.stats()
+    assert stats['open'] <= 4
+    assert stats['idle'] == stats['open']
+
+
+def test_transaction_statements_use_its_connection_and_roll_back_together(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction() as tx:
+            tx.execute("INSERT INTO Items (name) VALUES (?)", ("kept?",))
+            # Statements through the database itself join the open transaction
+            db.execute("INSERT INTO Items (name) VALUES (?)", ("kept?",))
+            assert db.fetch("SELECT COUNT(*) AS n FROM Items")[0]['n'] == 2
+            raise RuntimeError("abort")
+    assert db.fetch("SELECT COUNT(*) AS n FROM Items")[0]['n'] == 0
+    assert db.stats()['idle'] == db.stats()['open']
+
+
+def test_commit_callbacks_run_after_the_connection_is_returned(db):
+    seen = []
+    with db.transaction() as tx:
+        item_id = tx.execute("INSERT INTO Items (name) VALUES (?)", ("a",))
+        with db.transaction() as nested:
+            assert nested is tx
+        tx.on_commit(lambda: seen.append(db.fetch("SELECT name FROM Items WHERE item_id=?", (item_id,))[0]['name']))
+    assert seen == ['a']
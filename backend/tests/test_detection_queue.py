@@ -0,0 +1,55 @@
+import numpy as np
+
+from inference import DetectionQueue
+
+
+def chunk(stream_id, captured_at, frames=2):
+    return stream_id, np.zeros((frames, 4, 4, 3), dtype=np.uint8), False, captured_at
+
+
+def drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+        queue.task_done()
+    return [(stream_id, captured_at, reset) for stream_id, _, reset, captured_at in items]
+
+
+def test_evicted_chunk_resets_the_incoming_chunk_of_the_same_stream():
+    queue = DetectionQueue(capacity=2, policy='drop_oldest')
+    queue.put(chunk('A', 1))
+    queue.put(chunk('B', 2))
+    queue.put(chunk('A', 3))
+    assert drain(queue) == [('B', 2, False), ('A', 3, True)]
+    queue.put(chunk('A', 4))
+    assert drain(queue) == [('A', 4, False)]
+    assert queue.drops_for('A') == {'overflow': 2}
+    assert queue.unfinished_tasks == 0
+
+
+def test_evicted_chunk_resets_the_next_queued_chunk_of_its_stream():
+    queue = DetectionQueue(capacity=2, policy='drop_oldest')
+    queue.put(chunk('A', 1))
+    queue.put(chunk('A', 2))
+    queue.put(chunk('A', 3))
+    assert drain(queue) == [('A', 2, True), ('A', 3, False)]
+
+
+def test_evicted_stream_without_queued_chunks_resets_its_next_put():
+    queue = DetectionQueue(capacity=2, policy='drop_oldest')
+    queue.put(chunk('B', 1))
+    queue.put(chunk('A', 2))
+    queue.put(chunk('A', 3))
+    assert drain(queue) == [('A', 2, False), ('A', 3, False)]
+    queue.put(chunk('B', 4))
+    assert drain(queue) == [('B', 4, True)]
+
+
+def test_drop_newest_resets_the_streams_next_chunk():
+    queue = DetectionQueue(capacity=1, policy='drop_newest')
+    queue.put(chunk('A', 1))
+    queue.put(chunk('A', 2))
+    assert drain(queue) == [('A', 1, False)]
+    queue.put(chunk('A', 3))
+    assert drain(queue) == [('A', 3, True)]
+    assert queue.drops_for('A') == {'overflow': 2}
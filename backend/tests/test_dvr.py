@@ -0,0 +1,32 @@
+import os
+import time
+
+from dvr import SegmentStore
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_segments_expire_while_no_new_segment_is_finished(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_seconds=1, max_age_seconds=0.5, retention_interval=0.05)
+    recorder = store.recorder('default')
+    now = time.time()
+    recorder.append(b'jpeg', now - 0.2)
+    recorder.append(b'jpeg', now - 0.1)
+    # The stream stops: its last segment is finished and nothing is recorded after it
+    recorder.clear()
+    assert store.stats()['segments'] == 1
+    path = recorder.segments[0].path
+    store.start()
+    try:
+        assert wait_for(lambda: store.stats()['segments'] == 0)
+    finally:
+        store.close()
+    assert not os.path.exists(path)
+    assert store.stats() == {'bytes': 0, 'segments': 0, 'segments_deleted': 1}
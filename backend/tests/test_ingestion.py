@@ -0,0 +1,82 @@
+import threading
+import time
+
+import numpy as np
+
+from ingestion import IngestionManager
+
+
+class Device:
+    # A capture device that only one reader may hold at a time; reads take a while, like
+    # a camera waiting for its next frame
+    def __init__(self, read_seconds=0.2):
+        self.read_seconds = read_seconds
+        self.lock = threading.Lock()
+        self.holders = 0
+        self.max_holders = 0
+        self.opened = 0
+
+    def open(self, source):
+        with self.lock:
+            self.holders += 1
+            self.opened += 1
+            self.max_holders = max(self.max_holders, self.holders)
+        return Capture(self)
+
+
+class Capture:
+    def __init__(self, device):
+        self.device = device
+        self.released = False
+
+    def isOpened(self):
+        return not self.released
+
+    def get(self, prop):
+        return 0
+
+    def grab(self):
+        return True
+
+    def read(self):
+        time.sleep(self.device.read_seconds)
+        return True, np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            with self.device.lock:
+                self.device.holders -= 1
+
+
+class Queue:
+    def put(self, item):
+        pass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_a_restarted_stream_waits_for_its_previous_worker():
+    device = Device()
+    manager = IngestionManager(lambda *args, **kwargs: None, Queue(), 4, 10, 1, False, capture_factory=device.open,
+                               capture_mode='inline')
+    try:
+        first = manager.start_stream('cam-1', '0')
+        assert wait_for(lambda: first.frame_sequence > 0 or first.latest_frame is not None)
+        manager.stop_stream('cam-1')
+        second = manager.start_stream('cam-1', '0')
+        assert second is not first
+        assert not first.is_alive()
+        assert wait_for(lambda: device.opened == 2 and second.latest_frame is not None)
+        assert manager.get('cam-1') is second
+        assert manager.stopping == {}
+    finally:
+        manager.stop_all()
+    assert device.max_holders == 1
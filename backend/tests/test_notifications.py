@@ -0,0 +1,217 @@
+import os
+import socketserver
+import sqlite3
+import threading
+import time
+from email import message_from_bytes
+
+import pytest
+
+import notifications
+from database import Database
+from notifications import NotificationOutbox, SmsSender, SmtpMailer
+
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db', 'create_db.sql')
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib: MAIL FROM is refused with a transient 451 while the
+    # server still has failures to hand out
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost SMTP stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii').strip().split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'MAIL':
+                with self.server.lock:
+                    failing = self.server.failures > 0
+                    self.server.failures -= failing
+                self.reply('451 Try again later' if failing else '250 OK')
+            elif command in ('RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b''):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                self.server.messages.append(message_from_bytes(b''.join(lines)))
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, failures=0):
+        super().__init__(('127.0.0.1', 0), SmtpHandler)
+        self.lock = threading.Lock()
+        self.failures = failures
+        self.messages = []
+
+
+class FakeSmsClient:
+    # Stands in for twilio.rest.Client: messages.create() fails while failures remain
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.messages = self
+
+    def create(self, body, from_, to):
+        self.calls.append({'body': body, 'from_': from_, 'to': to})
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("SMS gateway unavailable")
+        return type('Message', (), {'sid': f"SM{len(self.calls)}"})()
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'alerts.db')
+    with open(SCHEMA) as f:
+        conn = sqlite3.connect(path)
+        conn.executescript(f.read())
+        conn.close()
+    database = Database(path)
+    database.execute("INSERT INTO Alerts (confidence, source) VALUES (?, ?)", (0.9, 'webcam'))
+    yield database
+    database.close_all()
+
+
+@pytest.fixture
+def smtp_server():
+    server = SmtpStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(notifications.random, 'uniform', lambda low, high: 1.0)
+
+
+def mailer_for(server):
+    return SmtpMailer('127.0.0.1', server.server_address[1], user='alerts@example.com', use_tls=False, timeout=5)
+
+
+def sms_sender(client):
+    return SmsSender('+15550000000', lambda: client)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def statuses(db):
+    return {row['notification_id']: row['status'] for row in db.fetch("SELECT notification_id, status FROM Notifications")}
+
+
+def test_email_is_retried_with_backoff_until_the_server_accepts(db, smtp_server, no_jitter):
+    smtp_server.failures = 2
+    attempts = []
+    outbox = NotificationOutbox(db, {'email': mailer_for(smtp_server).send_job}, max_attempts=5, base_delay=0.05,
+                                observe=lambda channel, ok, seconds: attempts.append((time.monotonic(), ok)))
+    done = []
+    outbox.start()
+    try:
+        job = outbox.enqueue(1, 'email', 'owner@example.com', "Shoplifting detected", subject="Shoplifting Alert",
+                             on_done=lambda job, ok: done.append(ok))
+        assert wait_for(lambda: done)
+    finally:
+        outbox.stop()
+    assert done == [True]
+    assert job.attempts == 3
+    assert statuses(db) == {job.notification_id: 'sent'}
+    assert [ok for _, ok in attempts] == [False, False, True]
+    # base_delay, then twice that
+    assert attempts[1][0] - attempts[0][0] >= 0.05
+    assert attempts[2][0] - attempts[1][0] >= 0.1
+    assert len(smtp_server.messages) == 1
+    assert smtp_server.messages[0]['To'] == 'owner@example.com'
+    assert smtp_server.messages[0]['Subject'] == "Shoplifting Alert"
+
+
+def test_backoff_is_capped_at_max_delay(db, no_jitter):
+    client = FakeSmsClient(failures=3)
+    outbox = NotificationOutbox(db, {'sms': sms_sender(client).send_job}, max_attempts=5, base_delay=0.05, max_delay=0.06)
+    delays = []
+    schedule = outbox._schedule
+    outbox._schedule = lambda job, delay: (delays.append(delay), schedule(job, delay))
+    done = []
+    outbox.start()
+    try:
+        outbox.enqueue(1, 'sms', '+15551234567', "Shoplifting detected", on_done=lambda job, ok: done.append(ok))
+        assert wait_for(lambda: done)
+    finally:
+        outbox.stop()
+    assert done == [True]
+    assert delays == [0, 0.05, 0.06, 0.06]
+
+
+def test_sms_gives_up_after_max_attempts(db, no_jitter):
+    client = FakeSmsClient(failures=100)
+    outbox = NotificationOutbox(db, {'sms': sms_sender(client).send_job}, max_attempts=3, base_delay=0.01)
+    done = []
+    outbox.start()
+    try:
+        job = outbox.enqueue(1, 'sms', '+15551234567', "Shoplifting detected", on_done=lambda job, ok: done.append(ok))
+        assert wait_for(lambda: done)
+        time.sleep(0.05)
+    finally:
+        outbox.stop()
+    assert done == [False]
+    assert len(client.calls) == 3
+    assert client.calls[0] == {'body': "Shoplifting detected", 'from_': '+15550000000', 'to': '+15551234567'}
+    assert statuses(db) == {job.notification_id: 'failed'}
+    assert outbox.pending() == 0
+
+
+def test_pending_notifications_are_delivered_after_a_restart(db, smtp_server):
+    # First run: the SMS fails and waits out a long backoff, the email is held for its
+    # attachment; the process stops before either is delivered
+    down = FakeSmsClient(failures=100)
+    outbox = NotificationOutbox(db, {'email': mailer_for(smtp_server).send_job, 'sms': sms_sender(down).send_job},
+                                base_delay=60)
+    outbox.start()
+    sms = outbox.enqueue(1, 'sms', '+15551234567', "Shoplifting detected")
+    email = outbox.enqueue(1, 'email', 'owner@example.com', "Shoplifting detected", hold=True)
+    assert wait_for(lambda: len(down.calls) == 1)
+    outbox.stop()
+    sent = db.execute("INSERT INTO Notifications (alert_id, type, recipient, status, message) VALUES (?, ?, ?, ?, ?)",
+                      (1, 'sms', '+15557654321', 'sent', "Delivered before the restart"))
+    assert statuses(db) == {sms.notification_id: 'pending', email.notification_id: 'pending', sent: 'sent'}
+
+    client = FakeSmsClient()
+    restarted = NotificationOutbox(db, {'email': mailer_for(smtp_server).send_job, 'sms': sms_sender(client).send_job})
+    restarted.start()
+    try:
+        assert wait_for(lambda: 'pending' not in statuses(db).values())
+    finally:
+        restarted.stop()
+    assert statuses(db) == {sms.notification_id: 'sent', email.notification_id: 'sent', sent: 'sent'}
+    assert [call['to'] for call in client.calls] == ['+15551234567']
+    assert len(smtp_server.messages) == 1
+    assert smtp_server.messages[0]['To'] == 'owner@example.com'
+    assert smtp_server.messages[0]['Subject'] == "Shoplifting Alert"
@@ -0,0 +1,101 @@
+from viewers import ViewerRegistry, preview_room
+
+
+class Rooms:
+    # Stands in for the Socket.IO server's room membership
+    def __init__(self):
+        self.members = {}
+
+    def enter(self, sid, room):
+        self.members.setdefault(room, set()).add(sid)
+
+    def leave(self, sid, room):
+        self.members[room].discard(sid)
+
+    def of(self, sid):
+        return {room for room, sids in self.members.items() if sid in sids}
+
+
+def registry(rooms, **kwargs):
+    return ViewerRegistry(enter_room=rooms.enter, leave_room=rooms.leave, **kwargs)
+
+
+def test_clients_only_join_the_rooms_of_the_streams_they_watch():
+    rooms = Rooms()
+    viewers = registry(rooms)
+    viewers.connect('a')
+    viewers.connect('b', 'thumb')
+    viewers.subscribe('b', ['cam-1'])
+    assert viewers.preview_tiers('default') == ['full']
+    assert viewers.preview_tiers('cam-1') == ['thumb', 'full']
+    assert rooms.of('a') == {preview_room('default', 'full'), preview_room('cam-1', 'full')}
+    assert rooms.of('b') == {preview_room('cam-1', 'thumb')}
+    viewers.subscribe('b', ['default'])
+    assert rooms.of('b') == {preview_room('default', 'thumb')}
+
+
+def test_in_flight_only_counts_frames_of_watched_streams():
+    rooms = Rooms()
+    viewers = registry(rooms, max_in_flight=2)
+    viewers.connect('a')
+    viewers.subscribe('a', ['default'])
+    for sequence in range(1, 4):
+        viewers.preview_tiers('cam-1')
+        viewers.frame_sent('cam-1', sequence, ['full'])
+    viewers.ack('a', 'cam-1', 1)
+    client = viewers.snapshot()['clients']['a']
+    assert client['in_flight'] == {}
+    assert client['ack_latency_ms'] is None
+    assert not client['held']
+
+    viewers.preview_tiers('default')
+    viewers.frame_sent('default', 1, ['full'])
+    viewers.frame_sent('default', 2, ['full'])
+    assert viewers.snapshot()['clients']['a']['held']
+    assert rooms.of('a') == set()
+    viewers.ack('a', 'default', 1)
+    assert rooms.of('a') == {preview_room('default', 'full')}
+
+
+def test_frames_in_flight_are_counted_per_stream():
+    rooms = Rooms()
+    viewers = registry(rooms, max_in_flight=4)
+    viewers.connect('a')
+    streams = ['default', 'cam-1', 'cam-2']
+    for sequence in range(1, 4):
+        for stream_id in streams:
+            assert viewers.preview_tiers(stream_id) == ['full']
+            viewers.frame_sent(stream_id, sequence, ['full'])
+    # Nine frames in flight in all, but no stream has reached the limit
+    client = viewers.snapshot()['clients']['a']
+    assert not client['held']
+    assert client['in_flight'] == {'cam-1': 3, 'cam-2': 3, 'default': 3}
+    assert rooms.of('a') == {preview_room(stream_id, 'full') for stream_id in streams}
+
+    viewers.preview_tiers('cam-1')
+    viewers.frame_sent('cam-1', 4, ['full'])
+    client = viewers.snapshot()['clients']['a']
+    assert client['held_streams'] == ['cam-1']
+    assert rooms.of('a') == {preview_room('default', 'full'), preview_room('cam-2', 'full')}
+    assert viewers.preview_tiers('cam-1') == []
+    assert viewers.preview_tiers('default') == ['full']
+    # Acks of the other streams do not release it
+    viewers.ack('a', 'default', 1)
+    viewers.ack('a', 'cam-2', 1)
+    assert viewers.snapshot()['clients']['a']['held_streams'] == ['cam-1']
+    viewers.ack('a', 'cam-1', 1)
+    viewers.ack('a', 'cam-1', 2)
+    assert not viewers.snapshot()['clients']['a']['held']
+    assert rooms.of('a') == {preview_room(stream_id, 'full') for stream_id in streams}
+
+
+def test_clients_watching_every_stream_join_streams_as_they_start():
+    rooms = Rooms()
+    viewers = registry(rooms)
+    viewers.connect('a', 'sd')
+    assert rooms.of('a') == set()
+    viewers.preview_tiers('cam-2')
+    assert rooms.of('a') == {preview_room('cam-2', 'sd')}
+    viewers.unsubscribe('a')
+    assert rooms.of('a') == set()
+    assert not viewers.has_viewers('cam-2')
@@ -0,0 +1,237 @@
+import threading
+import time
+
+# Preview tiers from cheapest to most expensive; each stream has a Socket.IO room per tier
+TIER_ORDER = ('thumb', 'sd', 'full')
+# Unacknowledged frames of one stream a client may have before it stops receiving that
+# stream (frames it misses are dropped, not queued); it resumes once it has caught up
+# to half of that
+MAX_IN_FLIGHT = 8
+# A held stream whose acks stop arriving entirely is let back in (a tier lower) after this long
+HOLD_TIMEOUT = 2.0
+# Smoothed ack latency above which a client moves down a tier, and below which
+# (with no backlog for UPGRADE_AFTER seconds) it moves up again
+DOWNGRADE_LATENCY = 0.4
+UPGRADE_LATENCY = 0.1
+UPGRADE_AFTER = 10.0
+TIER_COOLDOWN = 3.0
+LATENCY_SMOOTHING = 0.2
+# Send times kept per stream for matching acknowledgements
+SENT_HISTORY = 256
+
+
+def preview_room(stream_id, tier):
+    return f"preview:{stream_id}:{tier}"
+
+
+class Viewer:
+    def __init__(self, sid, max_tier, now):
+        self.sid = sid
+        # None: every stream; a set of stream ids (empty: paused)
+        self.streams = None
+        self.max_tier = max_tier
+        self.tier = max_tier
+        # {stream_id: room} the client is in
+        self.rooms = {}
+        # {stream_id: unacknowledged frames}
+        self.in_flight = {}
+        # {stream_id: time it was held} for the streams the client is behind on
+        self.held_since = {}
+        self.latency = None
+        self.frames_dropped = 0
+        self.last_change = now
+        self.last_backlog = None
+
+    @property
+    def held(self):
+        return bool(self.held_since)
+
+    @property
+    def watching(self):
+        return self.streams is None or bool(self.streams)
+
+    def watches(self, stream_id):
+        return self.streams is None or stream_id in self.streams
+
+    def snapshot(self):
+        return {
+            'tier': self.tier,
+            'max_tier': self.max_tier,
+            'held': self.held,
+            'held_streams': sorted(self.held_since),
+            'streams': sorted(self.rooms),
+            'in_flight': {stream_id: count for stream_id, count in sorted(self.in_flight.items()) if count},
+            'ack_latency_ms': None if self.latency is None else round(self.latency * 1000, 1),
+            'frames_dropped': self.frames_dropped,
+        }
+
+
+class ViewerRegistry:
+    # Tracks which Socket.IO clients watch the live preview and at which tier. A client
+    # watches every stream at its best allowed tier when it connects; it can narrow to
+    # some stream ids, cap its tier, or pause (e.g. while its tab is hidden).
+    #
+    # A watching client sits in the room of its tier for each stream it watches, so every
+    # tier of a stream is encoded once per frame and shared by the clients watching that
+    # stream, and nobody receives the streams they did not ask for. Clients acknowledge the
+    # frames they receive: a client with too many unacknowledged frames of a stream
+    # leaves that stream's room until it catches up (the frames it misses are dropped
+    # rather than queued behind the others), and its smoothed ack latency moves it down
+    # or back up the tiers.
+    def __init__(self, enter_room=None, leave_room=None, max_in_flight=MAX_IN_FLIGHT):
+        # enter_room(sid, room) / leave_room(sid, room) apply membership on the Socket.IO server
+        self.enter_room = enter_room
+        self.leave_room = leave_room
+        self.max_in_flight = max_in_flight
+        self.lock = threading.Lock()
+        self.viewers = {}
+        # Streams that have had preview frames, for placing clients that watch every stream
+        self.stream_ids = set()
+        self.sent = {}
+        self.tier_changes = {'down': 0, 'up': 0}
+
+    def _place(self, viewer):
+        # Puts the client in the rooms it should receive frames from (none for the streams
+        # it is held on, none at all when paused)
+        for stream_id in [stream_id for stream_id in viewer.in_flight if not viewer.watches(stream_id)]:
+            del viewer.in_flight[stream_id]
+            viewer.held_since.pop(stream_id, None)
+        stream_ids = self.stream_ids if viewer.streams is None else viewer.streams
+        wanted = {stream_id: preview_room(stream_id, viewer.tier) for stream_id in stream_ids
+                  if stream_id not in viewer.held_since}
+        for stream_id, room in list(viewer.rooms.items()):
+            if wanted.get(stream_id) != room:
+                if self.leave_room:
+                    self.leave_room(viewer.sid, room)
+                del viewer.rooms[stream_id]
+        for stream_id, room in wanted.items():
+            if stream_id not in viewer.rooms:
+                if self.enter_room:
+                    self.enter_room(viewer.sid, room)
+                viewer.rooms[stream_id] = room
+
+    def connect(self, sid, max_tier=TIER_ORDER[-1]):
+        if max_tier not in TIER_ORDER:
+            max_tier = TIER_ORDER[-1]
+        with self.lock:
+            viewer = self.viewers[sid] = Viewer(sid, max_tier, time.monotonic())
+            self._place(viewer)
+
+    def disconnect(self, sid):
+        with self.lock:
+            self.viewers.pop(sid, None)
+
+    def subscribe(self, sid, stream_ids=None, max_tier=None):
+        with self.lock:
+            viewer = self.viewers.get(sid)
+            if viewer is None:
+                return
+            viewer.streams = None if stream_ids is None else set(stream_ids)
+            if max_tier in TIER_ORDER:
+                viewer.max_tier = max_tier
+                if TIER_ORDER.index(viewer.tier) > TIER_ORDER.index(max_tier):
+                    viewer.tier = max_tier
+            self._place(viewer)
+
+    def unsubscribe(self, sid):
+        with self.lock:
+            viewer = self.viewers.get(sid)
+            if viewer is not None:
+                viewer.streams = set()
+                self._place(viewer)
+
+    def preview_tiers(self, stream_id):
+        # Tiers to encode for this stream's next frame. Called once per frame, so clients
+        # that are held back have the frame counted as dropped here.
+        tiers = set()
+        now = time.monotonic()
+        with self.lock:
+            if stream_id not in self.stream_ids:
+                self.stream_ids.add(stream_id)
+                for viewer in self.viewers.values():
+                    if viewer.streams is None:
+                        self._place(viewer)
+            for viewer in self.viewers.values():
+                if not viewer.watches(stream_id):
+                    continue
+                held_since = viewer.held_since.get(stream_id)
+                if held_since is not None and now - held_since > HOLD_TIMEOUT:
+                    del viewer.held_since[stream_id]
+                    viewer.in_flight[stream_id] = 0
+                    self._adapt(viewer, now)
+                    self._place(viewer)
+                if stream_id in viewer.held_since:
+                    viewer.frames_dropped += 1
+                elif viewer.watching:
+                    tiers.add(viewer.tier)
+        return [tier for tier in TIER_ORDER if tier in tiers]
+
+    def has_viewers(self, stream_id):
+        with self.lock:
+            return any(viewer.watches(stream_id) for viewer in self.viewers.values())
+
+    def frame_sent(self, stream_id, sequence, tiers):
+        now = time.monotonic()
+        rooms = {preview_room(stream_id, tier) for tier in tiers}
+        with self.lock:
+            sent = self.sent.setdefault(stream_id, {})
+            sent[sequence] = now
+            if len(sent) > SENT_HISTORY:
+                del sent[next(iter(sent))]
+            for viewer in self.viewers.values():
+                if viewer.rooms.get(stream_id) in rooms:
+                    in_flight = viewer.in_flight[stream_id] = viewer.in_flight.get(stream_id, 0) + 1
+                    if in_flight >= self.max_in_flight:
+                        viewer.held_since[stream_id] = viewer.last_backlog = now
+                        self._place(viewer)
+
+    def ack(self, sid, stream_id, sequence):
+        now = time.monotonic()
+        with self.lock:
+            viewer = self.viewers.get(sid)
+            if viewer is None or not viewer.watches(stream_id):
+                return
+            in_flight = viewer.in_flight[stream_id] = max(0, viewer.in_flight.get(stream_id, 0) - 1)
+            sent_at = self.sent.get(stream_id, {}).get(sequence)
+            if sent_at is not None:
+                latency = now - sent_at
+                viewer.latency = latency if viewer.latency is None else (
+                    viewer.latency + LATENCY_SMOOTHING * (latency - viewer.latency))
+            if stream_id in viewer.held_since and in_flight <= self.max_in_flight // 2:
+                del viewer.held_since[stream_id]
+            self._adapt(viewer, now)
+            self._place(viewer)
+
+    def _adapt(self, viewer, now):
+        if now - viewer.last_change < TIER_COOLDOWN:
+            return
+        index = TIER_ORDER.index(viewer.tier)
+        backlogged = viewer.last_backlog is not None and viewer.last_backlog > viewer.last_change
+        slow = viewer.latency is not None and viewer.latency > DOWNGRADE_LATENCY
+        fast = viewer.latency is not None and viewer.latency < UPGRADE_LATENCY
+        if (slow or backlogged) and index > 0:
+            viewer.tier = TIER_ORDER[index - 1]
+            self.tier_changes['down'] += 1
+        elif (fast and not backlogged and now - viewer.last_change >= UPGRADE_AFTER
+              and index < TIER_ORDER.index(viewer.max_tier)):
+            viewer.tier = TIER_ORDER[index + 1]
+            self.tier_changes['up'] += 1
+        else:
+            return
+        viewer.last_change = now
+
+    def snapshot(self):
+        with self.lock:
+            tiers = {tier: 0 for tier in TIER_ORDER}
+            for viewer in self.viewers.values():
+                if viewer.watching:
+                    tiers[viewer.tier] += 1
+            return {
+                'connected': len(self.viewers),
+                'watching': sum(tiers.values()),
+                'tiers': tiers,
+                'held': sum(1 for viewer in self.viewers.values() if viewer.held),
+                'frames_dropped': sum(viewer.frames_dropped for viewer in self.viewers.values()),
+                'tier_changes': dict(self.tier_changes),
+                'clients': {viewer.sid: viewer.snapshot() for viewer in self.viewers.values()},
+            }
@@ -3,7 +3,7 @@ import React from 'react';
 import { useApp } from '../context/AppContext';
 import { useTheme } from '../context/ThemeContext';
 import { useAuth } from '../context/AuthContext';
-import { Camera, Bell, Settings, Moon, Sun, LogOut, User } from 'lucide-react';
+import { Camera, Bell, Settings, Moon, Sun, LogOut, User, Loader2 } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Toggle } from '@/components/ui/toggle';
 import {
@@ -16,7 +16,7 @@ import {
 } from "@/components/ui/dropdown-menu";
 
 const Header = ({ onOpenSettings }: { onOpenSettings: () => void }) => {
-  const { status } = useApp();
+  const { status, serverState, serverError } = useApp();
   const { theme, toggleTheme } = useTheme();
   const { user, logout } = useAuth();
   
@@ -43,6 +43,23 @@ const Header = ({ onOpenSettings }: { onOpenSettings: () => void }) => {
           </span>
         </div>
         
+        {/* Model readiness: the dashboard is usable before detection is */}
+        {serverState !== 'ready' && (
+          <span
+            className={`status-badge ${serverState === 'failed' ? 'offline' : 'loading'}`}
+            title={serverError ?? undefined}
+          >
+            {serverState === 'failed' ? (
+              'Model failed to load'
+            ) : (
+              <span className="flex items-center space-x-1">
+                <Loader2 className="h-3 w-3 animate-spin" />
+                <span>{serverState === 'warming_up' ? 'Warming up model' : 'Loading model'}</span>
+              </span>
+            )}
+          </span>
+        )}
+
         {/* Theme Toggle */}
         <Toggle 
           pressed={theme === 'dark'} 
@@ -3,9 +3,16 @@ import { useApp } from '@/context/AppContext';
 import { toast } from "@/components/ui/use-toast";
 import { Button } from '@/components/ui/button';
 import { Camera, UploadCloud, Play, Fullscreen, PictureInPicture, ArrowDown, X, Maximize } from 'lucide-react';
-import socketService from '@/services/socketService';
+import socketService, { parseBinaryFrame } from '@/services/socketService';
 import axios from 'axios';
 
+// Stream driven by set_source (webcam/upload); other cameras run their own capture workers
+const DASHBOARD_STREAM_ID = 'default';
+const DASHBOARD_CAMERA_ID = -1; // camera_id of the dashboard stream in binary frame headers
+
+// Decodes can finish out of order; a large backwards jump means the backend restarted the sequence
+const isNewerFrame = (sequence: number, last: number) => sequence > last || last - sequence >= 1000;
+
 const VideoDisplay = () => {
   const {
     videoSource,
@@ -23,6 +30,7 @@ const VideoDisplay = () => {
   const [isVideoLoading, setIsVideoLoading] = useState(true);
   const [isTransitioning, setIsTransitioning] = useState(false);
   const [showSourceSelector, setShowSourceSelector] = useState(false);
+  const lastFrameSequenceRef = useRef(0);
 
   useEffect(() => {
     if (!videoSource) {
@@ -31,8 +39,14 @@ const VideoDisplay = () => {
     }
 
     socketService.connect();
-
-    socketService.on('frame', ({ image }) => {
+    // Only the dashboard stream's preview frames are sent to this client
+    socketService.watchPreview([DASHBOARD_STREAM_ID]);
+
+    socketService.on('frame', ({ image, stream_id, sequence }) => {
+      // Every received frame is acknowledged; the server picks this client's preview tier from the acks
+      if (sequence !== undefined) socketService.emit('preview_ack', { stream_id, sequence });
+      // Frames sent before the subscription reached the server
+      if (stream_id && stream_id !== DASHBOARD_STREAM_ID) return;
       const img = new Image();
       img.src = `data:image/jpeg;base64,${image}`;
       img.onload = () => {
@@ -54,6 +68,34 @@ const VideoDisplay = () => {
       };
     });
 
+    socketService.on<ArrayBuffer>('frame_bin', (data) => {
+      const frame = parseBinaryFrame(data);
+      if (frame) socketService.emit('preview_ack', { camera_id: frame.cameraId, sequence: frame.sequence });
+      // Frames sent before the subscription reached the server
+      if (!frame || frame.cameraId !== DASHBOARD_CAMERA_ID) return;
+      if (!isNewerFrame(frame.sequence, lastFrameSequenceRef.current)) return;
+      createImageBitmap(new Blob([frame.jpeg], { type: 'image/jpeg' }))
+        .then((bitmap) => {
+          const ctx = canvasRef.current?.getContext('2d');
+          if (ctx && canvasRef.current && isNewerFrame(frame.sequence, lastFrameSequenceRef.current)) {
+            lastFrameSequenceRef.current = frame.sequence;
+            if (canvasRef.current.width !== bitmap.width) canvasRef.current.width = bitmap.width;
+            if (canvasRef.current.height !== bitmap.height) canvasRef.current.height = bitmap.height;
+            ctx.drawImage(bitmap, 0, 0);
+            setIsVideoLoading(false);
+            setIsTransitioning(false);
+          }
+          bitmap.close();
+        })
+        .catch(() => {
+          toast({
+            title: "Stream Error",
+            description: "Failed to decode video frame.",
+            variant: "destructive",
+          });
+        });
+    });
+
     socketService.on('snapshot', async ({ file_path }) => {
       const snapshotUrl = `http://localhost:5000${file_path}`;
       try {
@@ -12,6 +12,14 @@ interface NotificationStatusEvent {
   cooldown_seconds: number;
 }
 
+export type ServerState = 'starting' | 'loading_model' | 'warming_up' | 'ready' | 'failed';
+
+interface ServerStatusEvent {
+  state: ServerState;
+  ready: boolean;
+  error: string | null;
+}
+
 interface AlertEvent {
   message: string;
   confidence: number;
@@ -77,6 +85,8 @@ interface AppContextType {
   snapshotDataUrl: string | null;
   setSnapshotDataUrl: (url: string | null) => void;
   status: 'offline' | 'online' | 'alert';
+  serverState: ServerState;
+  serverError: string | null;
 }
 
 const AppContext = createContext<AppContextType | undefined>(undefined);
@@ -94,6 +104,8 @@ export const AppProvider = ({ children }: { children: ReactNode }) => {
   const [alerts, setAlerts] = useState<Alert[]>([]);
   const [snapshotDataUrl, setSnapshotDataUrl] = useState<string | null>(null);
   const [status, setStatus] = useState<'offline' | 'online' | 'alert'>('offline');
+  const [serverState, setServerState] = useState<ServerState>('starting');
+  const [serverError, setServerError] = useState<string | null>(null);
 
   // Helper function to determine AlertType based on confidence
   const getAlertType = (confidence: number): AlertType => {
@@ -106,13 +118,20 @@ export const AppProvider = ({ children }: { children: ReactNode }) => {
   useEffect(() => {
     socketService.connect();
 
-    socketService.on<NotificationStatusEvent>('notification_status', (data) => {
-      setEmailNotificationsEnabled(data.email_enabled);
-      setSMSNotificationsEnabled(data.sms_enabled);
-      setClipCaptureEnabled(data.clip_capture_enabled);
-      setClipLength(data.clip_duration_seconds);
-      setAlertLoggingPaused(!data.logging_enabled);
-      setCooldownSeconds(data.cooldown_seconds);
+    // The model loads after the server starts; detection is unavailable until 'ready'
+    socketService.on<ServerStatusEvent>('server_status', ({ state, error }) => {
+      setServerState(state);
+      setServerError(error);
+    });
+
+    // Full status on connect, then only the fields that changed
+    socketService.on<Partial<NotificationStatusEvent>>('notification_status', (data) => {
+      if (data.email_enabled !== undefined) setEmailNotificationsEnabled(data.email_enabled);
+      if (data.sms_enabled !== undefined) setSMSNotificationsEnabled(data.sms_enabled);
+      if (data.clip_capture_enabled !== undefined) setClipCaptureEnabled(data.clip_capture_enabled);
+      if (data.clip_duration_seconds !== undefined) setClipLength(data.clip_duration_seconds);
+      if (data.logging_enabled !== undefined) setAlertLoggingPaused(!data.logging_enabled);
+      if (data.cooldown_seconds !== undefined) setCooldownSeconds(data.cooldown_seconds);
     });
 
     socketService.on<AlertEvent>('alert', ({ message, confidence, source, camera_id }) => {
@@ -304,6 +323,8 @@ export const AppProvider = ({ children }: { children: ReactNode }) => {
         snapshotDataUrl,
         setSnapshotDataUrl,
         status,
+        serverState,
+        serverError,
       }}
     >
       {children}
@@ -5,8 +5,39 @@ const SOCKET_URL = import.meta.env.DEV ? 'http://localhost:5000' : ''; // Relati
 // Define event payload interfaces
 interface FrameEvent {
   image: string; // Base64-encoded JPEG
+  stream_id?: string; // 'default' for the webcam/upload feed, 'camera-<id>' for Cameras rows
+  camera_id?: number | null;
+}
+
+// Binary 'frame_bin' payload: 18-byte little-endian header followed by the JPEG bytes
+// version u8, flags u8 (bit 0: detection overlay), sequence u32, camera_id i32 (-1: dashboard stream), capture time f64
+const FRAME_HEADER_SIZE = 18;
+const FRAME_FLAG_OVERLAY = 0x01;
+
+export interface BinaryFrame {
+  version: number;
+  overlay: boolean;
+  sequence: number;
+  cameraId: number;
+  timestamp: number; // Capture time, seconds since epoch
+  jpeg: Uint8Array;
 }
 
+export const parseBinaryFrame = (data: ArrayBuffer | Uint8Array): BinaryFrame | null => {
+  const bytes = data instanceof Uint8Array ? data : new Uint8Array(data);
+  if (bytes.byteLength <= FRAME_HEADER_SIZE) return null;
+  const view = new DataView(bytes.buffer, bytes.byteOffset, FRAME_HEADER_SIZE);
+  const flags = view.getUint8(1);
+  return {
+    version: view.getUint8(0),
+    overlay: (flags & FRAME_FLAG_OVERLAY) !== 0,
+    sequence: view.getUint32(2, true),
+    cameraId: view.getInt32(6, true),
+    timestamp: view.getFloat64(10, true),
+    jpeg: bytes.subarray(FRAME_HEADER_SIZE),
+  };
+};
+
 interface SnapshotEvent {
   file_path: string; // Path to saved snapshot (e.g., "Uploads/snapshot_xxx.jpg")
 }
@@ -25,6 +56,7 @@ export interface AlertEvent {
   confidence: number;
   source: 'webcam' | 'upload';
   camera_id?: number | null;
+  stream_id?: string;
 }
 
 interface AlertLogEntry {
@@ -84,11 +116,29 @@ interface SocketService {
   on: <T>(event: string, callback: (data: T) => void) => void;
   off: <T>(event: string, callback: (data: T) => void) => void;
   emit: <T>(event: string, data?: T) => void;
+  previewStreamIds: string[] | null;
+  watchPreview: (streamIds: string[] | null) => void;
+}
+
+// The server skips encoding and sending preview frames nobody is watching, and only sends
+// each client the streams it subscribed to (every stream until it subscribes)
+function sendPreviewSubscription() {
+  if (!socketService.socket || !socketService.isConnected) return;
+  if (document.hidden) {
+    socketService.socket.emit('preview_unsubscribe');
+  } else {
+    socketService.socket.emit('preview_subscribe', socketService.previewStreamIds ? { stream_ids: socketService.previewStreamIds } : {});
+  }
+}
+
+function handleVisibilityChange() {
+  sendPreviewSubscription();
 }
 
 const socketService: SocketService = {
   socket: null,
   isConnected: false,
+  previewStreamIds: null,
 
   connect() {
     if (!this.socket) {
@@ -104,8 +154,15 @@ const socketService: SocketService = {
       this.socket.on('connect', () => {
         this.isConnected = true;
         console.log('Socket.IO connected to Flask backend');
+        // The server subscribes every new connection to every stream; narrow that to the
+        // streams shown here, or pause while the tab is hidden
+        if (document.hidden || this.previewStreamIds) {
+          sendPreviewSubscription();
+        }
       });
 
+      document.addEventListener('visibilitychange', handleVisibilityChange);
+
       this.socket.on('connect_error', (error) => {
         console.error('Socket.IO connection error:', error);
         this.isConnected = false;
@@ -121,6 +178,7 @@ const socketService: SocketService = {
   },
 
   disconnect() {
+    document.removeEventListener('visibilitychange', handleVisibilityChange);
     if (this.socket) {
       this.socket.disconnect();
       this.socket = null;
@@ -151,6 +209,12 @@ const socketService: SocketService = {
       console.warn(`Cannot emit event "${event}": Socket not connected`);
     }
   },
+
+  // Stream ids whose preview frames this client wants (null: all); kept across reconnects
+  watchPreview(streamIds: string[] | null) {
+    this.previewStreamIds = streamIds;
+    sendPreviewSubscription();
+  },
 };
 
 export default socketService;
\ No newline at end of file